@@ -1,17 +1,68 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify
+from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify, Response, stream_with_context, g, has_request_context
+from flask.signals import before_render_template, template_rendered
+import click
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.orm import joinedload
 from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy import inspect, select, insert, update, delete, func, case, text, literal, union_all, event, and_, or_
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.schema import CreateTable
+from sqlalchemy.dialects import sqlite as sqlite_dialect, postgresql as postgresql_dialect
 from datetime import datetime, timedelta
+import threading
+import csv
+import io
+import json
+import itertools
+import re
+import math
+import heapq
+import time
+import functools
+import queue
+import bisect
+from collections import OrderedDict, Counter
+import sqlite3
 import pytz
 import os
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'your-secret-key-here'
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///parking.db'
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///parking.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
+# Connection pool settings for server databases (SQLite uses SQLAlchemy's defaults)
+if not app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'):
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', '5')),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', '10')),
+        'pool_timeout': int(os.environ.get('DB_POOL_TIMEOUT', '30')),
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', '1800')),
+        'pool_pre_ping': os.environ.get('DB_POOL_PRE_PING', '1') == '1'
+    }
+
+# SQLite pragmas applied to every new connection
+app.config['SQLITE_PRAGMAS'] = {
+    'journal_mode': os.environ.get('SQLITE_JOURNAL_MODE', 'WAL'),
+    'synchronous': os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL'),
+    'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', '5000')),
+    'mmap_size': int(os.environ.get('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024))),
+    'cache_size': int(os.environ.get('SQLITE_CACHE_SIZE', '-64000'))  # negative values are KiB
+}
+
 db = SQLAlchemy(app)
 
+@event.listens_for(Engine, 'connect')
+def apply_sqlite_pragmas(dbapi_connection, connection_record):
+    """Tune SQLite connections for concurrent readers and a single writer"""
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    for pragma, value in app.config['SQLITE_PRAGMAS'].items():
+        cursor.execute(f'PRAGMA {pragma}={value}')
+    cursor.close()
+
 # Set timezone for Indian Standard Time
 indian_timezone = pytz.timezone('Asia/Kolkata')
 
@@ -37,16 +88,38 @@ class ParkingLot(db.Model):
     address = db.Column(db.String(200), nullable=False)
     pin_code = db.Column(db.String(10), nullable=False)
     total_spots = db.Column(db.Integer, nullable=False)
+    latitude = db.Column(db.Float, nullable=True)
+    longitude = db.Column(db.Float, nullable=True)
+    # Optional tariff rules; when unset every hour is charged at hourly_rate
+    first_hour_rate = db.Column(db.Float, nullable=True)
+    daily_cap = db.Column(db.Float, nullable=True)
+    night_rate = db.Column(db.Float, nullable=True)
+    night_start_hour = db.Column(db.Integer, nullable=True)
+    night_end_hour = db.Column(db.Integer, nullable=True)
+    grace_minutes = db.Column(db.Integer, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Set instead of deleting a lot whose spots reservations refer to; retired lots are hidden everywhere but history
+    retired_at = db.Column(db.DateTime, nullable=True)
     spots = db.relationship('ParkingSpot', backref='parking_lot', lazy=True, cascade='all, delete-orphan')
+    
+    __table_args__ = (
+        db.Index('ix_parking_lot_pin_code', 'pin_code'),
+    )
 
 class ParkingSpot(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     lot_id = db.Column(db.Integer, db.ForeignKey('parking_lot.id'), nullable=False)
     spot_number = db.Column(db.Integer, nullable=False)
-    status = db.Column(db.String(1), default='A')  # A-Available, O-Occupied
+    status = db.Column(db.String(1), default='A')  # A-Available, O-Occupied, R-Retired (kept for reservation history)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     reservations = db.relationship('Reservation', backref='parking_spot', lazy=True)
+    
+    __table_args__ = (
+        db.Index('ix_parking_spot_lot_status', 'lot_id', 'status'),
+        db.Index('ix_parking_spot_lot_number', 'lot_id', 'spot_number'),
+        # Reservation history refers to spots by id, so a deleted spot's id must never be handed out again
+        {'sqlite_autoincrement': True},
+    )
 
 class Reservation(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -57,6 +130,68 @@ class Reservation(db.Model):
     total_cost = db.Column(db.Float, default=0.0)
     status = db.Column(db.String(20), default='active')  # active, completed, cancelled
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_reservation_user_status', 'user_id', 'status'),
+        db.Index('ix_reservation_spot_status', 'spot_id', 'status'),
+        db.Index('ix_reservation_user_history', 'user_id', 'status', 'exit_time', 'id'),
+        db.Index('ix_reservation_status_exit', 'status', 'exit_time'),
+        db.Index('ix_reservation_entry', 'entry_time', 'id'),
+        # Archived reservations keep their ids, so an id must never be handed out again once its row has moved
+        {'sqlite_autoincrement': True},
+    )
+
+class ReservationArchive(db.Model):
+    """Completed reservations moved out of the reservation table; ids are kept from the original rows"""
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    spot_id = db.Column(db.Integer, db.ForeignKey('parking_spot.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    entry_time = db.Column(db.DateTime, nullable=False)
+    exit_time = db.Column(db.DateTime, nullable=True)
+    total_cost = db.Column(db.Float, default=0.0)
+    status = db.Column(db.String(20), default='completed')
+    created_at = db.Column(db.DateTime)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+    parking_spot = db.relationship('ParkingSpot')
+    
+    __table_args__ = (
+        db.Index('ix_reservation_archive_user_history', 'user_id', 'status', 'exit_time', 'id'),
+        db.Index('ix_reservation_archive_entry_id', 'entry_time', 'id'),
+        db.Index('ix_reservation_archive_spot', 'spot_id'),
+    )
+
+class AdvanceBooking(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    spot_id = db.Column(db.Integer, db.ForeignKey('parking_spot.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    start_time = db.Column(db.DateTime, nullable=False)
+    end_time = db.Column(db.DateTime, nullable=False)
+    status = db.Column(db.String(20), default='scheduled')  # scheduled, checked_in, cancelled
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    parking_spot = db.relationship('ParkingSpot')
+    
+    __table_args__ = (
+        db.Index('ix_advance_booking_spot_window', 'spot_id', 'status', 'end_time'),
+        db.Index('ix_advance_booking_user_window', 'user_id', 'status', 'end_time'),
+    )
+
+class OccupancyRollup(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    lot_id = db.Column(db.Integer, db.ForeignKey('parking_lot.id', ondelete='CASCADE'), nullable=False)
+    granularity = db.Column(db.String(5), nullable=False)  # hour, day
+    bucket_start = db.Column(db.DateTime, nullable=False)
+    peak_occupancy = db.Column(db.Integer, nullable=False, default=0)
+    bookings = db.Column(db.Integer, nullable=False, default=0)
+    completed_stays = db.Column(db.Integer, nullable=False, default=0)
+    total_stay_seconds = db.Column(db.Float, nullable=False, default=0.0)
+    revenue = db.Column(db.Float, nullable=False, default=0.0)
+    # Occupancy after the bucket's last event; it carries through the following buckets without events
+    closing_occupancy = db.Column(db.Integer, nullable=True, default=0)
+    
+    __table_args__ = (
+        db.UniqueConstraint('granularity', 'lot_id', 'bucket_start', name='uq_occupancy_rollup_bucket'),
+        db.Index('ix_occupancy_rollup_bucket', 'granularity', 'bucket_start'),
+    )
 
 # Function to calculate parking duration
 def calculate_parking_duration(start_time, end_time=None):
@@ -85,8 +220,1674 @@ def calculate_parking_duration(start_time, end_time=None):
         'total_hours': total_seconds / 3600
     }
 
+# Tariff engine
+DEFAULT_NIGHT_START_HOUR = 22
+DEFAULT_NIGHT_END_HOUR = 6
+TARIFF_FIELDS = ('first_hour_rate', 'daily_cap', 'night_rate', 'night_start_hour', 'night_end_hour', 'grace_minutes')
+
+def to_local_naive(timestamp):
+    """Express a timestamp as naive Indian time (naive values are assumed to be Indian time already)"""
+    if timestamp.tzinfo is None:
+        return timestamp
+    return timestamp.astimezone(indian_timezone).replace(tzinfo=None)
+
+def parse_tariff(values):
+    """Read the optional tariff fields of a lot form or CSV row; empty fields stay unset"""
+    tariff = {}
+    for field in TARIFF_FIELDS:
+        value = (values.get(field) or '').strip()
+        if not value:
+            tariff[field] = None
+        elif field.endswith('_rate') or field == 'daily_cap':
+            tariff[field] = float(value)
+            if tariff[field] < 0:
+                raise ValueError(f'{field} cannot be negative')
+        else:
+            tariff[field] = int(value)
+    for field in ('night_start_hour', 'night_end_hour'):
+        if tariff[field] is not None and not 0 <= tariff[field] <= 23:
+            raise ValueError(f'{field} must be between 0 and 23')
+    if tariff['grace_minutes'] is not None and tariff['grace_minutes'] < 0:
+        raise ValueError('grace_minutes cannot be negative')
+    return tariff
+
+class Tariff:
+    """Pricing rules of one parking lot.
+
+    A stay is priced per started 24 hour period from entry: time inside the
+    night window is charged at night_rate, the first hour of the stay at
+    first_hour_rate, everything else at hourly_rate, and each period is
+    capped at daily_cap. Stays no longer than grace_minutes are free.
+    """
+
+    def __init__(self, hourly_rate, first_hour_rate=None, daily_cap=None, night_rate=None,
+                 night_start_hour=None, night_end_hour=None, grace_minutes=None):
+        self.hourly_rate = hourly_rate
+        self.first_hour_rate = first_hour_rate
+        self.daily_cap = daily_cap
+        self.night_rate = night_rate
+        self.night_start_hour = DEFAULT_NIGHT_START_HOUR if night_start_hour is None else night_start_hour
+        self.night_end_hour = DEFAULT_NIGHT_END_HOUR if night_end_hour is None else night_end_hour
+        self.grace_seconds = (grace_minutes or 0) * 60
+        self.is_flat = first_hour_rate is None and daily_cap is None and night_rate is None
+
+    @classmethod
+    def for_lot(cls, lot):
+        return cls(lot.hourly_rate, **{field: getattr(lot, field) for field in TARIFF_FIELDS})
+
+    def _night_seconds(self, start, end):
+        """Seconds of [start, end) that fall inside the nightly window"""
+        night_length = timedelta(hours=(self.night_end_hour - self.night_start_hour) % 24 or 24)
+        window_start = datetime.combine(start.date() - timedelta(days=1), datetime.min.time()) \
+            + timedelta(hours=self.night_start_hour)
+        overlap = 0.0
+        while window_start < end:
+            window_end = window_start + night_length
+            if window_end > start:
+                overlap += (min(end, window_end) - max(start, window_start)).total_seconds()
+            window_start += timedelta(days=1)
+        return overlap
+
+    def _segment_cost(self, start, end, hourly_rate):
+        """Cost of [start, end) at the given day rate, applying the night rate where it falls"""
+        total_seconds = (end - start).total_seconds()
+        if total_seconds <= 0:
+            return 0.0
+        night_seconds = self._night_seconds(start, end) if self.night_rate is not None else 0.0
+        return ((total_seconds - night_seconds) * hourly_rate + night_seconds * (self.night_rate or 0)) / 3600
+
+    def price(self, entry_time, exit_time):
+        """Price one stay given naive local entry and exit times"""
+        total_seconds = (exit_time - entry_time).total_seconds()
+        if total_seconds <= self.grace_seconds:
+            return 0.0
+        if self.is_flat:
+            return total_seconds / 3600 * self.hourly_rate
+        
+        cost = 0.0
+        period_start = entry_time
+        while period_start < exit_time:
+            period_end = min(period_start + timedelta(days=1), exit_time)
+            if period_start == entry_time and self.first_hour_rate is not None:
+                first_hour_end = min(entry_time + timedelta(hours=1), period_end)
+                period_cost = (first_hour_end - entry_time).total_seconds() / 3600 * self.first_hour_rate \
+                    + self._segment_cost(first_hour_end, period_end, self.hourly_rate)
+            else:
+                period_cost = self._segment_cost(period_start, period_end, self.hourly_rate)
+            if self.daily_cap is not None:
+                period_cost = min(period_cost, self.daily_cap)
+            cost += period_cost
+            period_start = period_end
+        return cost
+
+def price_stays(stays, tariffs=None):
+    """Price many (entry_time, exit_time, lot_id) stays, one Tariff.price call each.
+
+    What a batch saves is the lot lookups: the tariffs of every lot in it
+    are loaded with one query, so this is the path for large batches such
+    as exports. Pass the same tariffs dict to successive calls to load each
+    lot's tariff only once across batches.
+    """
+    stays = list(stays)
+    if tariffs is None:
+        tariffs = {}
+    missing_lot_ids = {lot_id for _, _, lot_id in stays} - tariffs.keys()
+    if missing_lot_ids:
+        tariffs.update((lot.id, Tariff.for_lot(lot)) for lot in ParkingLot.query.filter(ParkingLot.id.in_(missing_lot_ids)))
+    return [
+        tariffs[lot_id].price(to_local_naive(entry_time), to_local_naive(exit_time))
+        for entry_time, exit_time, lot_id in stays
+    ]
+
+def active_parking_lots():
+    """Query for the lots that have not been retired"""
+    return ParkingLot.query.filter(ParkingLot.retired_at.is_(None))
+
+# Bulk spot provisioning
+def add_parking_spots(lot_id, count):
+    """Put count more spots of a lot in service.
+
+    Retired spots are brought back first, lowest number first; the rest are
+    appended after the highest number with a single multi-row insert.
+    """
+    if count <= 0:
+        return
+    retired_spot_ids = [spot_id for (spot_id,) in db.session.query(ParkingSpot.id)
+                        .filter_by(lot_id=lot_id, status='R').order_by(ParkingSpot.spot_number).limit(count)]
+    if retired_spot_ids:
+        db.session.execute(
+            update(ParkingSpot).where(ParkingSpot.id.in_(retired_spot_ids)).values(status='A')
+            .execution_options(synchronize_session=False)
+        )
+        count -= len(retired_spot_ids)
+    if count <= 0:
+        return
+    highest_spot_number = db.session.query(func.max(ParkingSpot.spot_number)).filter_by(lot_id=lot_id).scalar() or 0
+    db.session.execute(insert(ParkingSpot), [
+        {'lot_id': lot_id, 'spot_number': spot_number, 'status': 'A'}
+        for spot_number in range(highest_spot_number + 1, highest_spot_number + count + 1)
+    ])
+
+def spot_ids_with_history(spot_ids):
+    """The spots among spot_ids that a reservation, archived reservation or advance booking refers to"""
+    return {
+        spot_id
+        for model in (Reservation, ReservationArchive, AdvanceBooking)
+        for (spot_id,) in db.session.query(model.spot_id).filter(model.spot_id.in_(spot_ids)).distinct()
+    }
+
+def remove_parking_spots(lot_id, keep_count):
+    """Take every spot of a lot out of service except the keep_count lowest numbered ones.
+
+    Spots that reservations or advance bookings refer to are retired rather
+    than deleted, since the database does not enforce the foreign keys that
+    refer to them; the others are deleted. Raises ValueError if one of the
+    spots has an advance booking that has not ended yet.
+    """
+    removed_spot_ids = [spot_id for (spot_id,) in db.session.query(ParkingSpot.id)
+                        .filter(ParkingSpot.lot_id == lot_id, ParkingSpot.status != 'R')
+                        .order_by(ParkingSpot.spot_number).offset(keep_count)]
+    if not removed_spot_ids:
+        return
+    now = to_local_naive(datetime.now(indian_timezone))
+    if db.session.query(AdvanceBooking.id).filter(
+        AdvanceBooking.spot_id.in_(removed_spot_ids),
+        AdvanceBooking.status == 'scheduled',
+        AdvanceBooking.end_time > now
+    ).first():
+        raise ValueError('the spots that would be removed have upcoming advance bookings')
+    retired_spot_ids = spot_ids_with_history(removed_spot_ids)
+    if retired_spot_ids:
+        db.session.execute(
+            update(ParkingSpot).where(ParkingSpot.id.in_(retired_spot_ids)).values(status='R')
+            .execution_options(synchronize_session=False)
+        )
+    deleted_spot_ids = [spot_id for spot_id in removed_spot_ids if spot_id not in retired_spot_ids]
+    if deleted_spot_ids:
+        db.session.execute(
+            delete(ParkingSpot).where(ParkingSpot.id.in_(deleted_spot_ids))
+            .execution_options(synchronize_session=False)
+        )
+
+# Schema upgrades
+def add_missing_columns():
+    """Add model columns that an older database does not have yet (nullable columns only)"""
+    inspector = inspect(db.engine)
+    with db.engine.begin() as connection:
+        for table in db.metadata.sorted_tables:
+            existing_columns = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing_columns and column.nullable:
+                    column_type = column.type.compile(dialect=db.engine.dialect)
+                    connection.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+
+# Indexes created by earlier versions that no query uses any more
+OBSOLETE_INDEXES = [
+    # Active reservations by spot are served by ix_reservation_spot_status; the
+    # partial index was never chosen because the status is a bound parameter
+    'ix_reservation_active_spot',
+    # Replaced by ix_reservation_archive_entry_id, which also covers the export's (entry_time, id) order
+    'ix_reservation_archive_entry',
+]
+
+def drop_obsolete_indexes():
+    with db.engine.begin() as connection:
+        for index_name in OBSOLETE_INDEXES:
+            connection.execute(text(f'DROP INDEX IF EXISTS {index_name}'))
+
+def enable_sqlite_autoincrement():
+    """Rebuild SQLite tables created before their ids were declared AUTOINCREMENT.
+
+    SQLite cannot change a primary key in place, so the table is copied into a
+    new one and renamed; upgrade_database recreates its indexes afterwards.
+    """
+    if db.engine.dialect.name != 'sqlite':
+        return
+    with db.engine.begin() as connection:
+        for table in db.metadata.sorted_tables:
+            if not table.dialect_options['sqlite']['autoincrement']:
+                continue
+            table_sql = connection.execute(
+                text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"), {'name': table.name}
+            ).scalar()
+            if table_sql is None or 'AUTOINCREMENT' in table_sql.upper():
+                continue
+            rebuilt_name = f'{table.name}_rebuild'
+            create_sql = str(CreateTable(table).compile(dialect=db.engine.dialect))
+            connection.execute(text(create_sql.replace(f'CREATE TABLE {table.name} ', f'CREATE TABLE {rebuilt_name} ', 1)))
+            column_names = ', '.join(column.name for column in table.columns)
+            connection.execute(text(f'INSERT INTO {rebuilt_name} ({column_names}) SELECT {column_names} FROM {table.name}'))
+            connection.execute(text(f'DROP TABLE {table.name}'))
+            connection.execute(text(f'ALTER TABLE {rebuilt_name} RENAME TO {table.name}'))
+
+def upgrade_database():
+    """Create missing tables, columns and indexes on an existing database"""
+    db.create_all()
+    add_missing_columns()
+    enable_sqlite_autoincrement()
+    drop_obsolete_indexes()
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=db.engine, checkfirst=True)
+    create_search_index()
+
+@app.cli.command('create-indexes')
+def create_indexes_command():
+    """Create the query indexes on an existing parking database"""
+    upgrade_database()
+    print('Database indexes are up to date.')
+
+@app.cli.command('import-lots')
+@click.argument('csv_file', type=click.File('r'))
+def import_lots_command(csv_file):
+    """Create parking lots from a CSV file in a single transaction.
+
+    The file needs a header row with the columns location_name, hourly_rate,
+    address, pin_code and total_spots, and may add latitude, longitude and
+    the optional tariff columns (first_hour_rate, daily_cap, night_rate,
+    night_start_hour, night_end_hour, grace_minutes).
+    """
+    try:
+        created_lots = 0
+        for row_number, row in enumerate(csv.DictReader(csv_file), start=2):
+            try:
+                new_parking_lot = ParkingLot(
+                    location_name=row['location_name'].strip(),
+                    hourly_rate=float(row['hourly_rate']),
+                    address=row['address'].strip(),
+                    pin_code=row['pin_code'].strip(),
+                    total_spots=int(row['total_spots'])
+                )
+                new_parking_lot.latitude, new_parking_lot.longitude = parse_coordinates(row)
+                for field, value in parse_tariff(row).items():
+                    setattr(new_parking_lot, field, value)
+            except (KeyError, TypeError, ValueError) as error:
+                raise click.ClickException(f'Invalid row {row_number}: {error}')
+            db.session.add(new_parking_lot)
+            db.session.flush()
+            add_parking_spots(new_parking_lot.id, new_parking_lot.total_spots)
+            created_lots += 1
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    lot_location_index.mark_stale()
+    page_cache.invalidate('lots', 'occupancy')
+    print(f'Imported {created_lots} parking lots.')
+
+# Location search
+SEARCH_RESULT_LIMIT = 100
+
+# SQLite FTS5 index over lot names and addresses, kept in sync with parking_lot by triggers
+SEARCH_INDEX_STATEMENTS = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS parking_lot_search USING fts5(
+        location_name, address, content='parking_lot', content_rowid='id')""",
+    """CREATE TRIGGER IF NOT EXISTS parking_lot_search_insert AFTER INSERT ON parking_lot BEGIN
+        INSERT INTO parking_lot_search(rowid, location_name, address)
+        VALUES (new.id, new.location_name, new.address);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS parking_lot_search_delete AFTER DELETE ON parking_lot BEGIN
+        INSERT INTO parking_lot_search(parking_lot_search, rowid, location_name, address)
+        VALUES ('delete', old.id, old.location_name, old.address);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS parking_lot_search_update AFTER UPDATE ON parking_lot BEGIN
+        INSERT INTO parking_lot_search(parking_lot_search, rowid, location_name, address)
+        VALUES ('delete', old.id, old.location_name, old.address);
+        INSERT INTO parking_lot_search(rowid, location_name, address)
+        VALUES (new.id, new.location_name, new.address);
+    END"""
+]
+
+_search_index_available = None
+
+def create_search_index():
+    """Create and populate the full-text lot search index if the database supports it"""
+    global _search_index_available
+    if db.engine.dialect.name != 'sqlite':
+        return
+    with db.engine.begin() as connection:
+        index_exists = connection.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE name = 'parking_lot_search'"
+        )).first() is not None
+        try:
+            for statement in SEARCH_INDEX_STATEMENTS:
+                connection.execute(text(statement))
+        except OperationalError:
+            # SQLite was built without FTS5; searches fall back to LIKE matching
+            return
+        if not index_exists:
+            connection.execute(text("INSERT INTO parking_lot_search(parking_lot_search) VALUES ('rebuild')"))
+    _search_index_available = True
+
+def search_index_available():
+    global _search_index_available
+    if _search_index_available is None:
+        _search_index_available = db.engine.dialect.name == 'sqlite' and db.session.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE name = 'parking_lot_search'"
+        )).first() is not None
+    return _search_index_available
+
+def search_parking_lots_by_substring(search_query):
+    """Case-insensitive substring search on location name, address, or pin code (scans every lot)"""
+    return active_parking_lots().filter(
+        (ParkingLot.location_name.ilike(f'%{search_query}%')) |
+        (ParkingLot.address.ilike(f'%{search_query}%')) |
+        (ParkingLot.pin_code.ilike(f'%{search_query}%'))
+    ).limit(SEARCH_RESULT_LIMIT).all()
+
+def search_parking_lots(search_query):
+    """Find lots whose pin code starts with the query or whose name/address match it, best matches first"""
+    if not search_index_available():
+        return search_parking_lots_by_substring(search_query)
+    
+    # Pin code prefix matches come first, using a range scan on the pin code index; pin codes are digits only
+    matching_ids = []
+    if re.fullmatch(r'[0-9]+', search_query):
+        pin_code_end = search_query[:-1] + chr(ord(search_query[-1]) + 1)
+        matching_ids = [lot_id for (lot_id,) in db.session.query(ParkingLot.id).filter(
+            ParkingLot.pin_code >= search_query, ParkingLot.pin_code < pin_code_end, ParkingLot.retired_at.is_(None)
+        ).order_by(ParkingLot.pin_code).limit(SEARCH_RESULT_LIMIT)]
+    
+    # Then name and address matches ranked by bm25, every word treated as a prefix
+    search_terms = re.findall(r'\w+', search_query)
+    if search_terms and len(matching_ids) < SEARCH_RESULT_LIMIT:
+        match_expression = ' '.join('"' + term + '"*' for term in search_terms)
+        for (lot_id,) in db.session.execute(text(
+            "SELECT rowid FROM parking_lot_search WHERE parking_lot_search MATCH :match "
+            "ORDER BY rank LIMIT :limit"
+        ), {'match': match_expression, 'limit': SEARCH_RESULT_LIMIT}):
+            if lot_id not in matching_ids:
+                matching_ids.append(lot_id)
+    
+    matching_ids = matching_ids[:SEARCH_RESULT_LIMIT]
+    lots_by_id = {lot.id: lot for lot in active_parking_lots().filter(ParkingLot.id.in_(matching_ids))}
+    return [lots_by_id[lot_id] for lot_id in matching_ids if lot_id in lots_by_id]
+
+# Nearby lot lookup
+EARTH_RADIUS_KM = 6371.0
+NEARBY_DEFAULT_RESULTS = 5
+NEARBY_MAX_RESULTS = 50
+
+def parse_coordinates(values):
+    """Read optional latitude/longitude fields; both must be given together and be in range"""
+    latitude = (values.get('latitude') or '').strip()
+    longitude = (values.get('longitude') or '').strip()
+    if not latitude and not longitude:
+        return None, None
+    latitude, longitude = float(latitude), float(longitude)
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        raise ValueError('latitude must be within [-90, 90] and longitude within [-180, 180]')
+    return latitude, longitude
+
+def to_unit_vector(latitude, longitude):
+    """Project a coordinate onto the unit sphere, where straight-line order matches great-circle order"""
+    lat, lng = math.radians(latitude), math.radians(longitude)
+    return (math.cos(lat) * math.cos(lng), math.cos(lat) * math.sin(lng), math.sin(lat))
+
+def chord_to_km(chord_length):
+    return 2 * EARTH_RADIUS_KM * math.asin(min(chord_length / 2, 1.0))
+
+class LotLocationIndex:
+    """KD-tree over the coordinates of every lot that has them.
+
+    The tree is rebuilt lazily on the first lookup after a lot was created,
+    edited or deleted. Lookups take a predicate so lots without free spots
+    are skipped during the search instead of after it.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._root = None
+        self._stale = True
+
+    def mark_stale(self):
+        self._stale = True
+
+    def _build(self, points, depth=0):
+        if not points:
+            return None
+        axis = depth % 3
+        points.sort(key=lambda point: point[0][axis])
+        median = len(points) // 2
+        return (points[median], axis,
+                self._build(points[:median], depth + 1),
+                self._build(points[median + 1:], depth + 1))
+
+    def rebuild(self):
+        rows = db.session.query(ParkingLot.id, ParkingLot.latitude, ParkingLot.longitude) \
+            .filter(ParkingLot.latitude.isnot(None), ParkingLot.longitude.isnot(None), ParkingLot.retired_at.is_(None)).all()
+        points = [(to_unit_vector(latitude, longitude), lot_id) for lot_id, latitude, longitude in rows]
+        with self._lock:
+            self._stale = False
+            self._root = self._build(points)
+
+    def nearest(self, latitude, longitude, k, include=lambda lot_id: True):
+        """Return up to k (distance_km, lot_id) pairs nearest to the coordinate, closest first"""
+        if self._stale:
+            self.rebuild()
+        target = to_unit_vector(latitude, longitude)
+        best = []  # max-heap of (-squared distance, lot_id)
+        
+        def visit(node):
+            if node is None:
+                return
+            (point, lot_id), axis, left, right = node
+            squared_distance = sum((a - b) ** 2 for a, b in zip(point, target))
+            if (len(best) < k or squared_distance < -best[0][0]) and include(lot_id):
+                heapq.heappush(best, (-squared_distance, lot_id))
+                if len(best) > k:
+                    heapq.heappop(best)
+            offset = target[axis] - point[axis]
+            near, far = (left, right) if offset < 0 else (right, left)
+            visit(near)
+            if len(best) < k or offset ** 2 < -best[0][0]:
+                visit(far)
+        
+        visit(self._root)
+        return sorted((chord_to_km(math.sqrt(-negative_distance)), lot_id) for negative_distance, lot_id in best)
+
+lot_location_index = LotLocationIndex()
+
+# Free-spot allocator
+class SpotAllocator:
+    """Keeps a free list of available spot ids for every parking lot.
+
+    The lists are loaded from the database once and then updated as spots are
+    booked and released, so finding a free spot no longer scans the
+    parking_spot table. The database stays the source of truth: every spot
+    handed out is claimed with a conditional UPDATE, so a stale entry can
+    never lead to the same spot being booked twice.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._free_spots = {}
+        self._loaded = False
+
+    def load(self):
+        """Build the free lists for every lot from the database"""
+        free_spots = {}
+        rows = db.session.query(ParkingSpot.lot_id, ParkingSpot.id).filter_by(status='A') \
+            .order_by(ParkingSpot.lot_id, ParkingSpot.spot_number.desc()).all()
+        for lot_id, spot_id in rows:
+            free_spots.setdefault(lot_id, []).append(spot_id)
+        with self._lock:
+            self._free_spots = free_spots
+            self._loaded = True
+
+    def reload_lot(self, lot_id):
+        """Rebuild the free list of a single lot, e.g. after it was edited"""
+        rows = db.session.query(ParkingSpot.id).filter_by(lot_id=lot_id, status='A') \
+            .order_by(ParkingSpot.spot_number.desc()).all()
+        with self._lock:
+            self._free_spots[lot_id] = [spot_id for (spot_id,) in rows]
+
+    def remove_lot(self, lot_id):
+        with self._lock:
+            self._free_spots.pop(lot_id, None)
+
+    def allocate(self, lot_id, skip=None):
+        """Pop a free spot id for the lot, or return None if the lot is full.
+
+        Spots for which skip(spot_id) is true stay on the free list.
+        """
+        if not self._loaded:
+            self.load()
+        with self._lock:
+            free_spots = self._free_spots.get(lot_id)
+            if not free_spots:
+                return None
+            if skip is None:
+                return free_spots.pop()
+            for position in range(len(free_spots) - 1, -1, -1):
+                if not skip(free_spots[position]):
+                    return free_spots.pop(position)
+        return None
+
+    def take(self, lot_id, spot_id):
+        """Remove a specific spot from the free list; returns False if it was not on it"""
+        if not self._loaded:
+            self.load()
+        with self._lock:
+            free_spots = self._free_spots.get(lot_id, [])
+            if spot_id not in free_spots:
+                return False
+            free_spots.remove(spot_id)
+            return True
+
+    def free_spot_ids(self, lot_id):
+        """The free spot ids of the lot, lowest spot number first"""
+        if not self._loaded:
+            self.load()
+        with self._lock:
+            return self._free_spots.get(lot_id, [])[::-1]
+
+    def release(self, lot_id, spot_id):
+        """Put a spot back on the free list of its lot"""
+        with self._lock:
+            if self._loaded:
+                self._free_spots.setdefault(lot_id, []).append(spot_id)
+
+    def claim_spot(self, lot_id, skip=None, preferred_spot_id=None):
+        """Allocate a spot and mark it occupied in the current transaction.
+
+        Returns the claimed spot id, or None when no spot is free. The
+        preferred spot is claimed if it is still available; otherwise any free
+        spot not excluded by skip is. If the free list turns out to be empty
+        while the database still has available spots (for example another
+        worker released one), the lot is reloaded once before giving up.
+        """
+        if preferred_spot_id is not None:
+            self.take(lot_id, preferred_spot_id)
+            result = db.session.execute(
+                update(ParkingSpot)
+                .where(ParkingSpot.id == preferred_spot_id, ParkingSpot.status == 'A')
+                .values(status='O')
+            )
+            if result.rowcount == 1:
+                return preferred_spot_id
+        reloaded = False
+        while True:
+            spot_id = self.allocate(lot_id, skip)
+            if spot_id is None:
+                if reloaded:
+                    return None
+                self.reload_lot(lot_id)
+                reloaded = True
+                continue
+            result = db.session.execute(
+                update(ParkingSpot)
+                .where(ParkingSpot.id == spot_id, ParkingSpot.status == 'A')
+                .values(status='O')
+            )
+            if result.rowcount == 1:
+                return spot_id
+
+spot_allocator = SpotAllocator()
+
+# Occupancy counters
+# Reload the occupancy counters from the database this often, so bookings made by
+# other worker processes show up; 0 turns reconciling off (one process only)
+app.config['OCCUPANCY_RECONCILE_SECONDS'] = int(os.environ.get('OCCUPANCY_RECONCILE_SECONDS', '30'))
+
+class OccupancyCache:
+    """Per-lot total and occupied spot counts kept in process memory.
+
+    Loaded with a single grouped query and then adjusted incrementally by the
+    booking and lot management routes, so availability pages never have to
+    count spots lot by lot. Every change bumps a version number and is
+    appended to a change log, which lets availability streams wait for and
+    collect the lots changed since the version they last sent without
+    looking at lots that did not change. Each process only sees its own
+    adjustments, so a background thread reconciles the counts with the
+    database every OCCUPANCY_RECONCILE_SECONDS.
+    """
+
+    # Change log entries kept for streams that fall behind; older ones are dropped in bulk
+    CHANGE_LOG_LIMIT = 10000
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._changes = threading.Condition(self._lock)
+        self._counts = {}
+        self._loaded = False
+        self._version = 0
+        self._changed_at = {}
+        self._log_versions = []
+        self._log_lots = []
+        self._last_collected = None
+        self._reconciling = False
+        # Local changes made while reconcile() reads the database: lot id -> occupied
+        # delta, or None once the lot was set or removed
+        self._changes_during_read = None
+
+    def _record_change(self, lot_id):
+        # Callers hold the lock
+        self._version += 1
+        self._changed_at[lot_id] = self._version
+        self._log_versions.append(self._version)
+        self._log_lots.append(lot_id)
+        if len(self._log_versions) > self.CHANGE_LOG_LIMIT:
+            del self._log_versions[:self.CHANGE_LOG_LIMIT // 2]
+            del self._log_lots[:self.CHANGE_LOG_LIMIT // 2]
+        self._changes.notify_all()
+
+    def _collect_changes(self, since_version):
+        # Callers hold the lock. Every stream woken by the same change asks for the
+        # same range, so the result is built once and shared.
+        if self._last_collected and self._last_collected[:2] == (since_version, self._version):
+            return self._last_collected[2]
+        if self._log_versions and self._log_versions[0] <= since_version + 1:
+            position = bisect.bisect_right(self._log_versions, since_version)
+            lot_ids = set(self._log_lots[position:])
+        else:
+            # The stream is further behind than the log reaches
+            lot_ids = {lot_id for lot_id, changed_version in self._changed_at.items() if changed_version > since_version}
+        changed_lots = {lot_id: self._stats(self._counts[lot_id]) if lot_id in self._counts else None
+                        for lot_id in lot_ids}
+        self._last_collected = (since_version, self._version, changed_lots)
+        return changed_lots
+
+    @staticmethod
+    def _count_spots(connection):
+        """Total and occupied spots of every open lot, lots without spots included, in one query; retired spots do not count"""
+        rows = connection.execute(
+            select(ParkingLot.id, func.count(ParkingSpot.id), func.sum(case((ParkingSpot.status == 'O', 1), else_=0)))
+            .outerjoin(ParkingSpot, and_(ParkingSpot.lot_id == ParkingLot.id, ParkingSpot.status != 'R'))
+            .where(ParkingLot.retired_at.is_(None))
+            .group_by(ParkingLot.id)
+        )
+        return {lot_id: {'total': total, 'occupied': occupied or 0} for lot_id, total, occupied in rows}
+
+    def load(self):
+        """Count total and occupied spots for every lot in one query"""
+        counts = self._count_spots(db.session)
+        with self._lock:
+            self._counts = counts
+            self._loaded = True
+
+    def reconcile(self):
+        """Replace the counts with the database's, recording a change for every lot that differs.
+
+        The counts are read on a connection of their own, so only committed
+        bookings are seen. Adjustments this process makes while they are
+        read are applied on top of them rather than overwritten, and lots
+        set or removed meanwhile keep their local counts. Returns the number
+        of lots that changed.
+        """
+        with self._lock:
+            self._changes_during_read = {}
+        try:
+            with db.engine.connect() as connection:
+                counts = self._count_spots(connection)
+        finally:
+            with self._lock:
+                changes_during_read, self._changes_during_read = self._changes_during_read, None
+        with self._lock:
+            for lot_id, occupied_delta in changes_during_read.items():
+                if occupied_delta is None:
+                    if lot_id in self._counts:
+                        counts[lot_id] = dict(self._counts[lot_id])
+                    else:
+                        counts.pop(lot_id, None)
+                elif lot_id in counts:
+                    counts[lot_id]['occupied'] += occupied_delta
+            changed_lot_ids = [lot_id for lot_id in self._counts.keys() | counts.keys()
+                               if self._counts.get(lot_id) != counts.get(lot_id)]
+            self._counts = counts
+            self._loaded = True
+            for lot_id in changed_lot_ids:
+                self._record_change(lot_id)
+        return len(changed_lot_ids)
+
+    def _reconcile_periodically(self, interval):
+        while True:
+            time.sleep(interval)
+            with app.app_context():
+                try:
+                    if self.reconcile():
+                        page_cache.invalidate('occupancy')
+                except Exception:
+                    app.logger.exception('Reconciling occupancy counts failed, retrying in %d s', interval)
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            self.load()
+        # Write-behind keeps the counters ahead of the database, so it runs in a single process without reconciling
+        interval = app.config['OCCUPANCY_RECONCILE_SECONDS']
+        if not self._reconciling and interval > 0 and not app.config['WRITE_BEHIND']:
+            with self._lock:
+                if self._reconciling:
+                    return
+                self._reconciling = True
+            threading.Thread(target=self._reconcile_periodically, args=(interval,),
+                             name='occupancy-reconcile', daemon=True).start()
+
+    def _load_lot(self, lot_id):
+        """Count the spots of a lot this process has not seen yet (e.g. bulk imported)"""
+        total, occupied = db.session.query(
+            func.count(ParkingSpot.id),
+            func.sum(case((ParkingSpot.status == 'O', 1), else_=0))
+        ).filter(ParkingSpot.lot_id == lot_id, ParkingSpot.status != 'R').one()
+        self.set_lot(lot_id, total, occupied or 0)
+
+    def _note_change_during_read(self, lot_id, occupied_delta=None):
+        # Callers hold the lock
+        if self._changes_during_read is None:
+            return
+        if occupied_delta is None or self._changes_during_read.get(lot_id, 0) is None:
+            self._changes_during_read[lot_id] = None
+        else:
+            self._changes_during_read[lot_id] = self._changes_during_read.get(lot_id, 0) + occupied_delta
+
+    def set_lot(self, lot_id, total, occupied=0):
+        with self._lock:
+            self._counts[lot_id] = {'total': total, 'occupied': occupied}
+            self._note_change_during_read(lot_id)
+            self._record_change(lot_id)
+
+    def remove_lot(self, lot_id):
+        with self._lock:
+            self._counts.pop(lot_id, None)
+            self._note_change_during_read(lot_id)
+            self._record_change(lot_id)
+
+    def adjust(self, lot_id, occupied_delta):
+        """Record spots becoming occupied (+1) or available (-1)"""
+        with self._lock:
+            if lot_id in self._counts:
+                self._counts[lot_id]['occupied'] += occupied_delta
+                self._note_change_during_read(lot_id, occupied_delta)
+                self._record_change(lot_id)
+
+    def _stats(self, counts):
+        return {'total': counts['total'], 'occupied': counts['occupied'],
+                'available': counts['total'] - counts['occupied']}
+
+    def snapshot(self):
+        """Return the current version and the counts of every lot"""
+        self._ensure_loaded()
+        with self._lock:
+            return self._version, {lot_id: self._stats(counts) for lot_id, counts in self._counts.items()}
+
+    def wait_for_changes(self, since_version, timeout):
+        """Block until a lot changes after since_version or the timeout passes.
+
+        Returns the new version and the counts of the lots changed since
+        since_version (None for lots that were deleted), so any burst of
+        changes to a lot collapses into one entry. The returned dict is shared
+        between callers and must not be modified.
+        """
+        with self._lock:
+            self._changes.wait_for(lambda: self._version > since_version, timeout)
+            if self._version == since_version:
+                return self._version, {}
+            return self._version, self._collect_changes(since_version)
+
+    def lot_stats(self, lot_id):
+        """Return total, occupied and available counts for one lot"""
+        self._ensure_loaded()
+        if lot_id not in self._counts:
+            self._load_lot(lot_id)
+        with self._lock:
+            return self._stats(self._counts[lot_id])
+
+    def totals(self):
+        """Return total, occupied and available counts across all lots"""
+        self._ensure_loaded()
+        with self._lock:
+            total = sum(counts['total'] for counts in self._counts.values())
+            occupied = sum(counts['occupied'] for counts in self._counts.values())
+        return {'total': total, 'occupied': occupied, 'available': total - occupied}
+
+occupancy_cache = OccupancyCache()
+
+# Reservation history
+HISTORY_PAGE_SIZE = 10
+MAX_HISTORY_PAGE_SIZE = 100
+
+def encode_history_cursor(reservation):
+    return f"{reservation.exit_time.isoformat()}_{reservation.id}"
+
+def decode_history_cursor(cursor):
+    """Split a history cursor into its exit time and reservation id, or return None if invalid"""
+    try:
+        exit_time, reservation_id = cursor.rsplit('_', 1)
+        return datetime.fromisoformat(exit_time), int(reservation_id)
+    except (AttributeError, ValueError):
+        return None
+
+def reservation_history_page(user_id, cursor=None, limit=HISTORY_PAGE_SIZE):
+    """Return one page of completed reservations, newest exit first, and the cursor of the next page.
+
+    Pages are selected by (exit_time, id) rather than OFFSET, so every page
+    costs the same however far back the user scrolls. Archived reservations
+    keep their ids, so the page is the newest rows of the live and archive
+    tables merged.
+    """
+    position = decode_history_cursor(cursor) if cursor else None
+    reservations = []
+    for model in (Reservation, ReservationArchive):
+        history_query = model.query.options(
+            joinedload(model.parking_spot).joinedload(ParkingSpot.parking_lot)
+        ).filter(model.user_id == user_id, model.status == 'completed')
+        if position:
+            exit_time, reservation_id = position
+            history_query = history_query.filter(or_(
+                model.exit_time < exit_time,
+                and_(model.exit_time == exit_time, model.id < reservation_id)
+            ))
+        reservations.extend(history_query.order_by(model.exit_time.desc(), model.id.desc()).limit(limit + 1))
+    
+    reservations.sort(key=lambda reservation: (reservation.exit_time, reservation.id), reverse=True)
+    reservations = reservations[:limit + 1]
+    next_cursor = None
+    if len(reservations) > limit:
+        reservations = reservations[:limit]
+        next_cursor = encode_history_cursor(reservations[-1])
+    return reservations, next_cursor
+
+def reservation_duration_seconds(model=Reservation):
+    """SQL expression for the length of a completed reservation in seconds"""
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite':
+        return (func.julianday(model.exit_time) - func.julianday(model.entry_time)) * 86400
+    if dialect == 'postgresql':
+        return func.extract('epoch', model.exit_time - model.entry_time)
+    return func.timestampdiff(text('SECOND'), model.entry_time, model.exit_time)
+
+def user_parking_totals(user_id):
+    """Lifetime session count, parking hours and cost of a user, with one aggregate query per table"""
+    completed_sessions, total_seconds, total_cost = 0, 0, 0
+    for model in (Reservation, ReservationArchive):
+        sessions, seconds, cost = db.session.query(
+            func.count(model.id),
+            func.sum(reservation_duration_seconds(model)),
+            func.sum(model.total_cost)
+        ).filter(
+            model.user_id == user_id,
+            model.status == 'completed',
+            model.exit_time.isnot(None)
+        ).one()
+        completed_sessions += sessions
+        total_seconds += seconds or 0
+        total_cost += cost or 0
+    return {
+        'completed_sessions': completed_sessions,
+        'total_hours': (total_seconds or 0) / 3600,
+        'total_cost': total_cost or 0
+    }
+
+# Occupancy and revenue rollups
+ROLLUP_GRANULARITIES = ('hour', 'day')
+ROLLUP_BUCKET_LENGTHS = {'hour': timedelta(hours=1), 'day': timedelta(days=1)}
+EXPORT_BATCH_SIZE = 1000
+
+def rollup_bucket_start(timestamp, granularity):
+    """Truncate a timestamp to the start of its hourly or daily bucket (local time)"""
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(indian_timezone).replace(tzinfo=None)
+    bucket_start = timestamp.replace(minute=0, second=0, microsecond=0)
+    if granularity == 'day':
+        bucket_start = bucket_start.replace(hour=0)
+    return bucket_start
+
+def rollup_buckets_after(start_time, end_time, granularity):
+    """Start times of the buckets after the one containing start_time, up to and including the one containing end_time"""
+    step = ROLLUP_BUCKET_LENGTHS[granularity]
+    bucket_start = rollup_bucket_start(start_time, granularity) + step
+    last_bucket_start = rollup_bucket_start(end_time, granularity)
+    while bucket_start <= last_bucket_start:
+        yield bucket_start
+        bucket_start += step
+
+def empty_rollup_counts():
+    return {'peak_occupancy': 0, 'bookings': 0, 'completed_stays': 0, 'total_stay_seconds': 0.0, 'revenue': 0.0,
+            'closing_occupancy': 0}
+
+def upsert_rollup_bucket(values):
+    """Add the counts in values to one bucket, creating it if needed.
+
+    The peak is the maximum of both, and the closing occupancy is the new one.
+    """
+    dialect = db.engine.dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        dialect_module = sqlite_dialect if dialect == 'sqlite' else postgresql_dialect
+        upsert = dialect_module.insert(OccupancyRollup).values(**values)
+        db.session.execute(upsert.on_conflict_do_update(
+            index_elements=['granularity', 'lot_id', 'bucket_start'],
+            set_={
+                'peak_occupancy': case(
+                    (upsert.excluded.peak_occupancy > OccupancyRollup.peak_occupancy, upsert.excluded.peak_occupancy),
+                    else_=OccupancyRollup.peak_occupancy
+                ),
+                'bookings': OccupancyRollup.bookings + upsert.excluded.bookings,
+                'completed_stays': OccupancyRollup.completed_stays + upsert.excluded.completed_stays,
+                'total_stay_seconds': OccupancyRollup.total_stay_seconds + upsert.excluded.total_stay_seconds,
+                'revenue': OccupancyRollup.revenue + upsert.excluded.revenue,
+                'closing_occupancy': upsert.excluded.closing_occupancy
+            }
+        ))
+        return
+    rollup = OccupancyRollup.query.filter_by(
+        granularity=values['granularity'], lot_id=values['lot_id'], bucket_start=values['bucket_start']
+    ).with_for_update().first()
+    if rollup is None:
+        db.session.add(OccupancyRollup(**values))
+        return
+    rollup.peak_occupancy = max(rollup.peak_occupancy, values['peak_occupancy'])
+    rollup.bookings += values['bookings']
+    rollup.completed_stays += values['completed_stays']
+    rollup.total_stay_seconds += values['total_stay_seconds']
+    rollup.revenue += values['revenue']
+    rollup.closing_occupancy = values['closing_occupancy']
+
+def add_to_rollup(lot_id, timestamp, closing_occupancy, peak_occupancy=0, bookings=0, completed_stays=0,
+                  total_stay_seconds=0.0, revenue=0.0):
+    """Add counts to the hourly and daily buckets containing timestamp, creating them if needed"""
+    for granularity in ROLLUP_GRANULARITIES:
+        upsert_rollup_bucket({
+            'lot_id': lot_id,
+            'granularity': granularity,
+            'bucket_start': rollup_bucket_start(timestamp, granularity),
+            'peak_occupancy': peak_occupancy,
+            'bookings': bookings,
+            'completed_stays': completed_stays,
+            'total_stay_seconds': total_stay_seconds,
+            'revenue': revenue,
+            'closing_occupancy': closing_occupancy
+        })
+
+def record_booking_rollup(lot_id, entry_time, occupied_spots):
+    """Count a booking; occupied_spots is the lot's occupancy including the new booking"""
+    add_to_rollup(lot_id, entry_time, occupied_spots, peak_occupancy=occupied_spots, bookings=1)
+
+def record_release_rollup(lot_id, exit_time, stay_seconds, cost, occupied_spots):
+    """Count a completed stay; occupied_spots is the lot's occupancy just before the release"""
+    add_to_rollup(lot_id, exit_time, occupied_spots - 1, peak_occupancy=occupied_spots, completed_stays=1,
+                  total_stay_seconds=stay_seconds, revenue=cost)
+
+def carried_rollup_occupancy(granularity, bucket_start, lot_id=None):
+    """The closing occupancy of each lot's last bucket before bucket_start, for lots that were not empty"""
+    last_buckets = db.session.query(
+        OccupancyRollup.lot_id, func.max(OccupancyRollup.bucket_start).label('bucket_start')
+    ).filter(OccupancyRollup.granularity == granularity, OccupancyRollup.bucket_start < bucket_start)
+    if lot_id:
+        last_buckets = last_buckets.filter(OccupancyRollup.lot_id == lot_id)
+    last_buckets = last_buckets.group_by(OccupancyRollup.lot_id).subquery()
+    rows = db.session.query(OccupancyRollup.lot_id, OccupancyRollup.closing_occupancy).join(last_buckets, and_(
+        OccupancyRollup.lot_id == last_buckets.c.lot_id, OccupancyRollup.bucket_start == last_buckets.c.bucket_start
+    )).filter(OccupancyRollup.granularity == granularity)
+    return {row_lot_id: closing_occupancy for row_lot_id, closing_occupancy in rows if closing_occupancy}
+
+def rollup_series(granularity, lot_id=None, start_time=None, end_time=None):
+    """Per-bucket totals over the lots, with occupancy carried through buckets that have no events.
+
+    Bookings and releases only write the bucket they happen in, so a lot
+    that stays occupied through quiet hours has no rows for them; each
+    lot's closing occupancy is carried forward here instead, up to end_time
+    or now. The peak of a bucket is the sum of the per-lot peaks.
+    """
+    step = ROLLUP_BUCKET_LENGTHS[granularity]
+    first_bucket = rollup_bucket_start(start_time, granularity) if start_time else None
+    now = to_local_naive(datetime.now(indian_timezone))
+    last_bucket = rollup_bucket_start(min(end_time - timedelta(microseconds=1), now) if end_time else now, granularity)
+    
+    rollup_query = db.session.query(
+        OccupancyRollup.lot_id, OccupancyRollup.bucket_start, OccupancyRollup.peak_occupancy, OccupancyRollup.bookings,
+        OccupancyRollup.completed_stays, OccupancyRollup.total_stay_seconds, OccupancyRollup.revenue,
+        OccupancyRollup.closing_occupancy
+    ).filter(OccupancyRollup.granularity == granularity)
+    if lot_id:
+        rollup_query = rollup_query.filter(OccupancyRollup.lot_id == lot_id)
+    if first_bucket:
+        rollup_query = rollup_query.filter(OccupancyRollup.bucket_start >= first_bucket)
+    if end_time:
+        rollup_query = rollup_query.filter(OccupancyRollup.bucket_start < end_time)
+    rollups_by_lot = {
+        rollup_lot_id: list(rollups) for rollup_lot_id, rollups in
+        itertools.groupby(rollup_query.order_by(OccupancyRollup.lot_id, OccupancyRollup.bucket_start),
+                          key=lambda rollup: rollup.lot_id)
+    }
+    carried = carried_rollup_occupancy(granularity, first_bucket, lot_id) if first_bucket else {}
+    
+    totals = {}
+    def add(bucket_start, **counts):
+        bucket = totals.setdefault(bucket_start, empty_rollup_counts())
+        for field, value in counts.items():
+            bucket[field] += value
+    
+    for rollup_lot_id in rollups_by_lot.keys() | carried.keys():
+        occupied_spots = carried.get(rollup_lot_id, 0)
+        previous_bucket = first_bucket - step if first_bucket else None
+        for rollup in rollups_by_lot.get(rollup_lot_id, []):
+            if occupied_spots and previous_bucket is not None:
+                for bucket_start in rollup_buckets_after(previous_bucket, rollup.bucket_start - step, granularity):
+                    add(bucket_start, peak_occupancy=occupied_spots)
+            add(rollup.bucket_start, peak_occupancy=rollup.peak_occupancy, bookings=rollup.bookings,
+                completed_stays=rollup.completed_stays, total_stay_seconds=rollup.total_stay_seconds,
+                revenue=rollup.revenue)
+            occupied_spots, previous_bucket = rollup.closing_occupancy or 0, rollup.bucket_start
+        if occupied_spots and previous_bucket is not None:
+            for bucket_start in rollup_buckets_after(previous_bucket, last_bucket, granularity):
+                add(bucket_start, peak_occupancy=occupied_spots)
+    return sorted(totals.items())
+
+def backfill_rollups():
+    """Rebuild every rollup bucket from the reservation history, one lot at a time"""
+    OccupancyRollup.query.delete()
+    all_history = union_all(*[
+        select(ParkingSpot.lot_id, model.entry_time, model.exit_time, model.total_cost, model.status)
+        .join(ParkingSpot, model.spot_id == ParkingSpot.id)
+        .where(model.status.in_(('active', 'completed')))
+        for model in (Reservation, ReservationArchive)
+    ]).subquery()
+    history = db.session.execute(
+        select(all_history)
+        .order_by(all_history.c.lot_id)
+        .execution_options(yield_per=EXPORT_BATCH_SIZE, stream_results=True)
+    )
+    for lot_id, lot_history in itertools.groupby(history, key=lambda row: row.lot_id):
+        buckets = {}
+        events = []
+        for row in lot_history:
+            events.append((row.entry_time, 1))
+            for granularity in ROLLUP_GRANULARITIES:
+                bucket = buckets.setdefault((granularity, rollup_bucket_start(row.entry_time, granularity)),
+                                            empty_rollup_counts())
+                bucket['bookings'] += 1
+            if row.status == 'completed' and row.exit_time:
+                events.append((row.exit_time, -1))
+                for granularity in ROLLUP_GRANULARITIES:
+                    bucket = buckets.setdefault((granularity, rollup_bucket_start(row.exit_time, granularity)),
+                                                empty_rollup_counts())
+                    bucket['completed_stays'] += 1
+                    bucket['total_stay_seconds'] += (row.exit_time - row.entry_time).total_seconds()
+                    bucket['revenue'] += row.total_cost or 0
+        
+        # Sweep entries and exits in time order to find the peak and closing occupancy of every bucket;
+        # buckets without events are filled from the closing occupancy when they are read
+        occupied_spots = 0
+        for event_time, change in sorted(events, key=lambda event: (event[0], event[1])):
+            occupied_before = occupied_spots
+            occupied_spots += change
+            for granularity in ROLLUP_GRANULARITIES:
+                bucket = buckets[(granularity, rollup_bucket_start(event_time, granularity))]
+                bucket['peak_occupancy'] = max(bucket['peak_occupancy'], occupied_before, occupied_spots)
+                bucket['closing_occupancy'] = occupied_spots
+        
+        db.session.execute(insert(OccupancyRollup), [
+            dict(lot_id=lot_id, granularity=granularity, bucket_start=bucket_start, **counts)
+            for (granularity, bucket_start), counts in buckets.items()
+        ])
+    db.session.commit()
+
+@app.cli.command('backfill-rollups')
+def backfill_rollups_command():
+    """Rebuild the hourly and daily occupancy rollups from existing reservations"""
+    upgrade_database()
+    backfill_rollups()
+    print(f'Rebuilt {OccupancyRollup.query.count()} rollup buckets.')
+
+# Reservation archival
+app.config['RESERVATION_RETENTION_DAYS'] = int(os.environ.get('RESERVATION_RETENTION_DAYS', '180'))
+app.config['ARCHIVE_CHUNK_SIZE'] = int(os.environ.get('ARCHIVE_CHUNK_SIZE', '500'))
+ARCHIVE_COLUMNS = ('id', 'spot_id', 'user_id', 'entry_time', 'exit_time', 'total_cost', 'status', 'created_at')
+
+def archive_reservations(retention_days, chunk_size, pause_seconds=0):
+    """Move completed reservations that ended more than retention_days ago into the archive table.
+
+    Rows move chunk_size at a time, each chunk in its own short transaction,
+    so bookings and releases never wait long for the write lock. Returns the
+    number of reservations archived.
+    """
+    cutoff = to_local_naive(datetime.now(indian_timezone)) - timedelta(days=retention_days)
+    archived_count = 0
+    while True:
+        chunk_ids = [reservation_id for (reservation_id,) in db.session.query(Reservation.id).filter(
+            Reservation.status == 'completed',
+            Reservation.exit_time < cutoff
+        ).order_by(Reservation.id).limit(chunk_size)]
+        if not chunk_ids:
+            break
+        db.session.execute(insert(ReservationArchive).from_select(
+            ARCHIVE_COLUMNS + ('archived_at',),
+            select(*[getattr(Reservation, column) for column in ARCHIVE_COLUMNS], literal(datetime.utcnow()))
+            .where(Reservation.id.in_(chunk_ids))
+        ))
+        db.session.execute(
+            delete(Reservation).where(Reservation.id.in_(chunk_ids)).execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        archived_count += len(chunk_ids)
+        if pause_seconds:
+            time.sleep(pause_seconds)
+    return archived_count
+
+@app.cli.command('archive-reservations')
+@click.option('--days', type=int, default=None, help='Archive reservations that ended more than this many days ago.')
+@click.option('--chunk-size', type=int, default=None, help='Reservations moved per transaction.')
+@click.option('--pause', type=float, default=0.0, help='Seconds to wait between chunks.')
+def archive_reservations_command(days, chunk_size, pause):
+    """Move old completed reservations into the reservation archive"""
+    upgrade_database()
+    retention_days = app.config['RESERVATION_RETENTION_DAYS'] if days is None else days
+    archived_count = archive_reservations(retention_days, chunk_size or app.config['ARCHIVE_CHUNK_SIZE'], pause)
+    print(f'Archived {archived_count} reservations that ended more than {retention_days} days ago.')
+
+# Request instrumentation
+app.config['METRICS_ENABLED'] = os.environ.get('ENABLE_METRICS', '0') == '1'
+app.config['SLOW_REQUEST_MS'] = int(os.environ.get('SLOW_REQUEST_MS', '500'))
+SLOW_REQUEST_MAX_STATEMENTS = 50
+
+class RequestMetrics:
+    """Per-endpoint totals of request time, SQL, template rendering and password checks"""
+
+    FIELDS = ('requests', 'request_seconds', 'sql_statements', 'sql_seconds', 'template_seconds', 'password_check_seconds')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints = {}
+
+    def record(self, endpoint, **values):
+        with self._lock:
+            totals = self._endpoints.setdefault(endpoint, dict.fromkeys(self.FIELDS, 0))
+            totals['requests'] += 1
+            for field, value in values.items():
+                totals[field] += value
+
+    def prometheus_text(self):
+        """Render the totals in the Prometheus text exposition format"""
+        metrics = [
+            ('parking_requests_total', 'counter', 'Requests handled', 'requests'),
+            ('parking_request_seconds_total', 'counter', 'Wall time spent handling requests', 'request_seconds'),
+            ('parking_sql_statements_total', 'counter', 'SQL statements executed', 'sql_statements'),
+            ('parking_sql_seconds_total', 'counter', 'Time spent executing SQL', 'sql_seconds'),
+            ('parking_template_seconds_total', 'counter', 'Time spent rendering templates', 'template_seconds'),
+            ('parking_password_check_seconds_total', 'counter', 'Time spent verifying password hashes', 'password_check_seconds')
+        ]
+        with self._lock:
+            endpoints = {endpoint: dict(totals) for endpoint, totals in self._endpoints.items()}
+        lines = []
+        for name, metric_type, description, field in metrics:
+            lines.append(f'# HELP {name} {description}')
+            lines.append(f'# TYPE {name} {metric_type}')
+            for endpoint, totals in sorted(endpoints.items()):
+                lines.append(f'{name}{{endpoint="{endpoint}"}} {totals[field]}')
+        return '\n'.join(lines) + '\n'
+
+request_metrics = RequestMetrics()
+
+def verify_password(password_hash, password):
+    """check_password_hash, timed for the request metrics"""
+    started = time.perf_counter()
+    try:
+        return check_password_hash(password_hash, password)
+    finally:
+        if has_request_context() and 'metrics' in g:
+            g.metrics['password_check_seconds'] += time.perf_counter() - started
+
+def start_request_metrics():
+    g.metrics = {'sql_statements': 0, 'sql_seconds': 0.0, 'template_seconds': 0.0, 'password_check_seconds': 0.0}
+    g.metrics_statements = []
+    g.metrics_started = time.perf_counter()
+
+def finish_request_metrics(response):
+    if 'metrics' not in g:
+        return response
+    request_seconds = time.perf_counter() - g.metrics_started
+    endpoint = request.endpoint or 'unmatched'
+    request_metrics.record(endpoint, request_seconds=request_seconds, **g.metrics)
+    if request_seconds * 1000 >= app.config['SLOW_REQUEST_MS']:
+        app.logger.warning(
+            'Slow request %s %s (%s): %.1f ms, %d SQL statements in %.1f ms\n%s',
+            request.method, request.full_path, endpoint, request_seconds * 1000,
+            g.metrics['sql_statements'], g.metrics['sql_seconds'] * 1000,
+            '\n'.join(f'  {duration * 1000:.1f} ms  {statement}' for statement, duration in g.metrics_statements)
+        )
+    return response
+
+def before_sql(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('metrics_query_started', []).append(time.perf_counter())
+
+def after_sql(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info['metrics_query_started'].pop()
+    if has_request_context() and 'metrics' in g:
+        duration = time.perf_counter() - started
+        g.metrics['sql_statements'] += 1
+        g.metrics['sql_seconds'] += duration
+        if len(g.metrics_statements) < SLOW_REQUEST_MAX_STATEMENTS:
+            g.metrics_statements.append((statement, duration))
+
+def before_template(sender, template, context, **extra):
+    if 'metrics' in g:
+        g.metrics_template_started = time.perf_counter()
+
+def after_template(sender, template, context, **extra):
+    if 'metrics' in g and 'metrics_template_started' in g:
+        g.metrics['template_seconds'] += time.perf_counter() - g.pop('metrics_template_started')
+
+if app.config['METRICS_ENABLED']:
+    app.before_request(start_request_metrics)
+    app.after_request(finish_request_metrics)
+    event.listen(Engine, 'before_cursor_execute', before_sql)
+    event.listen(Engine, 'after_cursor_execute', after_sql)
+    before_render_template.connect(before_template, app)
+    template_rendered.connect(after_template, app)
+
+# Page cache
+app.config['CACHE_REDIS_URL'] = os.environ.get('CACHE_REDIS_URL')
+app.config['CACHE_DEFAULT_TTL'] = int(os.environ.get('CACHE_DEFAULT_TTL', '60'))
+app.config['CACHE_MAX_ENTRIES'] = int(os.environ.get('CACHE_MAX_ENTRIES', '1024'))
+
+class MemoryCacheBackend:
+    """In-process LRU store with per-entry expiry"""
+
+    def __init__(self, max_entries):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._counters = {}
+        self.max_entries = max_entries
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_counter(self, key):
+        with self._lock:
+            return self._counters.get(key, 0)
+
+    def incr(self, key):
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+            return self._counters[key]
+
+class RedisCacheBackend:
+    """Shared store on any client with the redis-py get/set/incr interface"""
+
+    def __init__(self, client):
+        self.client = client
+
+    def get(self, key):
+        value = self.client.get(key)
+        return value.decode() if isinstance(value, bytes) else value
+
+    def set(self, key, value, ttl):
+        self.client.set(key, value, ex=ttl)
+
+    def get_counter(self, key):
+        return int(self.client.get(key) or 0)
+
+    def incr(self, key):
+        return self.client.incr(key)
+
+class ResponseCache:
+    """Caches rendered pages under keys that include a version number per tag.
+
+    Invalidating a tag bumps its version, so every page rendered from the
+    old data is skipped at once and simply ages out of the store.
+    """
+
+    def __init__(self, backend, default_ttl):
+        self.backend = backend
+        self.default_ttl = default_ttl
+        self.hits = Counter()
+        self.misses = Counter()
+
+    def invalidate(self, *tags):
+        for tag in tags:
+            self.backend.incr(f'cache-tag:{tag}')
+
+    def _key(self, tags):
+        tag_versions = ','.join(f"{tag}={self.backend.get_counter(f'cache-tag:{tag}')}" for tag in tags)
+        # Pages show the signed-in account's name, so every combination of accounts gets its own copy
+        viewer = f"admin:{session.get('admin_id')}:user:{session.get('user_id')}"
+        return f'page:{request.endpoint}:{viewer}:{request.full_path}:{tag_versions}'
+
+    def cached(self, tags=(), ttl=None, unless=None, requires=None):
+        """Decorator caching a view's rendered HTML for GET requests.
+
+        requires names the session key the view's login check looks for;
+        without it the view runs uncached, so it can turn the visitor away.
+        """
+        def decorator(view):
+            @functools.wraps(view)
+            def wrapper(*args, **kwargs):
+                # Pending flash messages are rendered into the page, so those responses are never cached
+                if request.method != 'GET' or '_flashes' in session or (requires and requires not in session) \
+                        or (unless and unless()):
+                    return view(*args, **kwargs)
+                key = self._key(tags)
+                page = self.backend.get(key)
+                if page is not None:
+                    self.hits[request.endpoint] += 1
+                    return page
+                self.misses[request.endpoint] += 1
+                page = view(*args, **kwargs)
+                if isinstance(page, str):
+                    self.backend.set(key, page, ttl or self.default_ttl)
+                return page
+            return wrapper
+        return decorator
+
+    def stats(self):
+        return {endpoint: {'hits': self.hits[endpoint], 'misses': self.misses[endpoint]}
+                for endpoint in sorted(set(self.hits) | set(self.misses))}
+
+def create_cache_backend():
+    if app.config['CACHE_REDIS_URL']:
+        import redis
+        return RedisCacheBackend(redis.Redis.from_url(app.config['CACHE_REDIS_URL']))
+    return MemoryCacheBackend(app.config['CACHE_MAX_ENTRIES'])
+
+page_cache = ResponseCache(create_cache_backend(), app.config['CACHE_DEFAULT_TTL'])
+
+# Advance booking schedule
+# Walk-ins are kept off a spot this long before its next scheduled window, and check-in opens this early
+app.config['ADVANCE_BOOKING_HOLD_MINUTES'] = int(os.environ.get('ADVANCE_BOOKING_HOLD_MINUTES', '60'))
+
+class SpotSchedule:
+    """Sorted, non-overlapping booking windows for every spot.
+
+    Each spot keeps its window starts in a sorted list next to the matching
+    (end, booking id) pairs. Because windows on a spot never overlap, the
+    only window that can clash with [start, end) is the last one starting
+    before end, so a conflict check is one binary search.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._starts = {}
+        self._windows = {}
+        self._loaded = False
+
+    def load(self):
+        """Index every scheduled booking that has not ended yet"""
+        now = to_local_naive(datetime.now(indian_timezone))
+        bookings = db.session.query(AdvanceBooking.id, AdvanceBooking.spot_id, AdvanceBooking.start_time,
+                                    AdvanceBooking.end_time) \
+            .filter(AdvanceBooking.status == 'scheduled', AdvanceBooking.end_time > now) \
+            .order_by(AdvanceBooking.spot_id, AdvanceBooking.start_time)
+        starts, windows = {}, {}
+        for booking_id, spot_id, start_time, end_time in bookings:
+            starts.setdefault(spot_id, []).append(start_time)
+            windows.setdefault(spot_id, []).append((end_time, booking_id))
+        with self._lock:
+            self._starts, self._windows = starts, windows
+            self._loaded = True
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            self.load()
+
+    def _is_free(self, spot_id, start_time, end_time):
+        # Callers hold the lock
+        starts = self._starts.get(spot_id)
+        if not starts:
+            return True
+        position = bisect.bisect_left(starts, end_time)
+        return position == 0 or self._windows[spot_id][position - 1][0] <= start_time
+
+    def is_free(self, spot_id, start_time, end_time):
+        self._ensure_loaded()
+        with self._lock:
+            return self._is_free(spot_id, start_time, end_time)
+
+    def first_free_spot(self, spot_ids, start_time, end_time):
+        """Return the first spot id in spot_ids that is free for the whole window, or None.
+
+        Each spot is one binary search over its own windows, so the cost is
+        O(spots x log windows per spot) in the worst case, when every spot
+        but the last clashes; the scan stops at the first free spot.
+        """
+        self._ensure_loaded()
+        with self._lock:
+            for spot_id in spot_ids:
+                if self._is_free(spot_id, start_time, end_time):
+                    return spot_id
+        return None
+
+    def reserve(self, spot_ids, start_time, end_time, booking_id_factory):
+        """Atomically pick the first free spot and hold the window on it, at the cost of first_free_spot.
+
+        booking_id_factory(spot_id) creates the booking and returns its id; it
+        runs under the schedule lock so two requests cannot take the same
+        window. Returns the chosen spot id, or None if every spot clashes.
+        """
+        self._ensure_loaded()
+        with self._lock:
+            for spot_id in spot_ids:
+                if self._is_free(spot_id, start_time, end_time):
+                    booking_id = booking_id_factory(spot_id)
+                    starts = self._starts.setdefault(spot_id, [])
+                    position = bisect.bisect_left(starts, start_time)
+                    starts.insert(position, start_time)
+                    self._windows.setdefault(spot_id, []).insert(position, (end_time, booking_id))
+                    return spot_id
+        return None
+
+    def remove(self, spot_id, start_time, booking_id):
+        with self._lock:
+            starts = self._starts.get(spot_id, [])
+            position = bisect.bisect_left(starts, start_time)
+            if position < len(starts) and self._windows[spot_id][position][1] == booking_id:
+                del starts[position]
+                del self._windows[spot_id][position]
+
+spot_schedule = SpotSchedule()
+
+def held_for_advance_booking():
+    """Allocator skip predicate: true for spots with a scheduled window now or within the hold period"""
+    now = to_local_naive(datetime.now(indian_timezone))
+    hold_end = now + timedelta(minutes=app.config['ADVANCE_BOOKING_HOLD_MINUTES'])
+    return lambda spot_id: not spot_schedule.is_free(spot_id, now, hold_end)
+
+def starts_within_hold(start_time):
+    """Whether a window starts soon enough that a park-now driver may still be on its spot.
+
+    A park-now stay has no end time, so such windows only go to spots that
+    are free right now. Later windows may use any spot of the lot; if a
+    walk-in is still there at check-in, another free spot is assigned.
+    """
+    now = to_local_naive(datetime.now(indian_timezone))
+    return start_time < now + timedelta(minutes=app.config['ADVANCE_BOOKING_HOLD_MINUTES'])
+
+def advance_booking_spot_ids(lot_id, start_time):
+    """The spots of a lot, lowest number first, that may take an advance booking starting at start_time"""
+    if starts_within_hold(start_time):
+        return spot_allocator.free_spot_ids(lot_id)
+    return [spot_id for (spot_id,) in db.session.query(ParkingSpot.id)
+            .filter(ParkingSpot.lot_id == lot_id, ParkingSpot.status != 'R').order_by(ParkingSpot.spot_number)]
+
+def parse_booking_window(values):
+    """Read start and end (ISO 8601, local time) and check the window lies in the future"""
+    start_time = to_local_naive(datetime.fromisoformat(values.get('start') or ''))
+    end_time = to_local_naive(datetime.fromisoformat(values.get('end') or ''))
+    if end_time <= start_time:
+        raise ValueError('end must be after start')
+    if start_time < to_local_naive(datetime.now(indian_timezone)):
+        raise ValueError('start must be in the future')
+    return start_time, end_time
+
+# Write-behind booking queue
+app.config['WRITE_BEHIND'] = os.environ.get('WRITE_BEHIND', '0') == '1'
+app.config['WRITE_BEHIND_BATCH_SIZE'] = int(os.environ.get('WRITE_BEHIND_BATCH_SIZE', '50'))
+app.config['WRITE_BEHIND_LOG'] = os.environ.get('WRITE_BEHIND_LOG', os.path.join(app.instance_path, 'write_behind.log'))
+
+class WriteBehindQueue:
+    """Answers bookings and releases from memory and writes them to the database in batches.
+
+    Spot assignment and the one-active-reservation-per-user rule are decided
+    in memory under a single lock, so the user gets an answer immediately.
+    Each operation is appended and fsynced to a local log before it is
+    queued; one writer thread then applies up to batch_size operations per
+    transaction. On startup the log is replayed (operations that already
+    reached the database are skipped) before any new work is accepted. A
+    batch that fails to commit is retried with exponential backoff rather
+    than dropped, because memory already reflects it; later operations wait
+    behind it so their order is kept. This mode assumes a single application
+    process.
+    """
+
+    RETRY_DELAY_SECONDS = 0.5
+    MAX_RETRY_DELAY_SECONDS = 30
+
+    def __init__(self, log_path, batch_size):
+        self.log_path = log_path
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._started = False
+        self._log_file = None
+        self._active_by_user = {}
+        self._next_reservation_id = 1
+        self._logged_sequence = 0
+
+    def start(self):
+        """Replay the log, load the in-memory state and start the writer thread (idempotent)"""
+        with self._lock:
+            if self._started:
+                return
+            self._replay_log()
+            spot_allocator.load()
+            occupancy_cache.load()
+            self._load_state()
+            self._log_file = open(self.log_path, 'a')
+            threading.Thread(target=self._run, name='write-behind', daemon=True).start()
+            self._started = True
+
+    def _replay_log(self):
+        if not os.path.exists(self.log_path):
+            return
+        with open(self.log_path) as log_file:
+            operations = [json.loads(line) for line in log_file if line.strip()]
+        for operation in operations:
+            self._apply(operation)
+        db.session.commit()
+        open(self.log_path, 'w').close()
+
+    def _load_state(self):
+        active_reservations = db.session.query(
+            Reservation.id, Reservation.user_id, Reservation.spot_id, Reservation.entry_time, ParkingSpot.lot_id
+        ).join(ParkingSpot, Reservation.spot_id == ParkingSpot.id).filter(Reservation.status == 'active')
+        self._active_by_user = {
+            user_id: {'reservation_id': reservation_id, 'spot_id': spot_id, 'lot_id': lot_id, 'entry_time': entry_time}
+            for reservation_id, user_id, spot_id, entry_time, lot_id in active_reservations
+        }
+        self._next_reservation_id = max(
+            db.session.query(func.max(Reservation.id)).scalar() or 0,
+            db.session.query(func.max(ReservationArchive.id)).scalar() or 0
+        ) + 1
+
+    def _submit(self, operation):
+        # Callers hold the lock, so the log and the queue see operations in the same order
+        self._logged_sequence += 1
+        operation['sequence'] = self._logged_sequence
+        self._log_file.write(json.dumps(operation) + '\n')
+        self._log_file.flush()
+        os.fsync(self._log_file.fileno())
+        self._queue.put(operation)
+
+    def book(self, user_id, lot_id, preferred_spot_id=None):
+        """Assign a spot to the user; returns the reservation id, 'active' or 'full'"""
+        self.start()
+        with self._lock:
+            if user_id in self._active_by_user:
+                return 'active'
+            if preferred_spot_id is not None and spot_allocator.take(lot_id, preferred_spot_id):
+                spot_id = preferred_spot_id
+            else:
+                spot_id = spot_allocator.allocate(lot_id, held_for_advance_booking())
+            if spot_id is None:
+                return 'full'
+            entry_time = datetime.now(indian_timezone)
+            reservation_id = self._next_reservation_id
+            self._next_reservation_id += 1
+            self._submit({
+                'op': 'book', 'reservation_id': reservation_id, 'user_id': user_id, 'spot_id': spot_id,
+                'lot_id': lot_id, 'entry_time': entry_time.isoformat(),
+                'occupied_spots': occupancy_cache.lot_stats(lot_id)['occupied'] + 1
+            })
+            self._active_by_user[user_id] = {'reservation_id': reservation_id, 'spot_id': spot_id,
+                                             'lot_id': lot_id, 'entry_time': entry_time}
+            occupancy_cache.adjust(lot_id, 1)
+        return reservation_id
+
+    def release(self, user_id, reservation_id):
+        """Release the user's active reservation; returns its cost, or None if it is not theirs"""
+        self.start()
+        with self._lock:
+            active = self._active_by_user.get(user_id)
+            if not active or active['reservation_id'] != reservation_id:
+                return None
+            exit_time = datetime.now(indian_timezone)
+            entry_time = to_local_naive(active['entry_time'])
+            final_cost = Tariff.for_lot(db.session.get(ParkingLot, active['lot_id'])).price(entry_time, to_local_naive(exit_time))
+            self._submit({
+                'op': 'release', 'reservation_id': reservation_id, 'spot_id': active['spot_id'],
+                'lot_id': active['lot_id'], 'exit_time': exit_time.isoformat(), 'total_cost': final_cost,
+                'stay_seconds': (to_local_naive(exit_time) - entry_time).total_seconds(),
+                'occupied_spots': occupancy_cache.lot_stats(active['lot_id'])['occupied']
+            })
+            del self._active_by_user[user_id]
+            spot_allocator.release(active['lot_id'], active['spot_id'])
+            occupancy_cache.adjust(active['lot_id'], -1)
+        return final_cost
+
+    def _apply(self, operation):
+        """Apply one logged operation to the session, skipping it if the database already has it"""
+        reservation = db.session.get(Reservation, operation['reservation_id'])
+        if operation['op'] == 'book':
+            if reservation is not None:
+                return
+            entry_time = datetime.fromisoformat(operation['entry_time'])
+            db.session.add(Reservation(id=operation['reservation_id'], spot_id=operation['spot_id'],
+                                       user_id=operation['user_id'], entry_time=entry_time, status='active'))
+            db.session.execute(update(ParkingSpot).where(ParkingSpot.id == operation['spot_id']).values(status='O'))
+            record_booking_rollup(operation['lot_id'], entry_time, operation['occupied_spots'])
+        elif operation['op'] == 'release':
+            if reservation is None or reservation.status != 'active':
+                return
+            exit_time = datetime.fromisoformat(operation['exit_time'])
+            reservation.exit_time = exit_time
+            reservation.total_cost = operation['total_cost']
+            reservation.status = 'completed'
+            db.session.execute(update(ParkingSpot).where(ParkingSpot.id == operation['spot_id']).values(status='A'))
+            record_release_rollup(operation['lot_id'], exit_time, operation['stay_seconds'],
+                                  operation['total_cost'], operation['occupied_spots'])
+
+    def _run(self):
+        while True:
+            operations = [self._queue.get()]
+            while len(operations) < self.batch_size:
+                try:
+                    operations.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._write_batch(operations)
+            page_cache.invalidate('occupancy')
+            with self._lock:
+                if operations[-1]['sequence'] == self._logged_sequence:
+                    self._log_file.truncate(0)
+
+    def _write_batch(self, operations):
+        """Apply the operations in one transaction, retrying until it commits"""
+        delay = self.RETRY_DELAY_SECONDS
+        while True:
+            with app.app_context():
+                try:
+                    for operation in operations:
+                        self._apply(operation)
+                    db.session.commit()
+                    return
+                except Exception:
+                    db.session.rollback()
+                    # The log keeps the batch until it commits, so a restart would replay it as well
+                    app.logger.exception('Write-behind batch of %d operations failed, retrying in %.1f s',
+                                         len(operations), delay)
+            time.sleep(delay)
+            delay = min(delay * 2, self.MAX_RETRY_DELAY_SECONDS)
+
+write_behind_queue = WriteBehindQueue(app.config['WRITE_BEHIND_LOG'], app.config['WRITE_BEHIND_BATCH_SIZE'])
+
 # Routes
 @app.route('/')
+@page_cache.cached(ttl=300)
 def index():
     return render_template('index.html')
 
@@ -113,6 +1914,7 @@ def register():
         )
         db.session.add(new_user)
         db.session.commit()
+        page_cache.invalidate('users')
         
         flash('Registration successful! You can now login with your credentials.', 'success')
         return redirect(url_for('login'))
@@ -128,7 +1930,7 @@ def login():
         
         # First check if it's an admin login
         admin_user = Admin.query.filter_by(username=username).first()
-        if admin_user and check_password_hash(admin_user.password_hash, password):
+        if admin_user and verify_password(admin_user.password_hash, password):
             session['admin_id'] = admin_user.id
             session['admin_username'] = admin_user.username
             flash('Welcome back, Administrator!', 'success')
@@ -136,7 +1938,7 @@ def login():
         
         # If not admin, check if it's a regular user
         regular_user = User.query.filter_by(username=username).first()
-        if regular_user and check_password_hash(regular_user.password_hash, password):
+        if regular_user and verify_password(regular_user.password_hash, password):
             session['user_id'] = regular_user.id
             session['username'] = regular_user.username
             flash('Welcome back! You have successfully logged in.', 'success')
@@ -156,26 +1958,26 @@ def logout():
 
 # Admin Dashboard
 @app.route('/admin/dashboard')
+@page_cache.cached(tags=('lots', 'occupancy', 'users'), requires='admin_id')
 def admin_dashboard():
     if 'admin_id' not in session:
         flash('Please login as an administrator to access this page!', 'error')
         return redirect(url_for('login'))
     
-    all_parking_lots = ParkingLot.query.all()
+    all_parking_lots = active_parking_lots().all()
     all_users = User.query.all()
-    total_parking_spots = db.session.query(ParkingSpot).count()
-    currently_occupied_spots = db.session.query(ParkingSpot).filter_by(status='O').count()
-    currently_available_spots = total_parking_spots - currently_occupied_spots
+    spot_totals = occupancy_cache.totals()
     
     return render_template('admin_dashboard.html', 
                          parking_lots=all_parking_lots, 
                          users=all_users,
-                         total_spots=total_parking_spots,
-                         occupied_spots=currently_occupied_spots,
-                         available_spots=currently_available_spots)
+                         total_spots=spot_totals['total'],
+                         occupied_spots=spot_totals['occupied'],
+                         available_spots=spot_totals['available'])
 
 # Manage Parking Lots
 @app.route('/admin/parking_lots', methods=['GET', 'POST'])
+@page_cache.cached(tags=('lots', 'occupancy'), requires='admin_id')
 def manage_parking():
     if 'admin_id' not in session:
         flash('Please login as an administrator to access this page!', 'error')
@@ -187,32 +1989,44 @@ def manage_parking():
         address = request.form['address']
         pin_code = request.form['pin_code']
         total_spots = int(request.form['total_spots'])
+        try:
+            latitude, longitude = parse_coordinates(request.form)
+        except ValueError:
+            flash('Please enter a valid latitude and longitude, or leave both empty.', 'error')
+            return redirect(url_for('manage_parking'))
+        try:
+            tariff = parse_tariff(request.form)
+        except ValueError as error:
+            flash(f'Invalid tariff: {error}', 'error')
+            return redirect(url_for('manage_parking'))
         
         new_parking_lot = ParkingLot(
             location_name=location_name,
             hourly_rate=hourly_rate,
             address=address,
             pin_code=pin_code,
-            total_spots=total_spots
+            total_spots=total_spots,
+            latitude=latitude,
+            longitude=longitude,
+            **tariff
         )
         db.session.add(new_parking_lot)
-        db.session.commit()
+        db.session.flush()
         
         # Create individual parking spots for this lot
-        for spot_number in range(1, total_spots + 1):
-            new_spot = ParkingSpot(
-                lot_id=new_parking_lot.id,
-                spot_number=spot_number,
-                status='A'
-            )
-            db.session.add(new_spot)
+        add_parking_spots(new_parking_lot.id, total_spots)
         
         db.session.commit()
+        spot_allocator.reload_lot(new_parking_lot.id)
+        occupancy_cache.set_lot(new_parking_lot.id, total_spots)
+        lot_location_index.mark_stale()
+        page_cache.invalidate('lots', 'occupancy')
         flash('New parking lot has been created successfully!', 'success')
         return redirect(url_for('manage_parking'))
     
-    all_parking_lots = ParkingLot.query.all()
-    return render_template('manage_parking.html', parking_lots=all_parking_lots)
+    all_parking_lots = active_parking_lots().all()
+    lot_availability = {lot.id: occupancy_cache.lot_stats(lot.id)['available'] for lot in all_parking_lots}
+    return render_template('manage_parking.html', parking_lots=all_parking_lots, lot_availability=lot_availability)
 
 # Edit Parking Lot
 @app.route('/admin/edit_parking_lot/<int:lot_id>', methods=['GET', 'POST'])
@@ -221,7 +2035,7 @@ def edit_parking_lot(lot_id):
         flash('Please login as an administrator to access this page!', 'error')
         return redirect(url_for('login'))
     
-    parking_lot = ParkingLot.query.get_or_404(lot_id)
+    parking_lot = active_parking_lots().filter_by(id=lot_id).first_or_404()
     
     if request.method == 'POST':
         # Check if any spots are currently occupied
@@ -231,7 +2045,21 @@ def edit_parking_lot(lot_id):
             return redirect(url_for('manage_parking'))
         
         new_total_spots = int(request.form['total_spots'])
-        current_spots_count = ParkingSpot.query.filter_by(lot_id=lot_id).count()
+        current_spots_count = ParkingSpot.query.filter(ParkingSpot.lot_id == lot_id, ParkingSpot.status != 'R').count()
+        try:
+            latitude, longitude = parse_coordinates(request.form)
+        except ValueError:
+            flash('Please enter a valid latitude and longitude, or leave both empty.', 'error')
+            return redirect(url_for('edit_parking_lot', lot_id=lot_id))
+        try:
+            tariff = parse_tariff(request.form)
+        except ValueError as error:
+            flash(f'Invalid tariff: {error}', 'error')
+            return redirect(url_for('edit_parking_lot', lot_id=lot_id))
+        
+        parking_lot.latitude, parking_lot.longitude = latitude, longitude
+        for field, value in tariff.items():
+            setattr(parking_lot, field, value)
         
         parking_lot.location_name = request.form['location_name']
         parking_lot.hourly_rate = float(request.form['hourly_rate'])
@@ -241,15 +2069,21 @@ def edit_parking_lot(lot_id):
         
         # Add or remove spots as needed
         if new_total_spots > current_spots_count:
-            for spot_number in range(current_spots_count + 1, new_total_spots + 1):
-                new_spot = ParkingSpot(lot_id=lot_id, spot_number=spot_number, status='A')
-                db.session.add(new_spot)
+            add_parking_spots(lot_id, new_total_spots - current_spots_count)
         elif new_total_spots < current_spots_count:
-            spots_to_remove = ParkingSpot.query.filter_by(lot_id=lot_id).limit(current_spots_count - new_total_spots).all()
-            for spot in spots_to_remove:
-                db.session.delete(spot)
+            # Remove the highest numbered spots; those with reservation history are retired, not deleted
+            try:
+                remove_parking_spots(lot_id, new_total_spots)
+            except ValueError:
+                db.session.rollback()
+                flash('Cannot reduce the number of spots: the spots that would be removed have upcoming advance bookings.', 'error')
+                return redirect(url_for('edit_parking_lot', lot_id=lot_id))
         
         db.session.commit()
+        spot_allocator.reload_lot(lot_id)
+        occupancy_cache.set_lot(lot_id, new_total_spots)
+        lot_location_index.mark_stale()
+        page_cache.invalidate('lots', 'occupancy')
         flash('Parking lot information has been updated successfully!', 'success')
         return redirect(url_for('manage_parking'))
     
@@ -262,7 +2096,7 @@ def delete_parking_lot(lot_id):
         flash('Please login as an administrator to access this page!', 'error')
         return redirect(url_for('login'))
     
-    parking_lot = ParkingLot.query.get_or_404(lot_id)
+    parking_lot = active_parking_lots().filter_by(id=lot_id).first_or_404()
     
     # Check if any spots are currently occupied
     occupied_spots_count = ParkingSpot.query.filter_by(lot_id=lot_id, status='O').count()
@@ -270,8 +2104,23 @@ def delete_parking_lot(lot_id):
         flash('Cannot delete parking lot while spots are occupied! Please wait for all spots to be vacated.', 'error')
         return redirect(url_for('manage_parking'))
     
-    db.session.delete(parking_lot)
+    # Spots with reservation history are retired rather than deleted, and then the lot is retired along with them
+    try:
+        remove_parking_spots(lot_id, 0)
+    except ValueError:
+        db.session.rollback()
+        flash('Cannot delete parking lot while it has upcoming advance bookings.', 'error')
+        return redirect(url_for('manage_parking'))
+    if ParkingSpot.query.filter_by(lot_id=lot_id).first():
+        parking_lot.retired_at = datetime.utcnow()
+        parking_lot.total_spots = 0
+    else:
+        db.session.delete(parking_lot)
     db.session.commit()
+    spot_allocator.remove_lot(lot_id)
+    occupancy_cache.remove_lot(lot_id)
+    lot_location_index.mark_stale()
+    page_cache.invalidate('lots', 'occupancy')
     flash('Parking lot has been deleted successfully!', 'success')
     return redirect(url_for('manage_parking'))
 
@@ -281,14 +2130,21 @@ def admin_parking_spots(lot_id):
         flash('Please login as an administrator to access this page!', 'error')
         return redirect(url_for('login'))
     
-    parking_lot = ParkingLot.query.get_or_404(lot_id)
-    all_spots = ParkingSpot.query.filter_by(lot_id=lot_id).all()
+    parking_lot = active_parking_lots().filter_by(id=lot_id).first_or_404()
+    all_spots = ParkingSpot.query.filter(ParkingSpot.lot_id == lot_id, ParkingSpot.status != 'R') \
+        .order_by(ParkingSpot.spot_number).all()
+    
+    # Load every active reservation in this lot together with its user in one query
+    active_reservations = Reservation.query.options(joinedload(Reservation.user)) \
+        .join(ParkingSpot, Reservation.spot_id == ParkingSpot.id) \
+        .filter(ParkingSpot.lot_id == lot_id, Reservation.status == 'active').all()
+    reservations_by_spot = {reservation.spot_id: reservation for reservation in active_reservations}
     
     # Get reservation details for occupied spots
     spots_with_details = []
     for spot in all_spots:
         if spot.status == 'O':
-            current_reservation = Reservation.query.filter_by(spot_id=spot.id, status='active').first()
+            current_reservation = reservations_by_spot.get(spot.id)
             if current_reservation:
                 # Calculate duration for occupied spots
                 duration_info = calculate_parking_duration(current_reservation.entry_time)
@@ -317,37 +2173,84 @@ def user_dashboard():
     
     user_id = session['user_id']
     current_reservations = Reservation.query.filter_by(user_id=user_id, status='active').all()
-    past_reservations = Reservation.query.filter_by(user_id=user_id, status='completed').limit(10).all()
+    past_reservations, next_cursor = reservation_history_page(user_id, request.args.get('cursor'))
     
-    # Calculate durations for current reservations
-    for reservation in current_reservations:
-        duration_info = calculate_parking_duration(reservation.entry_time)
+    # Calculate durations and costs so far for current reservations
+    now = datetime.now(indian_timezone)
+    current_costs = price_stays(
+        (reservation.entry_time, now, reservation.parking_spot.lot_id) for reservation in current_reservations
+    )
+    for reservation, current_cost in zip(current_reservations, current_costs):
+        duration_info = calculate_parking_duration(reservation.entry_time, now)
         reservation.duration_hours = duration_info['hours']
         reservation.duration_minutes = duration_info['minutes']
-        reservation.current_cost = duration_info['total_hours'] * reservation.parking_spot.parking_lot.hourly_rate
+        reservation.current_cost = current_cost
     
-    # Calculate total parking time and cost
-    total_parking_hours = 0
-    total_parking_cost = 0
+    # Calculate durations for this page of history
     for reservation in past_reservations:
         if reservation.exit_time:
             duration_info = calculate_parking_duration(reservation.entry_time, reservation.exit_time)
             reservation.duration_hours = duration_info['hours']
             reservation.duration_minutes = duration_info['minutes']
-            total_parking_hours += duration_info['total_hours']
-            total_parking_cost += reservation.total_cost
         else:
             reservation.duration_hours = 0
             reservation.duration_minutes = 0
     
+    # Lifetime totals come from a single aggregate over the whole history
+    parking_totals = user_parking_totals(user_id)
+    
+    upcoming_bookings = AdvanceBooking.query.options(
+        joinedload(AdvanceBooking.parking_spot).joinedload(ParkingSpot.parking_lot)
+    ).filter(
+        AdvanceBooking.user_id == user_id,
+        AdvanceBooking.status == 'scheduled',
+        AdvanceBooking.end_time > to_local_naive(now)
+    ).order_by(AdvanceBooking.start_time).all()
+    
+    check_in_horizon = to_local_naive(now) + timedelta(minutes=app.config['ADVANCE_BOOKING_HOLD_MINUTES'])
+    
     return render_template('user_dashboard.html',
                          active_reservations=current_reservations,
+                         upcoming_bookings=upcoming_bookings,
+                         check_in_horizon=check_in_horizon,
                          completed_reservations=past_reservations,
-                         total_parking_time=round(total_parking_hours, 2),
-                         total_cost=round(total_parking_cost, 2))
+                         completed_sessions=parking_totals['completed_sessions'],
+                         next_cursor=next_cursor,
+                         is_first_page=not request.args.get('cursor'),
+                         total_parking_time=round(parking_totals['total_hours'], 2),
+                         total_cost=round(parking_totals['total_cost'], 2))
+
+# Reservation History API
+@app.route('/api/user/reservations')
+def reservation_history():
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized access'}), 401
+    
+    try:
+        limit = min(max(int(request.args.get('limit', HISTORY_PAGE_SIZE)), 1), MAX_HISTORY_PAGE_SIZE)
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+    
+    cursor = request.args.get('cursor')
+    if cursor and decode_history_cursor(cursor) is None:
+        return jsonify({'error': 'Invalid cursor'}), 400
+    
+    past_reservations, next_cursor = reservation_history_page(session['user_id'], cursor, limit)
+    return jsonify({
+        'reservations': [{
+            'id': reservation.id,
+            'lot': reservation.parking_spot.parking_lot.location_name,
+            'spot_number': reservation.parking_spot.spot_number,
+            'entry_time': reservation.entry_time.isoformat(),
+            'exit_time': reservation.exit_time.isoformat() if reservation.exit_time else None,
+            'total_cost': round(reservation.total_cost, 2)
+        } for reservation in past_reservations],
+        'next_cursor': next_cursor
+    })
 
 # Book Parking
 @app.route('/user/book_parking')
+@page_cache.cached(tags=('lots', 'occupancy'), unless=lambda: request.args.get('q'), requires='user_id')
 def book_parking():
     if 'user_id' not in session:
         flash('Please login to book parking!', 'error')
@@ -356,18 +2259,13 @@ def book_parking():
     search_query = request.args.get('q', '').strip()
     
     if search_query:
-        # Case-insensitive search on location name, address, or pin code
-        matching_lots = ParkingLot.query.filter(
-            (ParkingLot.location_name.ilike(f'%{search_query}%')) |
-            (ParkingLot.address.ilike(f'%{search_query}%')) |
-            (ParkingLot.pin_code.ilike(f'%{search_query}%'))
-        ).all()
+        matching_lots = search_parking_lots(search_query)
     else:
-        matching_lots = ParkingLot.query.all()
+        matching_lots = active_parking_lots().all()
     
     lots_with_availability = []
     for lot in matching_lots:
-        available_spots_count = ParkingSpot.query.filter_by(lot_id=lot.id, status='A').count()
+        available_spots_count = occupancy_cache.lot_stats(lot.id)['available']
         if available_spots_count > 0:
             lots_with_availability.append({
                 'lot': lot,
@@ -384,31 +2282,50 @@ def book_spot(lot_id):
     
     user_id = session['user_id']
     
+    if app.config['WRITE_BEHIND']:
+        booking = write_behind_queue.book(user_id, lot_id)
+        if booking == 'active':
+            flash('You already have an active parking reservation! Please release your current spot first.', 'error')
+            return redirect(url_for('user_dashboard'))
+        if booking == 'full':
+            flash('Sorry, no available spots in this parking lot at the moment!', 'error')
+            return redirect(url_for('book_parking'))
+        flash('Congratulations! Your parking spot has been booked successfully!', 'success')
+        return redirect(url_for('user_dashboard'))
+    
     # Check if user already has an active reservation
     existing_reservation = Reservation.query.filter_by(user_id=user_id, status='active').first()
     if existing_reservation:
         flash('You already have an active parking reservation! Please release your current spot first.', 'error')
         return redirect(url_for('user_dashboard'))
     
-    # Find available spot
-    available_spot = ParkingSpot.query.filter_by(lot_id=lot_id, status='A').first()
-    if not available_spot:
+    # Occupancy before this booking, read before the claim changes the database
+    occupied_spots = occupancy_cache.lot_stats(lot_id)['occupied']
+    
+    # Claim an available spot (marks it occupied in this transaction), leaving spots booked in advance
+    available_spot_id = spot_allocator.claim_spot(lot_id, skip=held_for_advance_booking())
+    if available_spot_id is None:
         flash('Sorry, no available spots in this parking lot at the moment!', 'error')
         return redirect(url_for('book_parking'))
     
     # Create new reservation
     new_reservation = Reservation(
-        spot_id=available_spot.id,
+        spot_id=available_spot_id,
         user_id=user_id,
         entry_time=datetime.now(indian_timezone),
         status='active'
     )
     
-    # Update spot status to occupied
-    available_spot.status = 'O'
-    
     db.session.add(new_reservation)
-    db.session.commit()
+    try:
+        record_booking_rollup(lot_id, new_reservation.entry_time, occupied_spots + 1)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        spot_allocator.release(lot_id, available_spot_id)
+        raise
+    occupancy_cache.adjust(lot_id, 1)
+    page_cache.invalidate('occupancy')
     
     flash('Congratulations! Your parking spot has been booked successfully!', 'success')
     return redirect(url_for('user_dashboard'))
@@ -420,16 +2337,30 @@ def release_spot(reservation_id):
         return redirect(url_for('login'))
     
     user_id = session['user_id']
+    
+    if app.config['WRITE_BEHIND']:
+        final_cost = write_behind_queue.release(user_id, reservation_id)
+        if final_cost is None:
+            flash('Reservation not found! Please check your dashboard.', 'error')
+        else:
+            flash(f'Spot released successfully! Your total parking cost is: ${final_cost:.2f}', 'success')
+        return redirect(url_for('user_dashboard'))
+    
     reservation = Reservation.query.filter_by(id=reservation_id, user_id=user_id, status='active').first()
     
     if not reservation:
         flash('Reservation not found! Please check your dashboard.', 'error')
         return redirect(url_for('user_dashboard'))
     
-    # Calculate cost using the calculate_parking_duration function
+    released_spot = reservation.parking_spot
+    occupied_spots = occupancy_cache.lot_stats(released_spot.lot_id)['occupied']
+    
+    # Calculate cost using the lot's tariff
     exit_time = datetime.now(indian_timezone)
     duration_info = calculate_parking_duration(reservation.entry_time, exit_time)
-    final_cost = duration_info['total_hours'] * reservation.parking_spot.parking_lot.hourly_rate
+    final_cost = Tariff.for_lot(released_spot.parking_lot).price(
+        to_local_naive(reservation.entry_time), to_local_naive(exit_time)
+    )
     
     # Update reservation
     reservation.exit_time = exit_time
@@ -437,46 +2368,424 @@ def release_spot(reservation_id):
     reservation.status = 'completed'
     
     # Update spot status to available
-    reservation.parking_spot.status = 'A'
+    released_spot.status = 'A'
+    record_release_rollup(released_spot.lot_id, exit_time, duration_info['total_seconds'], final_cost, occupied_spots)
     
     db.session.commit()
+    spot_allocator.release(released_spot.lot_id, released_spot.id)
+    occupancy_cache.adjust(released_spot.lot_id, -1)
+    page_cache.invalidate('occupancy')
     
     flash(f'Spot released successfully! Your total parking cost is: ${final_cost:.2f}', 'success')
     return redirect(url_for('user_dashboard'))
 
+# Advance Bookings
+@app.route('/user/schedule_parking/<int:lot_id>', methods=['POST'])
+def schedule_parking(lot_id):
+    if 'user_id' not in session:
+        flash('Please login to book parking!', 'error')
+        return redirect(url_for('login'))
+    
+    parking_lot = active_parking_lots().filter_by(id=lot_id).first_or_404()
+    try:
+        start_time, end_time = parse_booking_window(request.form)
+    except ValueError:
+        flash('Please choose a valid future time window for your booking.', 'error')
+        return redirect(url_for('book_parking'))
+    
+    def create_booking(spot_id):
+        booking = AdvanceBooking(spot_id=spot_id, user_id=session['user_id'],
+                                 start_time=start_time, end_time=end_time, status='scheduled')
+        db.session.add(booking)
+        db.session.flush()
+        return booking.id
+    
+    spot_id = spot_schedule.reserve(advance_booking_spot_ids(lot_id, start_time), start_time, end_time, create_booking)
+    if spot_id is None:
+        db.session.rollback()
+        flash('Sorry, no spot in this parking lot is free for the whole time window!', 'error')
+        return redirect(url_for('book_parking'))
+    try:
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        spot_schedule.load()
+        raise
+    
+    flash(f'Your spot at {parking_lot.location_name} is booked from {start_time:%Y-%m-%d %H:%M} to {end_time:%Y-%m-%d %H:%M}!', 'success')
+    return redirect(url_for('user_dashboard'))
+
+@app.route('/user/start_booking/<int:booking_id>')
+def start_booking(booking_id):
+    if 'user_id' not in session:
+        flash('Please login to manage your parking!', 'error')
+        return redirect(url_for('login'))
+    
+    user_id = session['user_id']
+    booking = AdvanceBooking.query.filter_by(id=booking_id, user_id=user_id, status='scheduled').first()
+    if not booking:
+        flash('Booking not found! Please check your dashboard.', 'error')
+        return redirect(url_for('user_dashboard'))
+    
+    now = datetime.now(indian_timezone)
+    check_in_from = booking.start_time - timedelta(minutes=app.config['ADVANCE_BOOKING_HOLD_MINUTES'])
+    if not check_in_from <= to_local_naive(now) < booking.end_time:
+        flash(f'You can check in from {check_in_from:%Y-%m-%d %H:%M} until {booking.end_time:%Y-%m-%d %H:%M}.', 'error')
+        return redirect(url_for('user_dashboard'))
+    
+    lot_id = booking.parking_spot.lot_id
+    if app.config['WRITE_BEHIND']:
+        reservation = write_behind_queue.book(user_id, lot_id, preferred_spot_id=booking.spot_id)
+        if reservation == 'active':
+            flash('You already have an active parking reservation! Please release your current spot first.', 'error')
+            return redirect(url_for('user_dashboard'))
+        if reservation == 'full':
+            flash('Sorry, your spot and every other spot in this parking lot are taken at the moment!', 'error')
+            return redirect(url_for('user_dashboard'))
+        booking.status = 'checked_in'
+        db.session.commit()
+        spot_schedule.remove(booking.spot_id, booking.start_time, booking.id)
+        flash('You are checked in. Enjoy your parking!', 'success')
+        return redirect(url_for('user_dashboard'))
+    
+    if Reservation.query.filter_by(user_id=user_id, status='active').first():
+        flash('You already have an active parking reservation! Please release your current spot first.', 'error')
+        return redirect(url_for('user_dashboard'))
+    
+    occupied_spots = occupancy_cache.lot_stats(lot_id)['occupied']
+    # The booked spot is normally free; if a walk-in is still on it, any other free spot will do
+    spot_id = spot_allocator.claim_spot(lot_id, skip=held_for_advance_booking(), preferred_spot_id=booking.spot_id)
+    if spot_id is None:
+        flash('Sorry, your spot and every other spot in this parking lot are taken at the moment!', 'error')
+        return redirect(url_for('user_dashboard'))
+    
+    new_reservation = Reservation(spot_id=spot_id, user_id=user_id, entry_time=now, status='active')
+    db.session.add(new_reservation)
+    booking.status = 'checked_in'
+    try:
+        record_booking_rollup(lot_id, new_reservation.entry_time, occupied_spots + 1)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        spot_allocator.release(lot_id, spot_id)
+        raise
+    spot_schedule.remove(booking.spot_id, booking.start_time, booking.id)
+    occupancy_cache.adjust(lot_id, 1)
+    page_cache.invalidate('occupancy')
+    
+    flash('You are checked in. Enjoy your parking!', 'success')
+    return redirect(url_for('user_dashboard'))
+
+@app.route('/user/cancel_booking/<int:booking_id>')
+def cancel_booking(booking_id):
+    if 'user_id' not in session:
+        flash('Please login to manage your parking!', 'error')
+        return redirect(url_for('login'))
+    
+    booking = AdvanceBooking.query.filter_by(id=booking_id, user_id=session['user_id'], status='scheduled').first()
+    if not booking:
+        flash('Booking not found! Please check your dashboard.', 'error')
+        return redirect(url_for('user_dashboard'))
+    
+    booking.status = 'cancelled'
+    db.session.commit()
+    spot_schedule.remove(booking.spot_id, booking.start_time, booking.id)
+    
+    flash('Your advance booking has been cancelled.', 'success')
+    return redirect(url_for('user_dashboard'))
+
+@app.route('/api/spots/<int:spot_id>/availability')
+def spot_availability(spot_id):
+    if 'user_id' not in session and 'admin_id' not in session:
+        return jsonify({'error': 'Unauthorized access'}), 401
+    
+    try:
+        start_time, end_time = parse_booking_window(request.args)
+    except ValueError as error:
+        return jsonify({'error': str(error)}), 400
+    
+    spot = db.session.get(ParkingSpot, spot_id)
+    if spot is None or spot.status == 'R':
+        return jsonify({'error': 'Parking spot not found'}), 404
+    available = spot_schedule.is_free(spot_id, start_time, end_time) \
+        and (spot.status == 'A' or not starts_within_hold(start_time))
+    return jsonify({'spot_id': spot_id, 'available': available})
+
+@app.route('/api/lots/<int:lot_id>/free_spot')
+def lot_free_spot(lot_id):
+    if 'user_id' not in session and 'admin_id' not in session:
+        return jsonify({'error': 'Unauthorized access'}), 401
+    
+    try:
+        start_time, end_time = parse_booking_window(request.args)
+    except ValueError as error:
+        return jsonify({'error': str(error)}), 400
+    
+    spot_id = spot_schedule.first_free_spot(advance_booking_spot_ids(lot_id, start_time), start_time, end_time)
+    return jsonify({'lot_id': lot_id, 'spot_id': spot_id, 'available': spot_id is not None})
+
+# Nearby Parking API
+@app.route('/api/lots/nearby')
+def nearby_lots():
+    if 'user_id' not in session and 'admin_id' not in session:
+        return jsonify({'error': 'Unauthorized access'}), 401
+    
+    try:
+        latitude, longitude = parse_coordinates({'latitude': request.args.get('lat'), 'longitude': request.args.get('lng')})
+        result_count = int(request.args.get('k', NEARBY_DEFAULT_RESULTS))
+    except ValueError:
+        return jsonify({'error': 'lat, lng and k must be valid numbers'}), 400
+    if latitude is None:
+        return jsonify({'error': 'lat and lng are required'}), 400
+    result_count = min(max(result_count, 1), NEARBY_MAX_RESULTS)
+    
+    nearest = lot_location_index.nearest(
+        latitude, longitude, result_count,
+        include=lambda lot_id: occupancy_cache.lot_stats(lot_id)['available'] > 0
+    )
+    lots_by_id = {lot.id: lot for lot in active_parking_lots().filter(ParkingLot.id.in_([lot_id for _, lot_id in nearest]))}
+    
+    nearby = []
+    for distance_km, lot_id in nearest:
+        lot = lots_by_id.get(lot_id)
+        if lot is None:
+            continue
+        nearby.append({
+            'id': lot.id,
+            'name': lot.location_name,
+            'address': lot.address,
+            'pin_code': lot.pin_code,
+            'latitude': lot.latitude,
+            'longitude': lot.longitude,
+            'hourly_rate': lot.hourly_rate,
+            'distance_km': round(distance_km, 3),
+            'available_spots': occupancy_cache.lot_stats(lot.id)['available']
+        })
+    
+    return jsonify({'lots': nearby})
+
+# Live Availability Stream
+AVAILABILITY_COALESCE_SECONDS = 0.5
+AVAILABILITY_KEEPALIVE_SECONDS = 15
+
+def server_sent_event(event, data):
+    return f'event: {event}\ndata: {json.dumps(data)}\n\n'
+
+@app.route('/api/availability/stream')
+def availability_stream():
+    if 'user_id' not in session and 'admin_id' not in session:
+        return jsonify({'error': 'Unauthorized access'}), 401
+    
+    version, lot_counts = occupancy_cache.snapshot()
+    
+    def events(version):
+        yield server_sent_event('snapshot', {'version': version, 'lots': lot_counts})
+        while True:
+            new_version, changed_lots = occupancy_cache.wait_for_changes(version, AVAILABILITY_KEEPALIVE_SECONDS)
+            if new_version == version:
+                yield ': keep-alive\n\n'
+                continue
+            # Let a burst of bookings settle so it goes out as a single event
+            time.sleep(AVAILABILITY_COALESCE_SECONDS)
+            version, changed_lots = occupancy_cache.wait_for_changes(version, 0)
+            yield server_sent_event('availability', {'version': version, 'lots': changed_lots})
+    
+    return Response(events(version), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 # Parking Statistics API
 @app.route('/api/parking_stats')
 def parking_stats():
     if 'admin_id' not in session:
         return jsonify({'error': 'Unauthorized access'}), 401
     
-    total_parking_spots = db.session.query(ParkingSpot).count()
-    currently_occupied_spots = db.session.query(ParkingSpot).filter_by(status='O').count()
-    currently_available_spots = total_parking_spots - currently_occupied_spots
+    spot_totals = occupancy_cache.totals()
     
     # Get parking lot statistics
-    all_lots = ParkingLot.query.all()
+    all_lots = active_parking_lots().all()
     lot_statistics = []
     for lot in all_lots:
-        lot_total_spots = ParkingSpot.query.filter_by(lot_id=lot.id).count()
-        lot_occupied_spots = ParkingSpot.query.filter_by(lot_id=lot.id, status='O').count()
+        lot_counts = occupancy_cache.lot_stats(lot.id)
         lot_statistics.append({
             'name': lot.location_name,
-            'total': lot_total_spots,
-            'occupied': lot_occupied_spots,
-            'available': lot_total_spots - lot_occupied_spots
+            'total': lot_counts['total'],
+            'occupied': lot_counts['occupied'],
+            'available': lot_counts['available']
         })
     
     return jsonify({
-        'total_spots': total_parking_spots,
-        'occupied_spots': currently_occupied_spots,
-        'available_spots': currently_available_spots,
+        'total_spots': spot_totals['total'],
+        'occupied_spots': spot_totals['occupied'],
+        'available_spots': spot_totals['available'],
         'lot_stats': lot_statistics
     })
 
+# Metrics
+@app.route('/metrics')
+def metrics():
+    if not app.config['METRICS_ENABLED']:
+        return jsonify({'error': 'Metrics are disabled; set ENABLE_METRICS=1'}), 404
+    
+    cache_lines = ['# HELP parking_page_cache_requests_total Page cache lookups by result',
+                   '# TYPE parking_page_cache_requests_total counter']
+    for endpoint, counts in page_cache.stats().items():
+        cache_lines.append(f'parking_page_cache_requests_total{{endpoint="{endpoint}",result="hit"}} {counts["hits"]}')
+        cache_lines.append(f'parking_page_cache_requests_total{{endpoint="{endpoint}",result="miss"}} {counts["misses"]}')
+    return Response(request_metrics.prometheus_text() + '\n'.join(cache_lines) + '\n',
+                    mimetype='text/plain; version=0.0.4')
+
+# Cache Statistics API
+@app.route('/api/cache_stats')
+def cache_stats():
+    if 'admin_id' not in session:
+        return jsonify({'error': 'Unauthorized access'}), 401
+    
+    return jsonify({
+        'endpoints': page_cache.stats(),
+        'hits': sum(page_cache.hits.values()),
+        'misses': sum(page_cache.misses.values())
+    })
+
+# Analytics API
+@app.route('/api/analytics')
+def analytics():
+    if 'admin_id' not in session:
+        return jsonify({'error': 'Unauthorized access'}), 401
+    
+    granularity = request.args.get('granularity', 'hour')
+    if granularity not in ROLLUP_GRANULARITIES:
+        return jsonify({'error': 'granularity must be hour or day'}), 400
+    try:
+        start_time = to_local_naive(datetime.fromisoformat(request.args['start'])) if request.args.get('start') else None
+        end_time = to_local_naive(datetime.fromisoformat(request.args['end'])) if request.args.get('end') else None
+        lot_id = request.args.get('lot_id', type=int)
+    except ValueError:
+        return jsonify({'error': 'start and end must be ISO 8601 timestamps'}), 400
+    
+    buckets = []
+    for bucket_start, counts in rollup_series(granularity, lot_id, start_time, end_time):
+        completed_stays = counts['completed_stays']
+        buckets.append({
+            'bucket_start': bucket_start.isoformat(),
+            'peak_occupancy': counts['peak_occupancy'],
+            'bookings': counts['bookings'],
+            'completed_stays': completed_stays,
+            'average_stay_minutes': round(counts['total_stay_seconds'] / completed_stays / 60, 2) if completed_stays else None,
+            'revenue': round(counts['revenue'], 2)
+        })
+    
+    return jsonify({'granularity': granularity, 'lot_id': lot_id, 'buckets': buckets})
+
+# Reservation Export
+EXPORT_COLUMNS = ['reservation_id', 'username', 'lot_id', 'location_name', 'spot_number',
+                  'entry_time', 'exit_time', 'status', 'total_cost', 'tariff_cost']
+
+def parse_export_date(value):
+    """Parse a YYYY-MM-DD query argument, returning None when it is missing"""
+    return datetime.strptime(value, '%Y-%m-%d') if value else None
+
+def reservation_export_queries(start_date=None, end_date=None, lot_id=None):
+    """One query per table for the live and archived reservations to export, each ordered by (entry_time, id)"""
+    table_queries = []
+    for model in (Reservation, ReservationArchive):
+        table_query = select(
+            model.id, User.username, ParkingLot.id.label('lot_id'), ParkingLot.location_name,
+            ParkingSpot.spot_number, model.entry_time, model.exit_time, model.status, model.total_cost
+        ).join(ParkingSpot, model.spot_id == ParkingSpot.id) \
+         .join(ParkingLot, ParkingSpot.lot_id == ParkingLot.id) \
+         .join(User, model.user_id == User.id)
+        
+        # Date range filters on entry time; the end date is inclusive
+        if start_date:
+            table_query = table_query.where(model.entry_time >= start_date)
+        if end_date:
+            table_query = table_query.where(model.entry_time < end_date + timedelta(days=1))
+        if lot_id:
+            table_query = table_query.where(ParkingLot.id == lot_id)
+        table_queries.append(table_query.order_by(model.entry_time, model.id))
+    return table_queries
+
+def export_rows(table_queries):
+    """Yield export rows as dicts in (entry_time, id) order, fetching them from the database in batches.
+
+    Each query returns its rows in that order from an (entry_time, id)
+    index, so the live and archive tables are merged as they stream instead
+    of being sorted together by the database. Finished stays are repriced
+    under their lot's current tariff one batch at a time.
+    """
+    results = [
+        db.session.execute(table_query.execution_options(yield_per=EXPORT_BATCH_SIZE, stream_results=True))
+        for table_query in table_queries
+    ]
+    merged = heapq.merge(*results, key=lambda row: (row.entry_time, row.id))
+    tariffs = {}
+    while True:
+        batch = list(itertools.islice(merged, EXPORT_BATCH_SIZE))
+        if not batch:
+            return
+        tariff_costs = iter(price_stays(
+            ((row.entry_time, row.exit_time, row.lot_id) for row in batch if row.exit_time), tariffs
+        ))
+        for row in batch:
+            yield export_row(row, next(tariff_costs) if row.exit_time else None)
+
+def export_row(row, tariff_cost):
+    """One export row as a dict; tariff_cost is the stay priced under the lot's current tariff, None while it is active"""
+    return {
+        'reservation_id': row.id,
+        'username': row.username,
+        'lot_id': row.lot_id,
+        'location_name': row.location_name,
+        'spot_number': row.spot_number,
+        'entry_time': row.entry_time.isoformat() if row.entry_time else None,
+        'exit_time': row.exit_time.isoformat() if row.exit_time else None,
+        'status': row.status,
+        'total_cost': round(row.total_cost or 0, 2),
+        'tariff_cost': round(tariff_cost, 2) if tariff_cost is not None else None
+    }
+
+def csv_lines(rows):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_COLUMNS)
+    writer.writeheader()
+    for row in rows:
+        writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+def ndjson_lines(rows):
+    for row in rows:
+        yield json.dumps(row) + '\n'
+
+@app.route('/api/export/reservations')
+def export_reservations():
+    if 'admin_id' not in session:
+        return jsonify({'error': 'Unauthorized access'}), 401
+    
+    export_format = request.args.get('format', 'csv')
+    if export_format not in ('csv', 'ndjson'):
+        return jsonify({'error': 'format must be csv or ndjson'}), 400
+    try:
+        start_date = parse_export_date(request.args.get('start'))
+        end_date = parse_export_date(request.args.get('end'))
+        lot_id = request.args.get('lot_id', type=int)
+    except ValueError:
+        return jsonify({'error': 'start and end must be dates in YYYY-MM-DD format'}), 400
+    
+    rows = export_rows(reservation_export_queries(start_date, end_date, lot_id))
+    if export_format == 'csv':
+        body, mimetype = csv_lines(rows), 'text/csv'
+    else:
+        body, mimetype = ndjson_lines(rows), 'application/x-ndjson'
+    filename = f'reservations.{export_format}'
+    return Response(stream_with_context(body), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
+
 if __name__ == '__main__':
     with app.app_context():
-        db.create_all()
+        upgrade_database()
         
         # Create default administrator if not exists
         default_admin = Admin.query.filter_by(username='admin').first()
@@ -488,5 +2797,13 @@ if __name__ == '__main__':
             db.session.add(default_admin)
             db.session.commit()
             print("Default administrator account created - Username: admin, Password: admin123")
+        
+        # Load the free-spot lists, occupancy counters and booking schedule before serving requests
+        if app.config['WRITE_BEHIND']:
+            write_behind_queue.start()
+        else:
+            spot_allocator.load()
+            occupancy_cache.load()
+        spot_schedule.load()
     
     app.run(debug=True) 
\ No newline at end of file
@@ -0,0 +1,994 @@
+"""Load test and benchmark for every route in app.py.
+
+Seeds a synthetic dataset into a temporary SQLite database, measures each
+route through the Flask test client, then replays a mix of read routes over
+HTTP from several threads. Results are printed (or written) as JSON so runs
+can be compared; with --baseline the run fails when a route got slower or
+issues more SQL statements than the baseline by more than the threshold.
+
+    python benchmark.py --lots 50 --spots 40 --users 500 --reservations 20000 --output baseline.json
+    python benchmark.py --lots 50 --spots 40 --users 500 --reservations 20000 --baseline baseline.json
+
+Optional phases compare specific code paths on top of the route benchmarks:
+
+    python benchmark.py --http-requests 0 --write-behind-bookings 2000
+    python benchmark.py --http-requests 0 --sse-subscribers 1000
+    python benchmark.py --http-requests 0 --contention-bookings 5000 --threads 8
+    python benchmark.py --http-requests 0 --wal-comparison 200 --threads 4
+    python benchmark.py --http-requests 0 --search-lots 50000
+    python benchmark.py --http-requests 0 --nearby-lots 100000
+    python benchmark.py --http-requests 0 --pricing-stays 1000000
+"""
+import argparse
+import heapq
+import http.cookiejar
+import itertools
+import json
+import logging
+import math
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+AREAS = ['MG Road', 'FC Road', 'Koregaon Park', 'Baner', 'Hinjewadi', 'Kothrud', 'Viman Nagar', 'Camp', 'Aundh', 'Wakad']
+BENCHMARK_PASSWORD = 'benchmark'
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Benchmark every route of the parking application.')
+    parser.add_argument('--lots', type=int, default=20, help='parking lots to seed')
+    parser.add_argument('--spots', type=int, default=25, help='spots per parking lot')
+    parser.add_argument('--users', type=int, default=200, help='users to seed')
+    parser.add_argument('--reservations', type=int, default=5000, help='reservations to seed')
+    parser.add_argument('--iterations', type=int, default=30, help='measured requests per route through the test client')
+    parser.add_argument('--http-requests', type=int, default=1000, help='total requests sent by the HTTP load generator (0 to skip)')
+    parser.add_argument('--threads', type=int, default=8, help='HTTP load generator threads')
+    parser.add_argument('--seed', type=int, default=1, help='random seed for the synthetic dataset')
+    parser.add_argument('--no-page-cache', action='store_true', help='measure rendered pages without the page cache')
+    parser.add_argument('--write-behind-bookings', type=int, default=0,
+                        help='bookings to make with and without the write-behind queue to compare bookings/s (0 to skip)')
+    parser.add_argument('--sse-subscribers', type=int, default=0,
+                        help='availability streams to hold open while measuring event latency and memory (0 to skip)')
+    parser.add_argument('--contention-bookings', type=int, default=0,
+                        help='users booking one lot with half as many spots at the same time (0 to skip)')
+    parser.add_argument('--wal-comparison', type=int, default=0,
+                        help='bookings written while --threads admins read pages, with WAL and rollback journals (0 to skip)')
+    parser.add_argument('--search-lots', type=int, default=0,
+                        help='extra lots to add before timing full-text search against substring matching (0 to skip)')
+    parser.add_argument('--nearby-lots', type=int, default=0,
+                        help='extra lots to add before timing the KD-tree nearby lookup against a linear scan (0 to skip)')
+    parser.add_argument('--pricing-stays', type=int, default=0,
+                        help='stays to price in export-sized batches and one lot lookup at a time (0 to skip)')
+    parser.add_argument('--pricing-sample', type=int, default=20000,
+                        help='stays priced one lot lookup at a time in the pricing benchmark')
+    parser.add_argument('--output', help='write the JSON report to this file instead of stdout')
+    parser.add_argument('--baseline', help='JSON report of an earlier run to compare against')
+    parser.add_argument('--threshold', type=float, default=25.0,
+                        help='allowed p95 latency increase over the baseline, in percent')
+    parser.add_argument('--min-delta-ms', type=float, default=2.0,
+                        help='p95 increases smaller than this are treated as noise')
+    return parser.parse_args()
+
+def configure_environment(arguments, database_path):
+    """Point the application at the temporary database; must run before app is imported"""
+    os.environ['DATABASE_URL'] = f'sqlite:///{database_path}'
+    os.environ['WRITE_BEHIND'] = '0'
+    os.environ['WRITE_BEHIND_LOG'] = os.path.join(os.path.dirname(database_path), 'write_behind.log')
+    os.environ.pop('CACHE_REDIS_URL', None)
+    if arguments.no_page_cache:
+        os.environ['CACHE_MAX_ENTRIES'] = '0'
+
+# Synthetic dataset
+def seed_database(parking, arguments):
+    """Bulk insert the synthetic dataset and load the in-memory indexes"""
+    from sqlalchemy import insert, update
+    from werkzeug.security import generate_password_hash
+
+    db = parking.db
+    generator = random.Random(arguments.seed)
+    password_hash = generate_password_hash(BENCHMARK_PASSWORD)
+    parking.upgrade_database()
+
+    db.session.execute(insert(parking.Admin), [{'username': 'bench_admin', 'password_hash': password_hash}])
+    db.session.execute(insert(parking.User), [
+        {'username': f'bench_user{i}', 'email': f'bench_user{i}@example.com', 'password_hash': password_hash}
+        for i in range(arguments.users)
+    ])
+    lot_rates = {}
+    for i in range(arguments.lots):
+        area = AREAS[i % len(AREAS)]
+        hourly_rate = float(generator.choice([10, 20, 30, 40, 50]))
+        lot_id = db.session.execute(insert(parking.ParkingLot).values(
+            location_name=f'{area} Parking {i + 1}', hourly_rate=hourly_rate,
+            address=f'{i + 1} {area}, Pune', pin_code=str(411001 + i % 50), total_spots=arguments.spots,
+            latitude=18.45 + generator.random() * 0.2, longitude=73.75 + generator.random() * 0.2
+        )).inserted_primary_key[0]
+        lot_rates[lot_id] = hourly_rate
+        parking.add_parking_spots(lot_id, arguments.spots)
+
+    spots = db.session.query(parking.ParkingSpot.id, parking.ParkingSpot.lot_id).all()
+    users = db.session.query(parking.User.id, parking.User.username).order_by(parking.User.id).all()
+    user_ids = [user_id for user_id, _ in users]
+
+    # The first users park right now (one active reservation each), the rest only have history
+    active_count = min(arguments.reservations // 10, len(user_ids) // 2, len(spots) // 2)
+    active_spots = generator.sample(spots, active_count)
+    now = datetime.now()
+    reservations = []
+    for user_id, (spot_id, _) in zip(user_ids, active_spots):
+        reservations.append({'spot_id': spot_id, 'user_id': user_id, 'status': 'active',
+                             'entry_time': now - timedelta(minutes=generator.randint(5, 600))})
+    for _ in range(arguments.reservations - active_count):
+        spot_id, lot_id = generator.choice(spots)
+        entry_time = now - timedelta(days=90 * generator.random())
+        stay = timedelta(minutes=generator.randint(10, 720))
+        reservations.append({'spot_id': spot_id, 'user_id': generator.choice(user_ids), 'status': 'completed',
+                             'entry_time': entry_time, 'exit_time': entry_time + stay,
+                             'total_cost': round(stay.total_seconds() / 3600 * lot_rates[lot_id], 2)})
+    if reservations:
+        db.session.execute(insert(parking.Reservation), reservations)
+    if active_spots:
+        db.session.execute(update(parking.ParkingSpot)
+                           .where(parking.ParkingSpot.id.in_([spot_id for spot_id, _ in active_spots]))
+                           .values(status='O'))
+    db.session.commit()
+    parking.backfill_rollups()
+
+    parking.spot_allocator.load()
+    parking.occupancy_cache.load()
+    parking.spot_schedule.load()
+    summary = {
+        'lots': arguments.lots, 'spots_per_lot': arguments.spots, 'users': arguments.users,
+        'reservations': len(reservations), 'active_reservations': active_count
+    }
+    return {'summary': summary, 'parking_users': users[:active_count], 'free_users': users[active_count:],
+            'lot_ids': sorted(lot_rates)}
+
+# Measurement helpers
+class QueryCounter:
+    """Counts SQL statements per thread and in total"""
+
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.total = 0
+
+    def __call__(self, *args):
+        self._local.count = getattr(self._local, 'count', 0) + 1
+        with self._lock:
+            self.total += 1
+
+    @property
+    def current(self):
+        return getattr(self._local, 'count', 0)
+
+def summarize(samples, elapsed_seconds=None):
+    """Latency percentiles (nearest rank, in ms) and query counts for a list of (seconds, queries) samples"""
+    latencies = sorted(seconds * 1000 for seconds, _ in samples)
+
+    def percentile(fraction):
+        return round(latencies[max(0, math.ceil(fraction * len(latencies)) - 1)], 3)
+
+    summary = {
+        'requests': len(samples),
+        'p50_ms': percentile(0.50),
+        'p95_ms': percentile(0.95),
+        'p99_ms': percentile(0.99),
+        'max_ms': round(latencies[-1], 3),
+        'mean_ms': round(sum(latencies) / len(latencies), 3),
+    }
+    query_counts = [queries for _, queries in samples if queries is not None]
+    if query_counts:
+        summary['queries_per_request'] = round(sum(query_counts) / len(query_counts), 2)
+    if elapsed_seconds:
+        summary['requests_per_second'] = round(len(samples) / elapsed_seconds, 1)
+    return summary
+
+class RouteTimer:
+    """Times test client requests per route label and checks their status codes"""
+
+    def __init__(self, query_counter):
+        self.query_counter = query_counter
+        self.samples = defaultdict(list)
+        self.errors = []
+
+    def __call__(self, label, send, path, expected=(200,), **kwargs):
+        queries_before = self.query_counter.current
+        started = time.perf_counter()
+        response = send(path, **kwargs)
+        if kwargs.get('buffered') is False:
+            # Streaming responses are timed to their first chunk
+            next(iter(response.response))
+        else:
+            response.get_data()
+        elapsed = time.perf_counter() - started
+        self.samples[label].append((elapsed, self.query_counter.current - queries_before))
+        if response.status_code not in expected:
+            self.errors.append(f'{label}: {path} returned {response.status_code}')
+        response.close()
+        return response
+
+    def report(self):
+        return {label: summarize(samples) for label, samples in sorted(self.samples.items())}
+
+def logged_in_client(application, username):
+    client = application.test_client()
+    response = client.post('/login', data={'username': username, 'password': BENCHMARK_PASSWORD})
+    if response.status_code != 302:
+        raise RuntimeError(f'Could not log in as {username}')
+    return client
+
+# Test client phase
+def run_route_benchmarks(parking, dataset, arguments, query_counter):
+    """Measure every route with the test client, one request at a time"""
+    application, db = parking.app, parking.db
+    timer = RouteTimer(query_counter)
+    iterations = arguments.iterations
+    lot_ids = dataset['lot_ids']
+    admin = logged_in_client(application, 'bench_admin')
+    free_user_id, free_username = dataset['free_users'][0]
+    visitor = logged_in_client(application, free_username)
+    # Prefer a user who is parked right now so the dashboard shows an active reservation
+    reader = logged_in_client(application, dataset['parking_users'][0][1]) if dataset['parking_users'] else visitor
+    anonymous = application.test_client()
+    export_lot = lot_ids[0]
+    window_base = (datetime.now() + timedelta(days=2)).replace(minute=0, second=0, microsecond=0)
+
+    for i in range(iterations):
+        lot_id = lot_ids[i % len(lot_ids)]
+
+        # Public pages
+        timer('index', anonymous.get, '/')
+        timer('register GET', anonymous.get, '/register')
+        timer('register POST', anonymous.post, '/register', expected=(302,), data={
+            'username': f'bench_new{i}', 'email': f'bench_new{i}@example.com', 'password': BENCHMARK_PASSWORD})
+        timer('login GET', anonymous.get, '/login')
+        session_client = application.test_client()
+        timer('login POST', session_client.post, '/login', expected=(302,),
+              data={'username': f'bench_new{i}', 'password': BENCHMARK_PASSWORD})
+        timer('logout', session_client.get, '/logout', expected=(302,))
+
+        # Administrator pages and APIs
+        timer('admin_dashboard', admin.get, '/admin/dashboard')
+        timer('manage_parking GET', admin.get, '/admin/parking_lots')
+        timer('manage_parking POST', admin.post, '/admin/parking_lots', expected=(302,), data={
+            'location_name': f'Benchmark Lot {i}', 'hourly_rate': '25', 'address': 'Benchmark Road, Pune',
+            'pin_code': '411099', 'total_spots': str(arguments.spots)})
+        with application.app_context():
+            new_lot_id = db.session.query(db.func.max(parking.ParkingLot.id)).scalar()
+        timer('delete_parking_lot', admin.get, f'/admin/delete_parking_lot/{new_lot_id}', expected=(302,))
+        timer('edit_parking_lot GET', admin.get, f'/admin/edit_parking_lot/{lot_id}')
+        with application.app_context():
+            lot = db.session.get(parking.ParkingLot, lot_id)
+            lot_form = {'location_name': lot.location_name, 'hourly_rate': str(lot.hourly_rate),
+                        'address': lot.address, 'pin_code': lot.pin_code, 'total_spots': str(lot.total_spots),
+                        'latitude': '' if lot.latitude is None else str(lot.latitude),
+                        'longitude': '' if lot.longitude is None else str(lot.longitude)}
+        timer('edit_parking_lot POST', admin.post, f'/admin/edit_parking_lot/{lot_id}', expected=(302,), data=lot_form)
+        timer('admin_parking_spots', admin.get, f'/admin/parking_spots/{lot_id}')
+        timer('parking_stats', admin.get, '/api/parking_stats')
+        timer('metrics', admin.get, '/metrics', expected=(200, 404))
+        timer('cache_stats', admin.get, '/api/cache_stats')
+        timer('analytics hour', admin.get, '/api/analytics?granularity=hour')
+        timer('analytics day', admin.get, f'/api/analytics?granularity=day&lot_id={lot_id}')
+        timer('export csv', admin.get, f'/api/export/reservations?format=csv&lot_id={export_lot}')
+        timer('export ndjson', admin.get, f'/api/export/reservations?format=ndjson&lot_id={export_lot}')
+
+        # User pages and APIs
+        timer('user_dashboard', reader.get, '/user/dashboard')
+        timer('user_reservations', reader.get, '/api/user/reservations?limit=20')
+        timer('book_parking', reader.get, '/user/book_parking')
+        timer('book_parking search', reader.get, f'/user/book_parking?q={AREAS[i % len(AREAS)]}')
+        timer('book_spot', visitor.get, f'/user/book_spot/{lot_id}', expected=(302,))
+        with application.app_context():
+            reservation_id = db.session.query(parking.Reservation.id) \
+                .filter_by(user_id=free_user_id, status='active').scalar()
+        if reservation_id is not None:
+            timer('release_spot', visitor.get, f'/user/release_spot/{reservation_id}', expected=(302,))
+        start_time = window_base + timedelta(hours=3 * i)
+        timer('schedule_parking', visitor.post, f'/user/schedule_parking/{lot_id}', expected=(302,), data={
+            'start': start_time.isoformat(), 'end': (start_time + timedelta(hours=2)).isoformat()})
+        with application.app_context():
+            booking_id = db.session.query(db.func.max(parking.AdvanceBooking.id)) \
+                .filter_by(user_id=free_user_id, status='scheduled').scalar()
+        if booking_id is not None:
+            timer('cancel_booking', visitor.get, f'/user/cancel_booking/{booking_id}', expected=(302,))
+        window = urllib.parse.urlencode({'start': start_time.isoformat(),
+                                         'end': (start_time + timedelta(hours=1)).isoformat()})
+        timer('spot_availability', reader.get, f'/api/spots/{i + 1}/availability?{window}')
+        timer('lot_free_spot', reader.get, f'/api/lots/{lot_id}/free_spot?{window}')
+        timer('nearby_lots', reader.get, '/api/lots/nearby?lat=18.52&lng=73.85&k=5')
+        timer('availability_stream', reader.get, '/api/availability/stream', buffered=False)
+
+    return timer.report(), timer.errors
+
+# HTTP load phase
+HTTP_USER_MIX = ['/', '/user/dashboard', '/user/book_parking', '/user/book_parking?q=Road',
+                 '/api/user/reservations?limit=20', '/api/lots/nearby?lat=18.52&lng=73.85&k=5']
+HTTP_ADMIN_MIX = ['/admin/dashboard', '/admin/parking_lots', '/admin/parking_spots/{lot_id}',
+                  '/api/parking_stats', '/api/analytics?granularity=day']
+
+def run_http_load(parking, dataset, arguments, query_counter):
+    """Replay read routes over real HTTP from several threads against a threaded server"""
+    from werkzeug.serving import make_server
+
+    # The development server logs every request; that would dominate the output and the timings
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, parking.app, threaded=True)
+    server_thread = threading.Thread(target=server.serve_forever, daemon=True)
+    server_thread.start()
+    base_url = f'http://127.0.0.1:{server.server_port}'
+
+    requests_per_thread = max(1, arguments.http_requests // arguments.threads)
+    usernames = [username for _, username in dataset['parking_users'] + dataset['free_users']]
+    samples = defaultdict(list)
+    errors = []
+    lock = threading.Lock()
+    ready = threading.Barrier(arguments.threads + 1)
+
+    def worker(thread_number):
+        opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+        # Every fourth thread is an administrator, the others are different users
+        is_admin = thread_number % 4 == 3
+        username = 'bench_admin' if is_admin else usernames[thread_number % len(usernames)]
+        opener.open(f'{base_url}/login', urllib.parse.urlencode(
+            {'username': username, 'password': BENCHMARK_PASSWORD}).encode()).read()
+        paths = HTTP_ADMIN_MIX if is_admin else HTTP_USER_MIX
+        local_samples = []
+        ready.wait()
+        for i in range(requests_per_thread):
+            route = paths[i % len(paths)]
+            path = route.format(lot_id=dataset['lot_ids'][i % len(dataset['lot_ids'])])
+            started = time.perf_counter()
+            try:
+                with opener.open(base_url + path) as response:
+                    response.read()
+            except urllib.error.URLError as error:
+                with lock:
+                    errors.append(f'{path}: {error}')
+                continue
+            local_samples.append((route, time.perf_counter() - started))
+        with lock:
+            for label, elapsed in local_samples:
+                samples[label].append((elapsed, None))
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(arguments.threads)]
+    for thread in threads:
+        thread.start()
+    ready.wait()
+    queries_before = query_counter.total
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    total_queries = query_counter.total - queries_before
+    server.shutdown()
+
+    all_samples = [sample for route_samples in samples.values() for sample in route_samples]
+    report = {'threads': arguments.threads, 'routes': {label: summarize(route_samples)
+                                                       for label, route_samples in sorted(samples.items())}}
+    if all_samples:
+        report['overall'] = summarize(all_samples, elapsed)
+        report['overall']['queries_per_request'] = round(total_queries / len(all_samples), 2)
+    return report, errors
+
+# Helpers for the optional phases
+def create_bench_lot(parking, name, spots):
+    """Create a lot with its spots and register it with the in-memory indexes; returns its id"""
+    db = parking.db
+    lot = parking.ParkingLot(location_name=name, hourly_rate=20.0, address=f'{name}, Pune', pin_code='411001',
+                             total_spots=spots, latitude=18.52, longitude=73.85)
+    db.session.add(lot)
+    db.session.flush()
+    parking.add_parking_spots(lot.id, spots)
+    db.session.commit()
+    parking.spot_allocator.reload_lot(lot.id)
+    parking.occupancy_cache.set_lot(lot.id, spots)
+    parking.lot_location_index.mark_stale()
+    return lot.id
+
+def create_bench_users(parking, prefix, count):
+    """Bulk insert users; returns their (id, username) pairs"""
+    from sqlalchemy import insert
+
+    db = parking.db
+    db.session.execute(insert(parking.User), [
+        {'username': f'{prefix}{i}', 'email': f'{prefix}{i}@example.com', 'password_hash': '!'} for i in range(count)
+    ])
+    db.session.commit()
+    return db.session.query(parking.User.id, parking.User.username) \
+        .filter(parking.User.username.like(f'{prefix}%')).order_by(parking.User.id).all()
+
+def signed_in_client(application, user_id, username):
+    """A test client with the user's session set directly, so thousands of users need no password checks"""
+    client = application.test_client()
+    with client.session_transaction() as client_session:
+        client_session['user_id'] = user_id
+        client_session['username'] = username
+    return client
+
+def run_parallel(jobs, threads, send):
+    """Call send(job) for every job from several threads; returns latency samples, errors and elapsed seconds"""
+    samples, errors = [], []
+    lock = threading.Lock()
+    ready = threading.Barrier(threads + 1)
+
+    def worker(thread_jobs):
+        local_samples, local_errors = [], []
+        ready.wait()
+        for job in thread_jobs:
+            started = time.perf_counter()
+            try:
+                send(job)
+            except Exception as error:
+                local_errors.append(repr(error))
+                continue
+            local_samples.append((time.perf_counter() - started, None))
+        with lock:
+            samples.extend(local_samples)
+            errors.extend(local_errors)
+
+    workers = [threading.Thread(target=worker, args=(jobs[n::threads],)) for n in range(threads)]
+    for thread in workers:
+        thread.start()
+    ready.wait()
+    started = time.perf_counter()
+    for thread in workers:
+        thread.join()
+    return samples, errors, time.perf_counter() - started
+
+def active_reservations_in_lot(parking, lot_id):
+    db = parking.db
+    return db.session.query(parking.Reservation.spot_id) \
+        .join(parking.ParkingSpot, parking.Reservation.spot_id == parking.ParkingSpot.id) \
+        .filter(parking.ParkingSpot.lot_id == lot_id, parking.Reservation.status == 'active').all()
+
+# Write-behind comparison
+def run_write_behind_comparison(parking, arguments):
+    """Bookings per second with a commit per request and with the write-behind queue.
+
+    Each mode books a fresh lot with one spot per user from --threads
+    threads. The write-behind figure is the rate at which bookings are
+    answered; flush_seconds is how long the queue then needs to reach the
+    database.
+    """
+    application, db = parking.app, parking.db
+    count = arguments.write_behind_bookings
+    report, errors = {}, []
+    for mode in ('per_request_commit', 'write_behind'):
+        with application.app_context():
+            lot_id = create_bench_lot(parking, f'Write-behind benchmark {mode}', count)
+            users = create_bench_users(parking, f'bench_{mode}_', count)
+        clients = [signed_in_client(application, user_id, username) for user_id, username in users]
+
+        def book(client):
+            response = client.get(f'/user/book_spot/{lot_id}')
+            if response.status_code != 302:
+                raise RuntimeError(f'book_spot returned {response.status_code}')
+
+        application.config['WRITE_BEHIND'] = mode == 'write_behind'
+        try:
+            samples, mode_errors, elapsed = run_parallel(clients, arguments.threads, book)
+        finally:
+            application.config['WRITE_BEHIND'] = False
+        errors.extend(f'write-behind {mode}: {error}' for error in mode_errors)
+
+        flush_started = time.perf_counter()
+        with application.app_context():
+            while len(active_reservations_in_lot(parking, lot_id)) < count and time.perf_counter() - flush_started < 60:
+                db.session.rollback()
+                time.sleep(0.05)
+            booked = len(active_reservations_in_lot(parking, lot_id))
+        if booked != count:
+            errors.append(f'write-behind {mode}: {booked} of {count} bookings reached the database')
+        report[mode] = summarize(samples) if samples else {}
+        report[mode]['bookings_per_second'] = round(len(samples) / elapsed, 1)
+        if mode == 'write_behind':
+            report[mode]['flush_seconds'] = round(time.perf_counter() - flush_started, 3)
+    report['speedup'] = round(report['write_behind']['bookings_per_second'] /
+                              report['per_request_commit']['bookings_per_second'], 2)
+    return report, errors
+
+# Booking contention
+def run_contention_benchmark(parking, arguments):
+    """Many users book the same lot at once; checks that no spot is handed out twice.
+
+    The lot has half as many spots as there are users, so the run covers
+    both racing for the last free spots and being turned away from a full
+    lot.
+    """
+    application, db = parking.app, parking.db
+    count = arguments.contention_bookings
+    spots = max(1, count // 2)
+    with application.app_context():
+        lot_id = create_bench_lot(parking, 'Contention benchmark', spots)
+        users = create_bench_users(parking, 'bench_contender_', count)
+    clients = [signed_in_client(application, user_id, username) for user_id, username in users]
+
+    def book(client):
+        response = client.get(f'/user/book_spot/{lot_id}')
+        if response.status_code != 302:
+            raise RuntimeError(f'book_spot returned {response.status_code}')
+
+    samples, errors, elapsed = run_parallel(clients, arguments.threads, book)
+    errors = [f'contention: {error}' for error in errors]
+    with application.app_context():
+        booked_spot_ids = [spot_id for (spot_id,) in active_reservations_in_lot(parking, lot_id)]
+        occupied_spot_ids = {spot_id for (spot_id,) in db.session.query(parking.ParkingSpot.id)
+                             .filter_by(lot_id=lot_id, status='O')}
+        cached_occupied = parking.occupancy_cache.lot_stats(lot_id)['occupied']
+    if len(booked_spot_ids) != len(set(booked_spot_ids)):
+        errors.append(f'contention: {len(booked_spot_ids) - len(set(booked_spot_ids))} spots were booked twice')
+    if len(booked_spot_ids) != min(count, spots):
+        errors.append(f'contention: {len(booked_spot_ids)} bookings for {min(count, spots)} spots')
+    if occupied_spot_ids != set(booked_spot_ids) or cached_occupied != len(occupied_spot_ids):
+        errors.append(f'contention: {len(occupied_spot_ids)} spots marked occupied, {cached_occupied} counted, '
+                      f'{len(booked_spot_ids)} booked')
+    report = summarize(samples, elapsed) if samples else {}
+    report.update({'users': count, 'spots': spots, 'bookings': len(booked_spot_ids)})
+    return report, errors
+
+# Journal mode comparison
+def run_wal_comparison(parking, arguments):
+    """Measure admin page reads while bookings are written, with the WAL and the rollback (DELETE) journal.
+
+    For each journal mode a fresh lot gets one booking per user from
+    --threads writer threads, while as many admin threads read the
+    dashboard, lot list and statistics until the bookings are done. The
+    page cache is off so every read reaches the database. Lock timeouts are
+    reported per mode rather than failing the run, since readers blocked by
+    a writer are what the comparison measures. All threads share one
+    interpreter, so rendering competes for the GIL as well as for the
+    database.
+    """
+    application, db = parking.app, parking.db
+    count = arguments.wal_comparison
+    pragmas = application.config['SQLITE_PRAGMAS']
+    original_mode, original_backend = pragmas['journal_mode'], parking.page_cache.backend
+    parking.page_cache.backend = parking.MemoryCacheBackend(0)
+    report, errors = {}, []
+    try:
+        for journal_mode in ('WAL', 'DELETE'):
+            with application.app_context():
+                db.session.remove()
+                pragmas['journal_mode'] = journal_mode
+                db.engine.dispose()
+                active_mode = db.session.execute(db.text('PRAGMA journal_mode')).scalar()
+                if active_mode.upper() != journal_mode:
+                    errors.append(f'journal modes: asked for {journal_mode}, the database uses {active_mode}')
+                lot_id = create_bench_lot(parking, f'Journal {journal_mode} benchmark', count)
+                users = create_bench_users(parking, f'bench_journal_{journal_mode.lower()}_', count)
+            report[journal_mode.lower()] = measure_reads_during_bookings(parking, arguments, lot_id, users)
+    finally:
+        parking.page_cache.backend = original_backend
+        with application.app_context():
+            db.session.remove()
+            pragmas['journal_mode'] = original_mode
+            db.engine.dispose()
+    wal_reads, delete_reads = report['wal']['reads'], report['delete']['reads']
+    if wal_reads.get('requests_per_second') and delete_reads.get('requests_per_second'):
+        report['read_throughput_ratio'] = round(wal_reads['requests_per_second'] / delete_reads['requests_per_second'], 2)
+    return report, errors
+
+def measure_reads_during_bookings(parking, arguments, lot_id, users):
+    """Admin read latency and throughput while every user books a spot in the lot"""
+    application = parking.app
+    read_paths = ['/admin/dashboard', '/admin/parking_lots', '/api/parking_stats']
+    bookings_done = threading.Event()
+    read_samples, read_errors = [], []
+    lock = threading.Lock()
+
+    def reader(offset):
+        client = logged_in_client(application, 'bench_admin')
+        local_samples, local_errors = [], 0
+        for path in itertools.islice(itertools.cycle(read_paths), offset, None):
+            if bookings_done.is_set():
+                break
+            started = time.perf_counter()
+            if client.get(path).status_code == 200:
+                local_samples.append((time.perf_counter() - started, None))
+            else:
+                local_errors += 1
+        with lock:
+            read_samples.extend(local_samples)
+            read_errors.append(local_errors)
+
+    def book(client):
+        response = client.get(f'/user/book_spot/{lot_id}')
+        if response.status_code != 302:
+            raise RuntimeError(f'book_spot returned {response.status_code}')
+
+    clients = [signed_in_client(application, user_id, username) for user_id, username in users]
+    readers = [threading.Thread(target=reader, args=(n,)) for n in range(arguments.threads)]
+    started = time.perf_counter()
+    for thread in readers:
+        thread.start()
+    booking_samples, booking_errors, _ = run_parallel(clients, arguments.threads, book)
+    bookings_done.set()
+    for thread in readers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    return {
+        'reads': summarize(read_samples, elapsed) if read_samples else {},
+        'read_errors': sum(read_errors),
+        'bookings': summarize(booking_samples, elapsed) if booking_samples else {},
+        'booking_errors': len(booking_errors),
+    }
+
+# Lot search
+SEARCH_QUERIES = ['Baner', 'MG Road', 'koregaon park parking', '4110', 'Hinjewadi Phase', 'Wakad 12', 'no such place']
+SEARCH_WORDS = ['Phase', 'Market', 'Station', 'Tower', 'Plaza', 'Gate', 'Square', 'Junction']
+
+def add_bench_lots(parking, generator, count, prefix):
+    """Bulk insert lots without spots, which search and nearby lookups never read"""
+    from sqlalchemy import insert
+
+    db = parking.db
+    for offset in range(0, count, 5000):
+        rows = []
+        for i in range(offset, min(offset + 5000, count)):
+            area = AREAS[i % len(AREAS)]
+            rows.append({
+                'location_name': f'{prefix} {area} {generator.choice(SEARCH_WORDS)} {i}', 'hourly_rate': 20.0,
+                'address': f'{i % 200 + 1} {area} {generator.choice(SEARCH_WORDS)}, Pune',
+                'pin_code': str(411001 + i % 60), 'total_spots': 0,
+                'latitude': 18.40 + generator.random() * 0.3, 'longitude': 73.70 + generator.random() * 0.3
+            })
+        db.session.execute(insert(parking.ParkingLot), rows)
+    db.session.commit()
+    parking.lot_location_index.mark_stale()
+
+def time_calls(calls, iterations):
+    """Latency samples of calling every function in calls, iterations times over"""
+    samples = []
+    for _ in range(iterations):
+        for call in calls:
+            started = time.perf_counter()
+            call()
+            samples.append((time.perf_counter() - started, None))
+    return samples
+
+def phase_random(arguments, phase):
+    """Return a generator for one optional phase, seeded from --seed and the phase name.
+
+    Phases that add lots in the same run would otherwise draw the same
+    coordinates and names from the same sequence.
+    """
+    return random.Random(f'{arguments.seed}:{phase}')
+
+def run_search_benchmark(parking, arguments):
+    """Time the full-text lot search against substring matching over a large number of lots.
+
+    The two do not return identical results: full-text search matches word
+    prefixes ranked by relevance, substring matching finds the query
+    anywhere, and stops after SEARCH_RESULT_LIMIT matches, so it is cheap
+    for common words and scans every lot for rare ones. Both are reported
+    per query as well as overall.
+    """
+    application, db = parking.app, parking.db
+    methods = {'full_text': parking.search_parking_lots, 'substring': parking.search_parking_lots_by_substring}
+    with application.app_context():
+        add_bench_lots(parking, phase_random(arguments, 'search'), arguments.search_lots, 'Search')
+        lot_count = db.session.query(db.func.count(parking.ParkingLot.id)).scalar()
+        report = {'lots': lot_count, 'full_text_index': parking.search_index_available(), 'queries': {}}
+        all_samples = defaultdict(list)
+        for query in SEARCH_QUERIES:
+            report['queries'][query] = {}
+            for name, search in methods.items():
+                samples = time_calls([lambda: search(query)], arguments.iterations)
+                all_samples[name].extend(samples)
+                report['queries'][query][f'{name}_p50_ms'] = summarize(samples)['p50_ms']
+                db.session.remove()
+    for name in methods:
+        report[name] = summarize(all_samples[name])
+    return report, []
+
+# Nearby lots
+def run_nearby_benchmark(parking, arguments):
+    """Time the KD-tree nearest-lot lookup against a linear scan over the same coordinates.
+
+    The linear scan gets the unit vectors precomputed in memory, which is
+    the best case for it; every lookup's results are compared with the
+    tree's by distance, since lots at the same distance may come back in
+    either order.
+    """
+    application, db = parking.app, parking.db
+    generator = phase_random(arguments, 'nearby')
+    errors = []
+    with application.app_context():
+        add_bench_lots(parking, generator, arguments.nearby_lots, 'Nearby')
+        rows = db.session.query(parking.ParkingLot.id, parking.ParkingLot.latitude, parking.ParkingLot.longitude) \
+            .filter(parking.ParkingLot.latitude.isnot(None), parking.ParkingLot.longitude.isnot(None)).all()
+        rebuild_started = time.perf_counter()
+        parking.lot_location_index.rebuild()
+        rebuild_seconds = time.perf_counter() - rebuild_started
+    points = [(parking.to_unit_vector(latitude, longitude), lot_id) for lot_id, latitude, longitude in rows]
+
+    def linear_scan(latitude, longitude, k):
+        target = parking.to_unit_vector(latitude, longitude)
+        nearest = heapq.nsmallest(k, ((sum((a - b) ** 2 for a, b in zip(point, target)), lot_id)
+                                      for point, lot_id in points))
+        return [(parking.chord_to_km(math.sqrt(squared_distance)), lot_id) for squared_distance, lot_id in nearest]
+
+    lookups = [(18.40 + generator.random() * 0.3, 73.70 + generator.random() * 0.3)
+               for _ in range(arguments.iterations)]
+    k = parking.NEARBY_DEFAULT_RESULTS
+    tree_samples = time_calls([lambda lookup=lookup: parking.lot_location_index.nearest(*lookup, k)
+                               for lookup in lookups], 1)
+    linear_samples = time_calls([lambda lookup=lookup: linear_scan(*lookup, k) for lookup in lookups], 1)
+    for latitude, longitude in lookups:
+        tree_distances = [distance for distance, _ in parking.lot_location_index.nearest(latitude, longitude, k)]
+        linear_distances = [distance for distance, _ in linear_scan(latitude, longitude, k)]
+        if len(tree_distances) != len(linear_distances) or not all(
+                math.isclose(tree, linear, rel_tol=1e-9, abs_tol=1e-9)
+                for tree, linear in zip(tree_distances, linear_distances)):
+            errors.append(f'nearby: KD-tree and linear scan disagree at {latitude:.5f},{longitude:.5f}')
+    report = {'lots': len(points), 'k': k, 'rebuild_seconds': round(rebuild_seconds, 3),
+              'kd_tree': summarize(tree_samples), 'linear_scan': summarize(linear_samples)}
+    report['speedup_p50'] = round(report['linear_scan']['p50_ms'] / report['kd_tree']['p50_ms'], 1)
+    return report, errors
+
+# Tariff pricing
+PRICING_TARIFFS = [
+    {},
+    {'first_hour_rate': 40.0},
+    {'daily_cap': 150.0},
+    {'night_rate': 5.0, 'daily_cap': 120.0},
+    {'first_hour_rate': 30.0, 'night_rate': 8.0, 'night_start_hour': 23, 'night_end_hour': 7, 'grace_minutes': 15},
+]
+
+def run_pricing_benchmark(parking, arguments):
+    """Price many stays with price_stays in export-sized batches and one stay at a time.
+
+    The batch path shares one tariffs dict across batches, as the export
+    does. The one-at-a-time path loads the stay's lot for every stay, as a
+    loop over reservations would, and runs over the first --pricing-sample
+    stays; both are reported as stays per second and compared on that
+    sample.
+    """
+    from sqlalchemy import insert
+
+    application, db = parking.app, parking.db
+    generator = phase_random(arguments, 'pricing')
+    errors = []
+    with application.app_context():
+        db.session.execute(insert(parking.ParkingLot), [
+            {'location_name': f'Pricing {number}', 'hourly_rate': 20.0, 'address': f'{number} Pricing Road, Pune',
+             'pin_code': '411001', 'total_spots': 0, **tariff}
+            for number, tariff in enumerate(PRICING_TARIFFS * 4, start=1)
+        ])
+        db.session.commit()
+        lot_ids = [lot_id for (lot_id,) in db.session.query(parking.ParkingLot.id)
+                   .filter(parking.ParkingLot.location_name.like('Pricing %'))]
+        now = datetime.now()
+        stays = []
+        for _ in range(arguments.pricing_stays):
+            entry_time = now - timedelta(minutes=generator.randint(60, 90 * 24 * 60))
+            stays.append((entry_time, entry_time + timedelta(minutes=generator.randint(5, 30 * 60)),
+                          generator.choice(lot_ids)))
+
+        started = time.perf_counter()
+        tariffs = {}
+        batch_costs = []
+        for offset in range(0, len(stays), parking.EXPORT_BATCH_SIZE):
+            batch_costs.extend(parking.price_stays(stays[offset:offset + parking.EXPORT_BATCH_SIZE], tariffs))
+        batch_seconds = time.perf_counter() - started
+
+        sample = stays[:arguments.pricing_sample]
+        started = time.perf_counter()
+        single_costs = [
+            parking.Tariff.for_lot(parking.ParkingLot.query.filter_by(id=lot_id).one()).price(entry_time, exit_time)
+            for entry_time, exit_time, lot_id in sample
+        ]
+        single_seconds = time.perf_counter() - started
+        db.session.remove()
+
+    mismatches = sum(1 for batch_cost, single_cost in zip(batch_costs, single_costs)
+                     if abs(batch_cost - single_cost) > 1e-6)
+    if mismatches:
+        errors.append(f'pricing: {mismatches} stays priced differently in batches and one at a time')
+    report = {
+        'stays': len(stays), 'lots': len(lot_ids),
+        'batched': {'stays': len(stays), 'seconds': round(batch_seconds, 3),
+                    'stays_per_second': round(len(stays) / batch_seconds) if batch_seconds else None},
+        'one_at_a_time': {'stays': len(sample), 'seconds': round(single_seconds, 3),
+                          'stays_per_second': round(len(sample) / single_seconds) if single_seconds else None},
+    }
+    if report['batched']['stays_per_second'] and report['one_at_a_time']['stays_per_second']:
+        report['speedup'] = round(report['batched']['stays_per_second'] / report['one_at_a_time']['stays_per_second'], 1)
+    return report, errors
+
+# Availability stream load test
+def resident_memory_bytes():
+    """Resident set size of this process, or None where /proc is not available"""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+def run_sse_load(parking, arguments):
+    """Hold many availability streams open over HTTP and time one booking's event reaching each of them.
+
+    Streams are plain sockets read by a single selector thread, so the
+    client side costs little; the server runs one thread per stream, as the
+    threaded development server and thread-based workers do. Memory per
+    subscriber is the growth of this process's resident size while the
+    streams are open. Latency includes the stream's coalescing delay.
+    """
+    import selectors
+    import socket
+    from werkzeug.serving import make_server
+
+    application = parking.app
+    count = arguments.sse_subscribers
+    with application.app_context():
+        lot_id = create_bench_lot(parking, 'Stream benchmark', 1)
+        user_id, username = create_bench_users(parking, 'bench_sse_', 1)[0]
+    session_cookie = application.session_interface.get_signing_serializer(application) \
+        .dumps({'user_id': user_id, 'username': username})
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, application, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    request = (f'GET /api/availability/stream HTTP/1.1\r\nHost: 127.0.0.1:{server.server_port}\r\n'
+               f'Cookie: {application.config["SESSION_COOKIE_NAME"]}={session_cookie}\r\n'
+               'Accept: text/event-stream\r\n\r\n').encode()
+    errors = []
+    selector = selectors.DefaultSelector()
+    received = {}
+
+    def read_until(marker, timeout):
+        """Read every stream until each has received marker; returns the arrival time per socket"""
+        arrived = {}
+        deadline = time.perf_counter() + timeout
+        while len(arrived) < count and time.perf_counter() < deadline:
+            for key, _ in selector.select(timeout=0.1):
+                connection = key.fileobj
+                chunk = connection.recv(65536)
+                received[connection] += chunk
+                if connection not in arrived and marker in received[connection]:
+                    arrived[connection] = time.perf_counter()
+                    received[connection] = b''
+        return arrived
+
+    memory_before = resident_memory_bytes()
+    connections = []
+    try:
+        for _ in range(count):
+            connection = socket.create_connection(('127.0.0.1', server.server_port))
+            connection.sendall(request)
+            connection.setblocking(False)
+            selector.register(connection, selectors.EVENT_READ)
+            received[connection] = b''
+            connections.append(connection)
+        connected = read_until(b'event: snapshot', 60)
+        if len(connected) < count:
+            errors.append(f'availability stream: {count - len(connected)} of {count} streams got no snapshot')
+        memory_after = resident_memory_bytes()
+
+        booked_at = time.perf_counter()
+        response = signed_in_client(application, user_id, username).get(f'/user/book_spot/{lot_id}')
+        if response.status_code != 302:
+            errors.append(f'availability stream: book_spot returned {response.status_code}')
+        arrived = read_until(b'event: availability', 30)
+        if len(arrived) < count:
+            errors.append(f'availability stream: {count - len(arrived)} of {count} streams missed the booking')
+    finally:
+        for connection in connections:
+            selector.unregister(connection)
+            connection.close()
+        selector.close()
+        server.shutdown()
+
+    report = {'subscribers': count, 'coalesce_seconds': parking.AVAILABILITY_COALESCE_SECONDS}
+    if arrived:
+        report['event_latency'] = summarize([(arrived_at - booked_at, None) for arrived_at in arrived.values()])
+    if memory_before is not None and memory_after is not None:
+        report['memory_per_subscriber_kb'] = round((memory_after - memory_before) / count / 1024, 1)
+    return report, errors
+
+# Baseline comparison
+def find_regressions(report, baseline, arguments):
+    """List routes whose p95 latency or query count grew past the allowed threshold"""
+    regressions = []
+    allowed = 1 + arguments.threshold / 100
+    phases = [('test_client', report['test_client'], baseline.get('test_client', {}))]
+    if 'http' in report and 'http' in baseline:
+        phases.append(('http', report['http']['routes'], baseline['http'].get('routes', {})))
+    for phase, routes, baseline_routes in phases:
+        for label, current in routes.items():
+            previous = baseline_routes.get(label)
+            if not previous:
+                continue
+            if current['p95_ms'] > previous['p95_ms'] * allowed and \
+                    current['p95_ms'] - previous['p95_ms'] >= arguments.min_delta_ms:
+                regressions.append(f"{phase} {label}: p95 {previous['p95_ms']} ms -> {current['p95_ms']} ms")
+            if 'queries_per_request' in current and 'queries_per_request' in previous and \
+                    current['queries_per_request'] > previous['queries_per_request'] + 0.5:
+                regressions.append(f"{phase} {label}: queries per request "
+                                   f"{previous['queries_per_request']} -> {current['queries_per_request']}")
+    if 'http' in report and 'http' in baseline and 'overall' in report['http'] and 'overall' in baseline['http']:
+        current_rate = report['http']['overall']['requests_per_second']
+        previous_rate = baseline['http']['overall']['requests_per_second']
+        if current_rate * allowed < previous_rate:
+            regressions.append(f'http throughput: {previous_rate} -> {current_rate} requests/s')
+    return regressions
+
+def main():
+    arguments = parse_arguments()
+    work_directory = tempfile.mkdtemp(prefix='parking-benchmark-')
+    try:
+        configure_environment(arguments, os.path.join(work_directory, 'benchmark.db'))
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+        import app as parking
+        from sqlalchemy import event
+
+        query_counter = QueryCounter()
+        with parking.app.app_context():
+            event.listen(parking.db.engine, 'before_cursor_execute', query_counter)
+            seeding_started = time.perf_counter()
+            dataset = seed_database(parking, arguments)
+            seeding_seconds = time.perf_counter() - seeding_started
+
+        route_report, errors = run_route_benchmarks(parking, dataset, arguments, query_counter)
+        report = {
+            'generated_at': datetime.now().isoformat(timespec='seconds'),
+            'dataset': dataset['summary'],
+            'page_cache': not arguments.no_page_cache,
+            'seeding_seconds': round(seeding_seconds, 2),
+            'test_client': route_report,
+        }
+        if arguments.http_requests > 0:
+            report['http'], http_errors = run_http_load(parking, dataset, arguments, query_counter)
+            errors.extend(http_errors)
+        if arguments.write_behind_bookings > 0:
+            report['write_behind'], phase_errors = run_write_behind_comparison(parking, arguments)
+            errors.extend(phase_errors)
+        if arguments.contention_bookings > 0:
+            report['contention'], phase_errors = run_contention_benchmark(parking, arguments)
+            errors.extend(phase_errors)
+        if arguments.wal_comparison > 0:
+            report['journal_modes'], phase_errors = run_wal_comparison(parking, arguments)
+            errors.extend(phase_errors)
+        if arguments.search_lots > 0:
+            report['search'], phase_errors = run_search_benchmark(parking, arguments)
+            errors.extend(phase_errors)
+        if arguments.nearby_lots > 0:
+            report['nearby'], phase_errors = run_nearby_benchmark(parking, arguments)
+            errors.extend(phase_errors)
+        if arguments.pricing_stays > 0:
+            report['pricing'], phase_errors = run_pricing_benchmark(parking, arguments)
+            errors.extend(phase_errors)
+        if arguments.sse_subscribers > 0:
+            report['availability_stream'], phase_errors = run_sse_load(parking, arguments)
+            errors.extend(phase_errors)
+        report['errors'] = errors
+
+        if arguments.baseline:
+            with open(arguments.baseline) as baseline_file:
+                report['regressions'] = find_regressions(report, json.load(baseline_file), arguments)
+
+        output = json.dumps(report, indent=2)
+        if arguments.output:
+            with open(arguments.output, 'w') as output_file:
+                output_file.write(output + '\n')
+        else:
+            print(output)
+    finally:
+        shutil.rmtree(work_directory, ignore_errors=True)
+
+    for message in errors + report.get('regressions', []):
+        print(message, file=sys.stderr)
+    return 1 if errors or report.get('regressions') else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
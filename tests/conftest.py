@@ -0,0 +1,85 @@
+"""Shared fixtures: the application bound to a scratch SQLite database that is emptied before every test"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+# app.py reads its configuration when it is imported, so point it at a scratch database first
+TEST_DIRECTORY = tempfile.mkdtemp(prefix='parking-tests-')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(TEST_DIRECTORY, 'parking.db')
+os.environ['WRITE_BEHIND'] = '0'
+os.environ['WRITE_BEHIND_LOG'] = os.path.join(TEST_DIRECTORY, 'write_behind.log')
+# Tests set the counters by hand, so no background thread may reload them
+os.environ['OCCUPANCY_RECONCILE_SECONDS'] = '0'
+os.environ.pop('CACHE_REDIS_URL', None)
+os.environ.pop('ENABLE_METRICS', None)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as parking  # noqa: E402
+from werkzeug.security import generate_password_hash  # noqa: E402
+
+PASSWORD = 'password'
+# A cheap hash keeps logins fast; the application verifies any werkzeug hash
+PASSWORD_HASH = generate_password_hash(PASSWORD, method='pbkdf2:sha256:1000')
+
+@pytest.fixture
+def parking_app():
+    """The app module inside an application context, with empty tables and freshly loaded caches"""
+    parking.app.config['TESTING'] = True
+    parking.app.config['WRITE_BEHIND'] = False
+    with parking.app.app_context():
+        parking.upgrade_database()
+        for table in reversed(parking.db.metadata.sorted_tables):
+            parking.db.session.execute(table.delete())
+        parking.db.session.add(parking.Admin(username='admin', password_hash=PASSWORD_HASH))
+        parking.db.session.commit()
+        parking.spot_allocator.load()
+        parking.occupancy_cache.load()
+        parking.spot_schedule.load()
+        parking.lot_location_index.mark_stale()
+        parking.page_cache.backend = parking.MemoryCacheBackend(parking.app.config['CACHE_MAX_ENTRIES'])
+        parking.page_cache.hits.clear()
+        parking.page_cache.misses.clear()
+        yield parking
+        parking.db.session.remove()
+
+@pytest.fixture
+def create_lot(parking_app):
+    """Factory creating a lot with its spots; returns the lot id"""
+    def create(name='Test Lot', spots=1, hourly_rate=10.0, **fields):
+        lot = parking_app.ParkingLot(location_name=name, hourly_rate=hourly_rate, address=f'{name} Road, Pune',
+                                     pin_code='411001', total_spots=spots, **fields)
+        parking_app.db.session.add(lot)
+        parking_app.db.session.flush()
+        parking_app.add_parking_spots(lot.id, spots)
+        parking_app.db.session.commit()
+        parking_app.spot_allocator.reload_lot(lot.id)
+        parking_app.occupancy_cache.set_lot(lot.id, spots)
+        parking_app.lot_location_index.mark_stale()
+        return lot.id
+    return create
+
+@pytest.fixture
+def create_user(parking_app):
+    """Factory creating a user; returns the user id"""
+    def create(username):
+        user = parking_app.User(username=username, email=f'{username}@example.com', password_hash=PASSWORD_HASH)
+        parking_app.db.session.add(user)
+        parking_app.db.session.commit()
+        return user.id
+    return create
+
+@pytest.fixture
+def login(parking_app):
+    """Factory returning a test client signed in as the given user or admin"""
+    def sign_in(username):
+        client = parking_app.app.test_client()
+        response = client.post('/login', data={'username': username, 'password': PASSWORD})
+        assert response.status_code == 302
+        return client
+    return sign_in
+
+@pytest.fixture
+def admin_client(login):
+    return login('admin')
@@ -0,0 +1,47 @@
+from datetime import datetime
+
+from sqlalchemy import event, update
+
+def count_statements(engine, send):
+    """Run send() and return its result with the number of SQL statements it executed"""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        result = send()
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+    return result, len(statements)
+
+def occupy_spots(parking_app, lot_id, user_ids):
+    """Give each user an active reservation on the next spot of the lot"""
+    db = parking_app.db
+    ParkingSpot = parking_app.ParkingSpot
+    spot_ids = [spot_id for (spot_id,) in db.session.query(ParkingSpot.id).filter_by(lot_id=lot_id)
+                .order_by(ParkingSpot.spot_number).limit(len(user_ids))]
+    for spot_id, user_id in zip(spot_ids, user_ids):
+        db.session.add(parking_app.Reservation(spot_id=spot_id, user_id=user_id, entry_time=datetime.now(),
+                                               status='active'))
+    db.session.execute(update(ParkingSpot).where(ParkingSpot.id.in_(spot_ids)).values(status='O'))
+    db.session.commit()
+
+def test_query_count_does_not_grow_with_lot_size(parking_app, create_lot, create_user, admin_client):
+    small_lot = create_lot('Small', spots=10)
+    large_lot = create_lot('Large', spots=1000)
+    user_ids = [create_user(f'driver{i}') for i in range(40)]
+    occupy_spots(parking_app, small_lot, user_ids[:4])
+    occupy_spots(parking_app, large_lot, user_ids[4:])
+    admin_client.get(f'/admin/parking_spots/{small_lot}')
+
+    small_response, small_count = count_statements(
+        parking_app.db.engine, lambda: admin_client.get(f'/admin/parking_spots/{small_lot}'))
+    large_response, large_count = count_statements(
+        parking_app.db.engine, lambda: admin_client.get(f'/admin/parking_spots/{large_lot}'))
+
+    assert small_response.status_code == 200
+    assert large_response.status_code == 200
+    assert b'driver39' in large_response.data
+    assert small_count == large_count
@@ -0,0 +1,119 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+@pytest.fixture
+def local_now(parking_app):
+    return parking_app.to_local_naive(datetime.now(parking_app.indian_timezone))
+
+def schedule(client, lot_id, start_time, hours=2):
+    response = client.post(f'/user/schedule_parking/{lot_id}', data={
+        'start': start_time.isoformat(), 'end': (start_time + timedelta(hours=hours)).isoformat()})
+    assert response.status_code == 302
+
+def spot_number_of(parking_app, model, user_id, status):
+    record = model.query.filter_by(user_id=user_id, status=status).first()
+    return record and record.parking_spot.spot_number
+
+def test_walk_in_skips_spot_booked_soon(parking_app, create_lot, create_user, login, local_now):
+    lot_id = create_lot(spots=2)
+    planner, walker, latecomer = (create_user(name) for name in ('planner', 'walker', 'latecomer'))
+    schedule(login('planner'), lot_id, local_now + timedelta(minutes=30))
+    assert spot_number_of(parking_app, parking_app.AdvanceBooking, planner, 'scheduled') == 1
+
+    login('walker').get(f'/user/book_spot/{lot_id}')
+    login('latecomer').get(f'/user/book_spot/{lot_id}')
+
+    assert spot_number_of(parking_app, parking_app.Reservation, walker, 'active') == 2
+    assert spot_number_of(parking_app, parking_app.Reservation, latecomer, 'active') is None
+
+def test_walk_in_may_use_spot_booked_later(parking_app, create_lot, create_user, login, local_now):
+    lot_id = create_lot(spots=1)
+    walker = create_user('walker')
+    create_user('planner')
+    schedule(login('planner'), lot_id, local_now + timedelta(days=1))
+
+    login('walker').get(f'/user/book_spot/{lot_id}')
+
+    assert spot_number_of(parking_app, parking_app.Reservation, walker, 'active') == 1
+
+def test_schedule_soon_skips_occupied_spots(parking_app, create_lot, create_user, login, local_now):
+    lot_id = create_lot(spots=2)
+    walker, planner = create_user('walker'), create_user('planner')
+    login('walker').get(f'/user/book_spot/{lot_id}')
+    assert spot_number_of(parking_app, parking_app.Reservation, walker, 'active') == 1
+
+    schedule(login('planner'), lot_id, local_now + timedelta(minutes=30))
+
+    assert spot_number_of(parking_app, parking_app.AdvanceBooking, planner, 'scheduled') == 2
+
+def test_full_lot_takes_bookings_for_later(parking_app, create_lot, create_user, login, local_now):
+    lot_id = create_lot(spots=1)
+    create_user('walker')
+    planner = create_user('planner')
+    login('walker').get(f'/user/book_spot/{lot_id}')
+    client = login('planner')
+    spot_id = parking_app.db.session.query(parking_app.ParkingSpot.id).filter_by(lot_id=lot_id).scalar()
+
+    def window(start_time):
+        return f'start={start_time.isoformat()}&end={(start_time + timedelta(hours=2)).isoformat()}'
+
+    soon, next_week = local_now + timedelta(minutes=30), local_now + timedelta(days=7)
+    assert client.get(f'/api/lots/{lot_id}/free_spot?{window(soon)}').json['available'] is False
+    assert client.get(f'/api/spots/{spot_id}/availability?{window(soon)}').json['available'] is False
+    assert client.get(f'/api/lots/{lot_id}/free_spot?{window(next_week)}').json['spot_id'] == spot_id
+    assert client.get(f'/api/spots/{spot_id}/availability?{window(next_week)}').json['available'] is True
+
+    schedule(client, lot_id, next_week)
+
+    assert spot_number_of(parking_app, parking_app.AdvanceBooking, planner, 'scheduled') == 1
+    assert client.get(f'/api/lots/{lot_id}/free_spot?{window(next_week)}').json['available'] is False
+    assert client.get(f'/api/spots/{spot_id}/availability?{window(next_week)}').json['available'] is False
+
+def test_check_in_starts_the_booking(parking_app, create_lot, create_user, login, local_now):
+    lot_id = create_lot(spots=2)
+    planner = create_user('planner')
+    client = login('planner')
+    start_time = local_now + timedelta(minutes=30)
+    schedule(client, lot_id, start_time)
+    booking = parking_app.AdvanceBooking.query.filter_by(user_id=planner).one()
+    assert b'Check In' in client.get('/user/dashboard').data
+
+    client.get(f'/user/start_booking/{booking.id}')
+
+    parking_app.db.session.expire_all()
+    assert booking.status == 'checked_in'
+    assert spot_number_of(parking_app, parking_app.Reservation, planner, 'active') == 1
+    assert parking_app.spot_schedule.is_free(booking.spot_id, start_time, start_time + timedelta(hours=2))
+    assert parking_app.occupancy_cache.lot_stats(lot_id)['occupied'] == 1
+
+def test_check_in_moves_to_another_spot_when_booked_spot_is_taken(parking_app, create_lot, create_user, login,
+                                                                  local_now):
+    lot_id = create_lot(spots=2)
+    planner, overstayer = create_user('planner'), create_user('overstayer')
+    client = login('planner')
+    schedule(client, lot_id, local_now + timedelta(minutes=30))
+    booking = parking_app.AdvanceBooking.query.filter_by(user_id=planner).one()
+    # A walk-in who parked before the booking was made is still on the spot
+    parking_app.db.session.add(parking_app.Reservation(spot_id=booking.spot_id, user_id=overstayer,
+                                                       entry_time=local_now, status='active'))
+    parking_app.db.session.get(parking_app.ParkingSpot, booking.spot_id).status = 'O'
+    parking_app.db.session.commit()
+
+    client.get(f'/user/start_booking/{booking.id}')
+
+    assert spot_number_of(parking_app, parking_app.Reservation, planner, 'active') == 2
+
+def test_check_in_is_refused_long_before_start(parking_app, create_lot, create_user, login, local_now):
+    lot_id = create_lot(spots=1)
+    planner = create_user('planner')
+    client = login('planner')
+    schedule(client, lot_id, local_now + timedelta(hours=3))
+    booking = parking_app.AdvanceBooking.query.filter_by(user_id=planner).one()
+    assert b'Check In' not in client.get('/user/dashboard').data
+
+    client.get(f'/user/start_booking/{booking.id}')
+
+    parking_app.db.session.expire_all()
+    assert booking.status == 'scheduled'
+    assert spot_number_of(parking_app, parking_app.Reservation, planner, 'active') is None
@@ -0,0 +1,46 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+
+def test_archive_moves_old_completed_reservations_in_chunks(parking_app, create_lot, create_user):
+    db, Reservation, ReservationArchive = parking_app.db, parking_app.Reservation, parking_app.ReservationArchive
+    lot_id = create_lot(spots=1)
+    user_id = create_user('driver')
+    spot_id = db.session.query(parking_app.ParkingSpot.id).filter_by(lot_id=lot_id).scalar()
+    now = datetime.now()
+
+    def add(exit_days_ago, status='completed'):
+        entry_time = now - timedelta(days=exit_days_ago, hours=2)
+        reservation = Reservation(spot_id=spot_id, user_id=user_id, entry_time=entry_time, status=status,
+                                  exit_time=entry_time + timedelta(hours=2) if status == 'completed' else None,
+                                  total_cost=20.0)
+        db.session.add(reservation)
+        db.session.flush()
+        return reservation.id
+
+    old_ids = [add(days) for days in (400, 300, 200, 190)]
+    kept_ids = [add(170), add(400, status='active'), add(400, status='cancelled')]
+    # The newest reservation is old enough to archive too
+    old_ids.append(add(365))
+    db.session.commit()
+    deletes = []
+    def count_deletes(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith('DELETE FROM reservation'):
+            deletes.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', count_deletes)
+    try:
+        archived_count = parking_app.archive_reservations(180, 2)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', count_deletes)
+
+    assert archived_count == 5
+    assert len(deletes) == 3
+    assert sorted(reservation_id for (reservation_id,) in db.session.query(ReservationArchive.id)) == old_ids
+    assert sorted(reservation_id for (reservation_id,) in db.session.query(Reservation.id)) == kept_ids
+    assert parking_app.user_parking_totals(user_id)['completed_sessions'] == 6
+    assert parking_app.archive_reservations(180, 2) == 0
+
+    new_id = add(0, status='active')
+    db.session.commit()
+    assert new_id > max(old_ids)
@@ -0,0 +1,20 @@
+import pytest
+from sqlalchemy.exc import OperationalError
+
+def test_booking_error_returns_the_spot(parking_app, create_lot, create_user, login, monkeypatch):
+    lot_id = create_lot(spots=1)
+    create_user('driver')
+    client = login('driver')
+    free_spots = parking_app.spot_allocator.free_spot_ids(lot_id)
+
+    def failing_rollup(*args):
+        raise OperationalError('INSERT INTO occupancy_rollup', {}, Exception('database is locked'))
+
+    monkeypatch.setattr(parking_app, 'record_booking_rollup', failing_rollup)
+    with pytest.raises(OperationalError):
+        client.get(f'/user/book_spot/{lot_id}')
+    monkeypatch.undo()
+
+    assert parking_app.spot_allocator.free_spot_ids(lot_id) == free_spots
+    client.get(f'/user/book_spot/{lot_id}')
+    assert parking_app.Reservation.query.filter_by(status='active').count() == 1
@@ -0,0 +1,64 @@
+import csv
+import io
+import json
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+
+def add_stays(parking_app, lot_id, user_id):
+    """Alternate finished stays between the live and the archive table"""
+    spot_id = parking_app.db.session.query(parking_app.ParkingSpot.id).filter_by(lot_id=lot_id).first()[0]
+    for number in range(1, 7):
+        entry_time = datetime(2024, 3, 1, 8) + timedelta(hours=number)
+        model = parking_app.ReservationArchive if number % 2 else parking_app.Reservation
+        parking_app.db.session.add(model(id=number, spot_id=spot_id, user_id=user_id, entry_time=entry_time,
+                                         exit_time=entry_time + timedelta(minutes=30), total_cost=5.0,
+                                         status='completed'))
+    parking_app.db.session.commit()
+
+def test_export_merges_live_and_archived_reservations_in_order(parking_app, create_lot, create_user, admin_client):
+    lot_id = create_lot(spots=1)
+    add_stays(parking_app, lot_id, create_user('driver'))
+
+    response = admin_client.get('/api/export/reservations?format=csv')
+
+    rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+    assert [row['reservation_id'] for row in rows] == ['1', '2', '3', '4', '5', '6']
+    assert rows[0]['username'] == 'driver'
+
+def test_export_filters_by_date_and_lot(parking_app, create_lot, create_user, admin_client):
+    lot_id = create_lot(spots=1)
+    other_lot_id = create_lot('Other Lot', spots=1)
+    add_stays(parking_app, lot_id, create_user('driver'))
+
+    response = admin_client.get(f'/api/export/reservations?format=ndjson&lot_id={lot_id}&start=2024-03-01&end=2024-03-01')
+    empty = admin_client.get(f'/api/export/reservations?format=ndjson&lot_id={other_lot_id}')
+
+    rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [row['reservation_id'] for row in rows] == [1, 2, 3, 4, 5, 6]
+    assert empty.get_data() == b''
+
+def test_export_reprices_finished_stays_in_batches(parking_app, create_lot, create_user, admin_client, monkeypatch):
+    lot_id = create_lot(spots=2, first_hour_rate=20.0)
+    user_id = create_user('driver')
+    add_stays(parking_app, lot_id, user_id)
+    spot_id = parking_app.db.session.query(parking_app.ParkingSpot.id).filter_by(lot_id=lot_id, spot_number=2).scalar()
+    parking_app.db.session.add(parking_app.Reservation(id=7, spot_id=spot_id, user_id=user_id,
+                                                       entry_time=datetime(2024, 3, 2, 8), status='active'))
+    parking_app.db.session.commit()
+    monkeypatch.setattr(parking_app, 'EXPORT_BATCH_SIZE', 4)
+    tariff_queries = []
+    def count_tariff_queries(conn, cursor, statement, parameters, context, executemany):
+        if 'hourly_rate' in statement:
+            tariff_queries.append(statement)
+
+    event.listen(parking_app.db.engine, 'before_cursor_execute', count_tariff_queries)
+    try:
+        response = admin_client.get('/api/export/reservations?format=ndjson')
+        rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    finally:
+        event.remove(parking_app.db.engine, 'before_cursor_execute', count_tariff_queries)
+
+    assert [row['tariff_cost'] for row in rows] == [10.0] * 6 + [None]
+    assert [row['total_cost'] for row in rows] == [5.0] * 6 + [0]
+    assert len(tariff_queries) == 1
@@ -0,0 +1,54 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+@pytest.fixture
+def history(parking_app, create_lot, create_user):
+    """25 completed stays of one driver split between the live and archive tables, some ending at the same time"""
+    lot_id = create_lot(spots=1)
+    driver_id, other_id = create_user('driver'), create_user('other')
+    spot_id = parking_app.db.session.query(parking_app.ParkingSpot.id).filter_by(lot_id=lot_id).scalar()
+    stays = []
+    for number in range(1, 26):
+        exit_time = datetime(2024, 3, 1) + timedelta(hours=number // 3)
+        model = parking_app.ReservationArchive if number % 2 else parking_app.Reservation
+        parking_app.db.session.add(model(id=number, spot_id=spot_id, user_id=driver_id,
+                                         entry_time=exit_time - timedelta(minutes=30), exit_time=exit_time,
+                                         total_cost=5.0, status='completed'))
+        stays.append((exit_time, number))
+    parking_app.db.session.add_all([
+        parking_app.Reservation(id=26, spot_id=spot_id, user_id=driver_id, entry_time=datetime(2024, 3, 2),
+                                status='active'),
+        parking_app.Reservation(id=27, spot_id=spot_id, user_id=driver_id, entry_time=datetime(2024, 3, 2),
+                                exit_time=datetime(2024, 3, 2, 1), total_cost=10.0, status='cancelled'),
+        parking_app.ReservationArchive(id=28, spot_id=spot_id, user_id=other_id, entry_time=datetime(2024, 3, 2),
+                                       exit_time=datetime(2024, 3, 2, 1), total_cost=10.0, status='completed'),
+    ])
+    parking_app.db.session.commit()
+    return driver_id, [number for _, number in sorted(stays, reverse=True)]
+
+def test_pages_through_live_and_archived_stays_without_gaps(history, login):
+    _, expected_ids = history
+    client = login('driver')
+    seen_ids, cursor, pages = [], None, 0
+    while True:
+        page = client.get('/api/user/reservations', query_string={'limit': 4, 'cursor': cursor or ''}).json
+        seen_ids.extend(reservation['id'] for reservation in page['reservations'])
+        pages += 1
+        cursor = page['next_cursor']
+        if not cursor:
+            break
+
+    assert seen_ids == expected_ids
+    assert pages == 7
+
+@pytest.mark.parametrize('cursor', ['bad', '2024-03-01T00:00:00_x', 'x_1'])
+def test_invalid_cursor_is_rejected(history, login, cursor):
+    response = login('driver').get('/api/user/reservations', query_string={'cursor': cursor})
+    assert response.status_code == 400
+
+def test_lifetime_totals_include_archived_stays(parking_app, history):
+    driver_id, _ = history
+    assert parking_app.user_parking_totals(driver_id) == {
+        'completed_sessions': 25, 'total_hours': pytest.approx(12.5), 'total_cost': pytest.approx(125.0)
+    }
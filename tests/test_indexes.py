@@ -0,0 +1,88 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy import inspect
+
+def query_plan(parking_app, query):
+    """Return the EXPLAIN QUERY PLAN details of an ORM query or select as one string"""
+    engine = parking_app.db.engine
+    if engine.dialect.name != 'sqlite':
+        pytest.skip('query plans are checked on SQLite only')
+    compiled = getattr(query, 'statement', query).compile(dialect=engine.dialect)
+    parameters = compiled.construct_params()
+    with engine.connect() as connection:
+        rows = connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + str(compiled),
+                                          tuple(parameters[name] for name in compiled.positiontup)).all()
+    return '\n'.join(row[-1] for row in rows)
+
+def assert_no_table_scan(plan):
+    """Every table in the plan must be reached through an index or its primary key"""
+    for step in plan.splitlines():
+        if step.startswith(('SCAN', 'SEARCH')) and 'INDEX' not in step and 'PRIMARY KEY' not in step:
+            raise AssertionError(f'unindexed step: {step}')
+
+def test_active_reservation_of_user_uses_index(parking_app):
+    Reservation = parking_app.Reservation
+    plan = query_plan(parking_app, Reservation.query.filter_by(user_id=1, status='active'))
+    assert 'USING INDEX ix_reservation_user_' in plan
+    assert '(user_id=? AND status=?)' in plan
+
+def test_active_reservations_of_lot_use_spot_indexes(parking_app):
+    Reservation, ParkingSpot = parking_app.Reservation, parking_app.ParkingSpot
+    query = Reservation.query.join(ParkingSpot, Reservation.spot_id == ParkingSpot.id) \
+        .filter(ParkingSpot.lot_id == 1, Reservation.status == 'active')
+    assert_no_table_scan(query_plan(parking_app, query))
+
+def test_free_spots_of_lot_use_index(parking_app):
+    ParkingSpot = parking_app.ParkingSpot
+    query = parking_app.db.session.query(ParkingSpot.id).filter_by(lot_id=1, status='A') \
+        .order_by(ParkingSpot.spot_number.desc())
+    plan = query_plan(parking_app, query)
+    assert 'ix_parking_spot_lot_' in plan
+    assert_no_table_scan(plan)
+
+def test_spots_of_lot_in_order_skip_sort(parking_app):
+    ParkingSpot = parking_app.ParkingSpot
+    plan = query_plan(parking_app, ParkingSpot.query.filter_by(lot_id=1).order_by(ParkingSpot.spot_number))
+    assert 'ix_parking_spot_lot_number' in plan
+    assert 'TEMP B-TREE' not in plan
+    assert_no_table_scan(plan)
+
+@pytest.mark.parametrize('model_name', ['Reservation', 'ReservationArchive'])
+def test_history_page_skips_sort(parking_app, model_name):
+    model = getattr(parking_app, model_name)
+    query = model.query.filter(model.user_id == 1, model.status == 'completed',
+                               model.exit_time < datetime(2024, 1, 1)) \
+        .order_by(model.exit_time.desc(), model.id.desc()).limit(11)
+    plan = query_plan(parking_app, query)
+    assert 'history' in plan
+    assert 'TEMP B-TREE' not in plan
+
+def test_archive_candidates_use_index(parking_app):
+    Reservation = parking_app.Reservation
+    query = parking_app.db.session.query(Reservation.id) \
+        .filter(Reservation.status == 'completed', Reservation.exit_time < datetime(2024, 1, 1))
+    assert 'ix_reservation_status_exit' in query_plan(parking_app, query)
+
+def test_spot_with_active_reservation_uses_index(parking_app):
+    Reservation = parking_app.Reservation
+    plan = query_plan(parking_app, Reservation.query.filter_by(spot_id=1, status='active'))
+    assert 'ix_reservation_spot_status (spot_id=? AND status=?)' in plan
+
+@pytest.mark.parametrize('date_range', [(None, None), (datetime(2024, 1, 1), datetime(2024, 1, 31))])
+def test_export_streams_in_index_order(parking_app, date_range):
+    for table_query in parking_app.reservation_export_queries(*date_range):
+        plan = query_plan(parking_app, table_query)
+        assert '_entry' in plan
+        assert 'TEMP B-TREE' not in plan
+        assert_no_table_scan(plan)
+
+def test_upgrade_drops_unused_partial_index(parking_app):
+    db = parking_app.db
+    with db.engine.begin() as connection:
+        connection.exec_driver_sql(
+            "CREATE INDEX IF NOT EXISTS ix_reservation_active_spot ON reservation (spot_id) WHERE status = 'active'")
+    parking_app.upgrade_database()
+    index_names = {index['name'] for index in inspect(db.engine).get_indexes('reservation')}
+    assert 'ix_reservation_active_spot' not in index_names
+    assert 'ix_reservation_spot_status' in index_names
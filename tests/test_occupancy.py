@@ -0,0 +1,85 @@
+def test_changes_since_a_version(parking_app):
+    cache = parking_app.OccupancyCache()
+    cache.load()
+    cache.set_lot(1, 10)
+    cache.set_lot(2, 5)
+    version, _ = cache.snapshot()
+    cache.adjust(1, 1)
+    cache.adjust(1, 1)
+    cache.remove_lot(2)
+
+    new_version, changed_lots = cache.wait_for_changes(version, 0)
+
+    assert new_version == version + 3
+    assert changed_lots == {1: {'total': 10, 'occupied': 2, 'available': 8}, 2: None}
+    assert cache.wait_for_changes(new_version, 0) == (new_version, {})
+
+def test_streams_at_the_same_version_share_one_result(parking_app):
+    cache = parking_app.OccupancyCache()
+    cache.load()
+    cache.set_lot(1, 10)
+    version, _ = cache.snapshot()
+    cache.adjust(1, 1)
+    assert cache.wait_for_changes(version, 0)[1] is cache.wait_for_changes(version, 0)[1]
+
+def test_stream_behind_the_change_log_still_gets_every_lot(parking_app):
+    cache = parking_app.OccupancyCache()
+    cache.load()
+    cache.CHANGE_LOG_LIMIT = 4
+    for lot_id in range(1, 4):
+        cache.set_lot(lot_id, 10)
+    for _ in range(10):
+        cache.adjust(3, 1)
+        cache.adjust(3, -1)
+
+    _, changed_lots = cache.wait_for_changes(0, 0)
+
+    assert set(changed_lots) == {1, 2, 3}
+
+def test_reconcile_publishes_changes_made_by_other_processes(parking_app, create_lot):
+    lot_id = create_lot(spots=2)
+    deleted_lot_id = create_lot('Deleted Lot', spots=1)
+    unchanged_lot_id = create_lot('Unchanged Lot', spots=1)
+    cache = parking_app.OccupancyCache()
+    cache.load()
+    version, _ = cache.snapshot()
+    # Another process books a spot and deletes a lot without touching this cache
+    db, ParkingSpot = parking_app.db, parking_app.ParkingSpot
+    spot = db.session.query(ParkingSpot).filter_by(lot_id=lot_id, spot_number=1).one()
+    spot.status = 'O'
+    db.session.query(ParkingSpot).filter_by(lot_id=deleted_lot_id).delete()
+    db.session.query(parking_app.ParkingLot).filter_by(id=deleted_lot_id).delete()
+    db.session.commit()
+
+    assert cache.reconcile() == 2
+
+    _, changed_lots = cache.wait_for_changes(version, 0)
+    assert changed_lots == {lot_id: {'total': 2, 'occupied': 1, 'available': 1}, deleted_lot_id: None}
+    assert cache.lot_stats(unchanged_lot_id) == {'total': 1, 'occupied': 0, 'available': 1}
+    assert cache.reconcile() == 0
+
+def test_reconcile_keeps_changes_made_while_it_reads(parking_app, create_lot, monkeypatch):
+    lot_id = create_lot(spots=2)
+    resized_lot_id = create_lot('Resized Lot', spots=1)
+    cache = parking_app.OccupancyCache()
+    cache.load()
+    db, ParkingSpot = parking_app.db, parking_app.ParkingSpot
+    count_spots = cache._count_spots
+
+    def count_spots_then_book(connection):
+        counts = count_spots(connection)
+        # A booking commits and adjusts the counters after the database was read
+        db.session.query(ParkingSpot).filter_by(lot_id=lot_id, spot_number=1).one().status = 'O'
+        db.session.commit()
+        cache.adjust(lot_id, 1)
+        cache.set_lot(resized_lot_id, 3)
+        return counts
+
+    monkeypatch.setattr(cache, '_count_spots', count_spots_then_book)
+    cache.reconcile()
+
+    assert cache.lot_stats(lot_id) == {'total': 2, 'occupied': 1, 'available': 1}
+    assert cache.lot_stats(resized_lot_id) == {'total': 3, 'occupied': 0, 'available': 3}
+    monkeypatch.setattr(cache, '_count_spots', count_spots)
+    cache.reconcile()
+    assert cache.lot_stats(lot_id) == {'total': 2, 'occupied': 1, 'available': 1}
@@ -0,0 +1,59 @@
+def signed_in(client, **accounts):
+    """Put the given account ids and names into the client's session, with no pending flash messages"""
+    with client.session_transaction() as session:
+        session.update(accounts)
+        session.pop('_flashes', None)
+    return client
+
+def test_booking_and_lot_edit_invalidate_cached_pages(parking_app, create_lot, create_user, login, admin_client):
+    lot_id = create_lot('Hillside', spots=2)
+    edited_lot_id = create_lot('Riverside', spots=2)
+    create_user('driver')
+    driver = login('driver')
+    signed_in(driver)
+    signed_in(admin_client)
+    driver.get('/user/book_parking')
+    admin_client.get('/admin/parking_lots')
+
+    driver.get(f'/user/book_spot/{lot_id}')
+    signed_in(driver)
+    admin_client.post(f'/admin/edit_parking_lot/{edited_lot_id}', data={
+        'location_name': 'Lakeside', 'hourly_rate': '10', 'address': 'Lake Road, Pune', 'pin_code': '411001',
+        'total_spots': '2'
+    })
+    signed_in(admin_client)
+
+    assert f'data-available-lot="{lot_id}">1<'.encode() in driver.get('/user/book_parking').data
+    lots_page = admin_client.get('/admin/parking_lots').data
+    assert b'Lakeside' in lots_page and b'Riverside' not in lots_page
+    assert parking_app.page_cache.stats()['book_parking'] == {'hits': 0, 'misses': 2}
+
+def test_pages_with_pending_flash_messages_are_not_cached(parking_app, create_lot, admin_client):
+    create_lot()
+    signed_in(admin_client)
+    with admin_client.session_transaction() as session:
+        session['_flashes'] = [('success', 'Lot saved')]
+
+    assert b'Lot saved' in admin_client.get('/admin/parking_lots').data
+    assert b'Lot saved' not in admin_client.get('/admin/parking_lots').data
+    assert b'Lot saved' not in admin_client.get('/admin/parking_lots').data
+    assert parking_app.page_cache.stats()['manage_parking'] == {'hits': 1, 'misses': 1}
+
+def test_cached_pages_are_never_served_to_another_viewer(parking_app, create_lot, create_user):
+    create_lot()
+    first_id, second_id = create_user('first'), create_user('second')
+    first = signed_in(parking_app.app.test_client(), user_id=first_id, username='first')
+    second = signed_in(parking_app.app.test_client(), user_id=second_id, username='second')
+    both = signed_in(parking_app.app.test_client(), admin_id=1, admin_username='admin', user_id=first_id,
+                     username='first')
+    admin_only = signed_in(parking_app.app.test_client(), admin_id=1, admin_username='admin')
+    anonymous = parking_app.app.test_client()
+
+    assert b'first' in first.get('/user/book_parking').data
+    second_page = second.get('/user/book_parking')
+    assert b'second' in second_page.data and b'first' not in second_page.data
+    assert both.get('/user/book_parking').status_code == 200
+    assert admin_only.get('/user/book_parking').status_code == 302
+    assert anonymous.get('/user/book_parking').status_code == 302
+    assert admin_only.get('/admin/dashboard').status_code == 200
+    assert signed_in(parking_app.app.test_client(), user_id=first_id).get('/admin/dashboard').status_code == 302
@@ -0,0 +1,141 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+def edit_form(spots):
+    return {'location_name': 'Test Lot', 'hourly_rate': '10', 'address': 'Test Lot Road, Pune',
+            'pin_code': '411001', 'total_spots': str(spots)}
+
+def spot_numbers(parking_app, lot_id):
+    ParkingSpot = parking_app.ParkingSpot
+    return [number for (number,) in parking_app.db.session.query(ParkingSpot.spot_number)
+            .filter_by(lot_id=lot_id).order_by(ParkingSpot.spot_number)]
+
+def spot_ids(parking_app, lot_id):
+    ParkingSpot = parking_app.ParkingSpot
+    return [spot_id for (spot_id,) in parking_app.db.session.query(ParkingSpot.id)
+            .filter_by(lot_id=lot_id).order_by(ParkingSpot.spot_number)]
+
+def spot_statuses(parking_app, lot_id):
+    ParkingSpot = parking_app.ParkingSpot
+    return [tuple(row) for row in parking_app.db.session.query(ParkingSpot.spot_number, ParkingSpot.status)
+            .filter_by(lot_id=lot_id).order_by(ParkingSpot.spot_number)]
+
+def schedule_booking(parking_app, spot_id, user_id):
+    start_time = datetime.now() + timedelta(days=1)
+    parking_app.db.session.add(parking_app.AdvanceBooking(
+        spot_id=spot_id, user_id=user_id, start_time=start_time, end_time=start_time + timedelta(hours=2)))
+    parking_app.db.session.commit()
+
+def archive_stay(parking_app, spot_id, user_id):
+    """Record a finished stay on the spot that has already been moved to the archive"""
+    exit_time = datetime(2024, 1, 1, 12)
+    parking_app.db.session.add(parking_app.ReservationArchive(
+        id=1, spot_id=spot_id, user_id=user_id, entry_time=exit_time - timedelta(hours=2),
+        exit_time=exit_time, total_cost=20.0, status='completed'))
+    parking_app.db.session.commit()
+
+def test_shrinking_removes_unused_spots(parking_app, create_lot, admin_client):
+    lot_id = create_lot(spots=5)
+    response = admin_client.post(f'/admin/edit_parking_lot/{lot_id}', data=edit_form(3))
+    assert response.status_code == 302
+    assert spot_numbers(parking_app, lot_id) == [1, 2, 3]
+
+def test_shrinking_retires_spots_with_history(parking_app, create_lot, create_user, admin_client):
+    lot_id = create_lot(spots=5)
+    archive_stay(parking_app, spot_ids(parking_app, lot_id)[4], create_user('driver'))
+
+    admin_client.post(f'/admin/edit_parking_lot/{lot_id}', data=edit_form(3))
+
+    parking_app.db.session.expire_all()
+    assert spot_statuses(parking_app, lot_id) == [(1, 'A'), (2, 'A'), (3, 'A'), (5, 'R')]
+    assert parking_app.db.session.get(parking_app.ParkingLot, lot_id).total_spots == 3
+    assert parking_app.spot_allocator.free_spot_ids(lot_id) == spot_ids(parking_app, lot_id)[:3]
+    assert parking_app.occupancy_cache.lot_stats(lot_id)['total'] == 3
+    parking_app.occupancy_cache.reconcile()
+    assert parking_app.occupancy_cache.lot_stats(lot_id)['total'] == 3
+
+def test_growing_brings_retired_spots_back_first(parking_app, create_lot, create_user, admin_client):
+    lot_id = create_lot(spots=5)
+    retired_spot_id = spot_ids(parking_app, lot_id)[4]
+    archive_stay(parking_app, retired_spot_id, create_user('driver'))
+    admin_client.post(f'/admin/edit_parking_lot/{lot_id}', data=edit_form(3))
+
+    admin_client.post(f'/admin/edit_parking_lot/{lot_id}', data=edit_form(5))
+
+    parking_app.db.session.expire_all()
+    assert spot_statuses(parking_app, lot_id) == [(1, 'A'), (2, 'A'), (3, 'A'), (5, 'A'), (6, 'A')]
+    assert retired_spot_id in parking_app.spot_allocator.free_spot_ids(lot_id)
+    assert parking_app.occupancy_cache.lot_stats(lot_id)['total'] == 5
+
+def test_shrinking_is_refused_when_removed_spots_have_upcoming_bookings(parking_app, create_lot, create_user, admin_client):
+    lot_id = create_lot(spots=5)
+    schedule_booking(parking_app, spot_ids(parking_app, lot_id)[4], create_user('driver'))
+
+    admin_client.post(f'/admin/edit_parking_lot/{lot_id}', data=edit_form(3))
+
+    parking_app.db.session.expire_all()
+    assert spot_statuses(parking_app, lot_id) == [(number, 'A') for number in range(1, 6)]
+    assert parking_app.db.session.get(parking_app.ParkingLot, lot_id).total_spots == 5
+
+def test_spot_ids_are_not_reused(parking_app, create_lot, admin_client):
+    lot_id = create_lot(spots=3)
+    removed_spot_id = max(spot_ids(parking_app, lot_id))
+    admin_client.post(f'/admin/edit_parking_lot/{lot_id}', data=edit_form(2))
+    admin_client.post(f'/admin/edit_parking_lot/{lot_id}', data=edit_form(3))
+    assert max(spot_ids(parking_app, lot_id)) > removed_spot_id
+
+def test_upgrade_rebuilds_spot_table_with_autoincrement(parking_app, create_lot):
+    lot_id = create_lot(spots=3)
+    original_spot_ids = spot_ids(parking_app, lot_id)
+    with parking_app.db.engine.begin() as connection:
+        connection.exec_driver_sql('ALTER TABLE parking_spot RENAME TO parking_spot_old')
+        connection.exec_driver_sql('CREATE TABLE parking_spot (id INTEGER NOT NULL PRIMARY KEY, lot_id INTEGER NOT NULL, '
+                                   'spot_number INTEGER NOT NULL, status VARCHAR(1), created_at DATETIME)')
+        connection.exec_driver_sql('INSERT INTO parking_spot SELECT * FROM parking_spot_old')
+        connection.exec_driver_sql('DROP TABLE parking_spot_old')
+
+    parking_app.upgrade_database()
+
+    with parking_app.db.engine.connect() as connection:
+        table_sql = connection.execute(text("SELECT sql FROM sqlite_master WHERE name = 'parking_spot'")).scalar()
+        index_names = {name for (name,) in connection.execute(
+            text("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'parking_spot'"))}
+    assert 'AUTOINCREMENT' in table_sql
+    assert {'ix_parking_spot_lot_status', 'ix_parking_spot_lot_number'} <= index_names
+    assert spot_ids(parking_app, lot_id) == original_spot_ids
+
+def test_deleting_unused_lot(parking_app, create_lot, admin_client):
+    lot_id = create_lot(spots=2)
+    admin_client.get(f'/admin/delete_parking_lot/{lot_id}')
+    assert parking_app.db.session.get(parking_app.ParkingLot, lot_id) is None
+    assert spot_numbers(parking_app, lot_id) == []
+
+def test_deleting_lot_with_archived_reservations_retires_it(parking_app, create_lot, create_user, login, admin_client):
+    lot_id = create_lot('Old Lot', spots=2)
+    user_id = create_user('driver')
+    archive_stay(parking_app, spot_ids(parking_app, lot_id)[0], user_id)
+
+    admin_client.get(f'/admin/delete_parking_lot/{lot_id}')
+
+    parking_app.db.session.expire_all()
+    parking_lot = parking_app.db.session.get(parking_app.ParkingLot, lot_id)
+    assert parking_lot.retired_at is not None and parking_lot.total_spots == 0
+    assert spot_statuses(parking_app, lot_id) == [(1, 'R')]
+    assert b'Old Lot' not in admin_client.get('/admin/parking_lots').data
+    assert admin_client.get(f'/admin/edit_parking_lot/{lot_id}').status_code == 404
+    parking_app.occupancy_cache.reconcile()
+    assert parking_app.occupancy_cache.totals()['total'] == 0
+
+    history = login('driver').get('/api/user/reservations')
+    assert history.status_code == 200
+    assert b'Old Lot' in history.data
+
+def test_deleting_lot_with_advance_booking_is_refused(parking_app, create_lot, create_user, admin_client):
+    lot_id = create_lot(spots=2)
+    schedule_booking(parking_app, spot_ids(parking_app, lot_id)[0], create_user('driver'))
+
+    admin_client.get(f'/admin/delete_parking_lot/{lot_id}')
+
+    parking_app.db.session.expire_all()
+    assert parking_app.db.session.get(parking_app.ParkingLot, lot_id) is not None
@@ -0,0 +1,54 @@
+from datetime import datetime, timedelta
+
+def hourly_peaks(admin_client, lot_id, **arguments):
+    response = admin_client.get('/api/analytics', query_string=dict(granularity='hour', lot_id=lot_id, **arguments))
+    return {datetime.fromisoformat(bucket['bucket_start']): bucket['peak_occupancy']
+            for bucket in response.json['buckets']}
+
+def all_buckets(parking_app):
+    return sorted((rollup.lot_id, rollup.granularity, rollup.bucket_start, rollup.peak_occupancy, rollup.bookings,
+                   rollup.completed_stays, rollup.total_stay_seconds, rollup.revenue, rollup.closing_occupancy)
+                  for rollup in parking_app.OccupancyRollup.query)
+
+def park(parking_app, lot_id, user_id, entry_time, exit_time):
+    spot_id = parking_app.db.session.query(parking_app.ParkingSpot.id).filter_by(lot_id=lot_id).first()[0]
+    parking_app.db.session.add(parking_app.Reservation(spot_id=spot_id, user_id=user_id, entry_time=entry_time,
+                                                       exit_time=exit_time, total_cost=30.0, status='completed'))
+    parking_app.db.session.commit()
+
+def test_backfill_carries_occupancy_through_quiet_hours(parking_app, create_lot, create_user, admin_client):
+    lot_id = create_lot(spots=2)
+    park(parking_app, lot_id, create_user('driver'), datetime(2024, 5, 1, 10, 15), datetime(2024, 5, 1, 13, 5))
+
+    parking_app.backfill_rollups()
+
+    assert hourly_peaks(admin_client, lot_id) == {datetime(2024, 5, 1, hour): 1 for hour in (10, 11, 12, 13)}
+
+def test_incremental_rollups_only_write_the_buckets_of_events(parking_app, create_lot, create_user, admin_client):
+    lot_id = create_lot(spots=2)
+    entry_time, exit_time = datetime(2024, 5, 1, 10, 15), datetime(2024, 5, 2, 1, 5)
+    parking_app.record_booking_rollup(lot_id, entry_time, 1)
+    parking_app.record_release_rollup(lot_id, exit_time, (exit_time - entry_time).total_seconds(), 30.0, 1)
+    parking_app.db.session.commit()
+    incremental = all_buckets(parking_app)
+
+    park(parking_app, lot_id, create_user('driver'), entry_time, exit_time)
+    parking_app.backfill_rollups()
+
+    assert [(bucket[1], bucket[2].day, bucket[8]) for bucket in incremental] == \
+        [('day', 1, 1), ('day', 2, 0), ('hour', 1, 1), ('hour', 2, 0)]
+    assert incremental == all_buckets(parking_app)
+    assert set(hourly_peaks(admin_client, lot_id).values()) == {1}
+    assert len(hourly_peaks(admin_client, lot_id)) == 16
+
+def test_parked_car_is_carried_into_the_range_and_up_to_now(parking_app, create_lot, admin_client):
+    lot_id = create_lot(spots=2)
+    now = parking_app.to_local_naive(datetime.now(parking_app.indian_timezone))
+    parking_app.record_booking_rollup(lot_id, now - timedelta(hours=5), 1)
+    parking_app.db.session.commit()
+    start_time = now - timedelta(hours=2)
+
+    peaks = hourly_peaks(admin_client, lot_id, start=start_time.isoformat())
+
+    first_hour = start_time.replace(minute=0, second=0, microsecond=0)
+    assert peaks == {first_hour + timedelta(hours=hours): 1 for hours in range(3)}
@@ -0,0 +1,21 @@
+import pytest
+
+@pytest.fixture
+def lots(parking_app, create_lot):
+    parking_app.db.session.get(parking_app.ParkingLot, create_lot('Baner Market')).pin_code = '411045'
+    create_lot('Station Road')
+    parking_app.db.session.commit()
+    return parking_app
+
+def names(lots):
+    return [lot.location_name for lot in lots]
+
+def test_pin_code_prefix_and_word_prefix_matches(lots):
+    assert names(lots.search_parking_lots('41104')) == ['Baner Market']
+    assert names(lots.search_parking_lots('stat')) == ['Station Road']
+
+@pytest.mark.parametrize('query', ['\U0010ffff', 'Baner\U0010ffff', '"*', '411 '])
+def test_unusual_queries_do_not_fail(lots, create_user, login, query):
+    create_user('driver')
+    response = login('driver').get('/user/book_parking', query_string={'q': query})
+    assert response.status_code == 200
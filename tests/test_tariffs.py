@@ -0,0 +1,50 @@
+from datetime import datetime, timedelta
+
+import pytest
+import pytz
+
+def hours(start, end):
+    return datetime(2025, 1, 1, *start), datetime(2025, 1, 1, *end)
+
+def test_flat_rate_is_charged_per_second(parking_app):
+    assert parking_app.Tariff(10).price(*hours((10,), (12, 30))) == pytest.approx(25)
+
+def test_first_hour_rate(parking_app):
+    assert parking_app.Tariff(10, first_hour_rate=30).price(*hours((10,), (12, 30))) == pytest.approx(45)
+
+def test_night_window_crossing_midnight(parking_app):
+    tariff = parking_app.Tariff(10, night_rate=5)
+    entry_time = datetime(2025, 1, 1, 21)
+
+    # 21-22 by day, 22-06 at night, 06-07 by day
+    assert tariff.price(entry_time, entry_time + timedelta(hours=10)) == pytest.approx(10 + 8 * 5 + 10)
+    assert tariff.price(datetime(2025, 1, 2, 5), datetime(2025, 1, 2, 7)) == pytest.approx(5 + 10)
+
+def test_custom_night_window_from_midnight(parking_app):
+    tariff = parking_app.Tariff(10, night_rate=4, night_start_hour=0, night_end_hour=6)
+
+    assert tariff.price(datetime(2025, 1, 1, 23), datetime(2025, 1, 2, 7)) == pytest.approx(10 + 6 * 4 + 10)
+    assert tariff.price(datetime(2025, 1, 2, 22), datetime(2025, 1, 2, 23, 30)) == pytest.approx(15)
+
+def test_daily_cap_applies_to_each_day_of_a_long_stay(parking_app):
+    tariff = parking_app.Tariff(10, daily_cap=100)
+
+    assert tariff.price(datetime(2025, 1, 1), datetime(2025, 1, 3, 1)) == pytest.approx(100 + 100 + 10)
+    assert tariff.price(datetime(2025, 1, 1), datetime(2025, 1, 1, 5)) == pytest.approx(50)
+
+def test_grace_period_boundary(parking_app):
+    tariff = parking_app.Tariff(10, grace_minutes=15)
+    entry_time = datetime(2025, 1, 1, 10)
+
+    assert tariff.price(entry_time, entry_time + timedelta(minutes=15)) == 0
+    assert tariff.price(entry_time, entry_time + timedelta(minutes=15, seconds=1)) == pytest.approx(901 / 360)
+
+def test_price_stays_treats_aware_and_naive_local_times_alike(parking_app, create_lot):
+    lot_id = create_lot(night_rate=5.0)
+    local = parking_app.indian_timezone
+    # 21:30 to 23:00 in Indian time: half an hour by day, an hour at night
+    aware_stay = (pytz.utc.localize(datetime(2025, 1, 1, 16)), pytz.utc.localize(datetime(2025, 1, 1, 17, 30)), lot_id)
+    local_stay = (local.localize(datetime(2025, 1, 1, 21, 30)), local.localize(datetime(2025, 1, 1, 23)), lot_id)
+    naive_stay = (datetime(2025, 1, 1, 21, 30), datetime(2025, 1, 1, 23), lot_id)
+
+    assert parking_app.price_stays([aware_stay, local_stay, naive_stay]) == pytest.approx([10, 10, 10])
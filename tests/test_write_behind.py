@@ -0,0 +1,38 @@
+import time
+
+from sqlalchemy.exc import OperationalError
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+def test_failed_batch_is_retried(parking_app, create_lot, create_user, tmp_path, monkeypatch):
+    lot_id = create_lot(spots=2)
+    user_id = create_user('driver')
+    writer = parking_app.WriteBehindQueue(str(tmp_path / 'write_behind.log'), batch_size=10)
+    writer.RETRY_DELAY_SECONDS = 0.01
+    failures = []
+    record_booking_rollup = parking_app.record_booking_rollup
+
+    def flaky_rollup(*args):
+        if len(failures) < 2:
+            failures.append(args)
+            raise OperationalError('INSERT INTO occupancy_rollup', {}, Exception('database is locked'))
+        return record_booking_rollup(*args)
+
+    monkeypatch.setattr(parking_app, 'record_booking_rollup', flaky_rollup)
+    reservation_id = writer.book(user_id, lot_id)
+
+    def reservation_written():
+        parking_app.db.session.rollback()
+        return parking_app.db.session.get(parking_app.Reservation, reservation_id) is not None
+
+    assert wait_for(reservation_written)
+    assert len(failures) == 2
+    reservation = parking_app.db.session.get(parking_app.Reservation, reservation_id)
+    assert parking_app.db.session.get(parking_app.ParkingSpot, reservation.spot_id).status == 'O'
+    assert wait_for(lambda: (tmp_path / 'write_behind.log').stat().st_size == 0)